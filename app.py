@@ -1,10 +1,53 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, Response, stream_with_context, render_template, request, jsonify, redirect, url_for, flash, session
+import click
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import psycopg2
 import psycopg2.extras
 import os
+import hashlib
+import time
 from dotenv import load_dotenv
 from datetime import datetime, date
+from decimal import Decimal
+
+from db import obtener_conexion, conexion, liberar_conexiones_pendientes, estadisticas_pool
+from metricas import (
+    duracion_requests, requests_en_curso, duracion_excel, muestrear, autorizado, exportar
+)
+from consultas_lentas import resumir_consultas_lentas
+from instrumentacion import (
+    iniciar_medicion, medicion_actual, terminar_medicion, server_timing,
+    registrar_request, verificar_presupuesto, presupuesto_consultas
+)
+from migraciones import aplicar_migraciones
+from particiones_auditoria import crear_particiones_futuras, archivar_particiones
+from equipos_grid import (
+    consultar_pagina_equipos, consultar_valores_columna, consultar_archivos_equipos, agrupar_adjuntos
+)
+from informes import (
+    construir_filtro_informe, construir_filtro_resumen, consultar_informe_mensual,
+    generar_excel_en_archivo, generar_csv_streaming, iterar_en_lotes, EXCEL_LOTE
+)
+from resumen_mensual import (
+    meses_equipos, meses_solicitud, meses_de_fechas, refrescar_resumen, reconstruir_resumen
+)
+from auditoria import RegistroCambios, cola_auditoria
+from priorizados import (
+    osts_solicitud, refrescar_priorizados, reconstruir_priorizados,
+    actualizar_si_vencido, consultar_priorizados
+)
+from busqueda import buscar
+from asignacion_ost import (
+    consultar_proximo_ost, reservar_ost, confirmar_reserva, liberar_reserva, SECUENCIA_OST
+)
+from solicitudes_listado import consultar_pagina_solicitudes, obtener_solicitud
+from historial_auditoria import consultar_pagina_auditoria, ACCIONES
+from equipos_edicion import calcular_cambios, actualizar_equipos_lote
+from equipos_alta import crear_equipos_lote, leer_filas_archivo, validar_prioridad, PRIORIDADES
+from dashboard import (
+    obtener_metricas_dashboard, invalidar_metricas_dashboard,
+    cache_metricas, CLAVE_METRICAS
+)
 
 # Importar el sistema de autenticación
 
@@ -12,7 +55,8 @@ from auth import (
     login_manager, User, authenticate_user, create_user, 
     permission_required, role_required, get_all_users,
     toggle_user_status, update_user_role, update_user_password,
-    update_last_login, update_own_password, get_user_profile  # 👈 Nuevos
+    update_last_login, update_own_password, get_user_profile,  # 👈 Nuevos
+    cache_usuarios
 )
 load_dotenv()
 
@@ -25,30 +69,77 @@ login_manager.login_view = 'login'
 login_manager.login_message = '⚠️ Por favor inicia sesión para acceder'
 login_manager.login_message_category = 'error'
 
-DATABASE_URL = os.getenv('DATABASE_URL')
-
 def get_db_connection():
-    """Conexión a la base de datos"""
+    """Conexión a la base de datos (tomada del pool compartido)"""
     try:
-        db_url_clean = DATABASE_URL.replace('&channel_binding=require', '')
-        conn = psycopg2.connect(db_url_clean, cursor_factory=psycopg2.extras.RealDictCursor)
-        return conn
+        return obtener_conexion()
     except Exception as e:
         print(f"Error de conexión: {e}")
         return None
 
+@app.before_request
+def iniciar_medicion_sql():
+    """Empieza a contar consultas, tiempo de base, filas y conexiones del request (y lo marca en curso)"""
+    medicion = iniciar_medicion(request.endpoint or 'desconocido')
+    requests_en_curso.labels(medicion.endpoint).inc()
+
+@app.after_request
+def reportar_medicion_sql(response):
+    """Server-Timing, latencia en /metrics y log JSON del request; en modo estricto verifica el presupuesto"""
+    medicion = medicion_actual()
+    if medicion is None:
+        return response
+    response.headers['Server-Timing'] = server_timing(medicion)
+    duracion_requests.labels(
+        medicion.endpoint, request.method, response.status_code
+    ).observe(time.perf_counter() - medicion.inicio)
+    muestrear(estadisticas_pool, (cache_metricas, cache_usuarios), cola_auditoria)
+    registrar_request(
+        medicion, request.endpoint, request.method, request.path, response.status_code,
+        current_user.get_id() if current_user.is_authenticated else None
+    )
+    verificar_presupuesto(
+        medicion, app.view_functions.get(request.endpoint), request.endpoint,
+        estricto=app.config.get('TESTING', False)
+    )
+    return response
+
+@app.teardown_request
+def terminar_medicion_sql(exception=None):
+    medicion = terminar_medicion()
+    if medicion is not None:
+        requests_en_curso.labels(medicion.endpoint).dec()
+
+@app.teardown_appcontext
+def devolver_conexiones(exception=None):
+    """Devuelve al pool las conexiones que una vista no cerró"""
+    liberar_conexiones_pendientes()
+
+def serializar_fila(fila):
+    """Convierte una fila de la base a un dict JSON-serializable (fechas ISO, decimales a float)"""
+    resultado = {}
+    for clave, valor in dict(fila).items():
+        if isinstance(valor, (datetime, date)):
+            valor = valor.isoformat()
+        elif isinstance(valor, Decimal):
+            valor = float(valor)
+        resultado[clave] = valor
+    return resultado
+
 def registrar_auditoria(conn, equipo_id, usuario_id, usuario_nombre, campo, valor_anterior, valor_nuevo, accion='UPDATE'):
-    """Registra un cambio en la tabla de auditoría"""
+    """Registra un cambio en la tabla de auditoría (en modo asíncrono se encola al confirmar)
+
+    En modo síncrono un error se propaga: la transacción del cambio no puede confirmarse sin su auditoría.
+    """
     try:
+        cambios = RegistroCambios(usuario_id, usuario_nombre)
+        cambios.registrar(equipo_id, campo, valor_anterior, valor_nuevo, accion)
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO equipos_auditoria 
-            (equipo_id, usuario_id, usuario_nombre, campo_modificado, valor_anterior, valor_nuevo, accion)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (equipo_id, usuario_id, usuario_nombre, campo, str(valor_anterior) if valor_anterior else '', str(valor_nuevo) if valor_nuevo else '', accion))
+        cambios.guardar(cursor)
         cursor.close()
     except Exception as e:
         print(f"Error al registrar auditoría: {e}")
+        raise
 
 # ============================================
 # RUTAS DE AUTENTICACIÓN
@@ -93,189 +184,139 @@ def logout():
 
 @app.route('/')
 @login_required
+@presupuesto_consultas(4)
 def index():
     """Página principal - Dashboard"""
-    conn = get_db_connection()
-    if not conn:
-        return "Error de conexión a la base de datos", 500
-    
-    cursor = conn.cursor()
-    
-    # Métricas totales
-    cursor.execute("SELECT COUNT(*) as total FROM solicitudes")
-    total_solicitudes = cursor.fetchone()['total']
-    
-    cursor.execute("SELECT COUNT(*) as total FROM equipos WHERE eliminado = FALSE")
-    total_equipos = cursor.fetchone()['total']
-    
-    # Métricas de estados específicos para las tarjetas superiores
-    cursor.execute("SELECT COUNT(*) as total FROM equipos WHERE estado = 'Pendiente' AND eliminado = FALSE")
-    pendientes = cursor.fetchone()['total']
-    
-    cursor.execute("SELECT COUNT(*) as total FROM equipos WHERE estado = 'Finalizado' AND eliminado = FALSE")
-    finalizados = cursor.fetchone()['total']
-    
-    cursor.execute("SELECT COUNT(*) as total FROM equipos WHERE estado = 'En curso' AND eliminado = FALSE")
-    en_curso = cursor.fetchone()['total']
+    metricas = cache_metricas.get(CLAVE_METRICAS)
     
-    cursor.execute("SELECT COUNT(*) as total FROM equipos WHERE estado = 'A presupuestar' AND eliminado = FALSE")
-    a_presupuestar = cursor.fetchone()['total']
-    
-    # Estados de solicitudes (todos los estados)
-    cursor.execute("""
-        SELECT estado, COUNT(*) as cantidad 
-        FROM equipos 
-        WHERE eliminado = FALSE
-        GROUP BY estado
-        ORDER BY 
-            CASE estado
-                WHEN 'Pendiente' THEN 1
-                WHEN 'Aprobación pendiente' THEN 2
-                WHEN 'A presupuestar' THEN 3
-                WHEN 'Baja técnica' THEN 4
-                WHEN 'En curso' THEN 5
-                WHEN 'Finalizado' THEN 6
-                WHEN 'Listo para entregar' THEN 7
-                WHEN 'Repuestos' THEN 8
-                WHEN 'Tercerizado' THEN 9
-                ELSE 11
-            END
-    """)
-    estados = cursor.fetchall()
-    
-    # Categorías de equipos basadas en la columna categoria de solicitudes
-    cursor.execute("""
-        SELECT 
-            CASE 
-                WHEN s.categoria LIKE '%R%' THEN 'Reparación'
-                WHEN s.categoria LIKE '%G%' THEN 'Garantía'
-                WHEN s.categoria LIKE '%BA%' THEN 'Baja de Alquiler'
-                WHEN s.categoria LIKE '%CA%' THEN 'Cambio de Alquiler'
-                WHEN s.categoria LIKE '%FC%' THEN 'Cambio por Falla Crítica'
-                ELSE 'Otra'
-            END as categoria_nombre,
-            COUNT(*) as cantidad
-        FROM equipos e
-        LEFT JOIN solicitudes s ON e.solicitud_id = s.id
-        WHERE e.eliminado = FALSE
-        GROUP BY categoria_nombre
-        ORDER BY cantidad DESC
-    """)
-    categorias = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
+    if metricas is None:
+        conn = get_db_connection()
+        if not conn:
+            return "Error de conexión a la base de datos", 500
+        
+        metricas = obtener_metricas_dashboard(conn)
+        conn.close()
+        cache_metricas.set(CLAVE_METRICAS, metricas)
     
-    return render_template('dashboard.html', 
-                         total_solicitudes=total_solicitudes,
-                         total_equipos=total_equipos,
-                         pendientes=pendientes,
-                         finalizados=finalizados,
-                         en_curso=en_curso,
-                         a_presupuestar=a_presupuestar,
-                         estados=estados,
-                         categorias=categorias)
+    return render_template('dashboard.html', metricas=metricas)
 
 @app.route('/solicitudes')
 @login_required
+@presupuesto_consultas(4)
 def solicitudes():
     """Página de solicitudes"""
     conn = get_db_connection()
     if not conn:
         return "Error de conexión a la base de datos", 500
     
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT 
-        s.id,
-        s.fecha_solicitud,
-        s.estado,
-        s.categoria,
-        s.pdf_url,
-        s.email_solicitante,
-        s.quien_completa,
-        s.nivel_urgencia,
-        s.motivo_solicitud,
-        s.comercial_syemed,
-        CASE WHEN s.categoria LIKE '%G%' THEN 'Sí' ELSE 'No' END as garantia,
-        -- Colaborador Syemed
-        s.area_solicitante,
-        s.solicitante,
-        s.logistica_cargo,
-        s.comentarios_caso,
-        s.equipo_corresponde_a,
-        -- Distribuidor / Institución
-        s.nombre_fantasia,
-        s.razon_social,
-        s.cuit,
-        s.contacto_nombre,
-        s.contacto_telefono,
-        s.contacto_tecnico,
-        s.equipo_propiedad,
-        -- Paciente Particular
-        s.nombre_apellido_paciente,
-        s.telefono_paciente,
-        s.equipo_origen,
-        -- OSTs vinculadas
-        (SELECT STRING_AGG(DISTINCT e.ost::TEXT, ', ' ORDER BY e.ost::TEXT)
-         FROM equipos e 
-         WHERE e.solicitud_id = s.id AND e.eliminado = FALSE) as osts_vinculadas 
-    FROM solicitudes s
-    ORDER BY s.fecha_solicitud DESC
-""")
-    solicitudes = cursor.fetchall()
-    cursor.close()
+    try:
+        pagina = consultar_pagina_solicitudes(conn, request.args)
+    except ValueError as e:
+        conn.close()
+        return str(e), 400
     conn.close()
     
-    return render_template('solicitudes.html', solicitudes=solicitudes)
+    return render_template(
+        'solicitudes.html',
+        solicitudes=pagina['solicitudes'],
+        cursor_siguiente=pagina['cursor_siguiente'],
+        limite=pagina['limite']
+    )
 
 
 @app.route('/equipos')
 @login_required
+@presupuesto_consultas(6)
 def equipos():
-    """Página de equipos (solo muestra equipos NO eliminados)"""
+    """Página de equipos (solo muestra equipos NO eliminados, primera página de la grilla)"""
     conn = get_db_connection()
     if not conn:
         return "Error de conexión a la base de datos", 500
     
-    cursor = conn.cursor()
+    try:
+        pagina = consultar_pagina_equipos(conn, request.args)
+    except ValueError as e:
+        conn.close()
+        return str(e), 400
     
-    # Obtener equipos NO eliminados
-    cursor.execute("""
-        SELECT e.id, e.cliente, e.ost, e.estado, e.fecha_ingreso, e.remito,
-            e.tipo_equipo, e.marca, e.modelo, e.numero_serie, e.accesorios,
-            s.categoria,
-            COALESCE(s.comercial_syemed, s.solicitante) as comercial_cargo,
-            e.observacion_ingreso, e.prioridad, e.fecha_envio, e.proveedor,
-            e.detalles_reparacion, e.horas_trabajo, e.reingreso, 
-            e.informe AS informe_tecnico,
-            e.costo AS costo_reparacion, 
-            e.precio AS precio_cliente, 
-            e.ov AS numero_ov, 
-            e.estado_ov, e.fecha_entrega, e.remito_entrega,
-            e.solicitud_id,
-            s.nivel_urgencia
-        FROM equipos e
-        LEFT JOIN solicitudes s ON e.solicitud_id = s.id
-        WHERE e.eliminado = FALSE
-        ORDER BY e.fecha_ingreso DESC
-    """)
-    equipos = cursor.fetchall()
+    # Obtener archivos para las fotos (solo de los equipos de la página)
+    archivos = consultar_archivos_equipos(
+        conn, {e['numero_serie'] for e in pagina['equipos'] if e['numero_serie']}
+    )
     
-    # Obtener archivos para las fotos (hacer JOIN con equipos NO eliminados)
-    cursor.execute("""
-        SELECT e.numero_serie, a.categoria, a.url_cloudinary
-        FROM archivos_adjuntos a
-        INNER JOIN equipos e ON a.equipo_id = e.id
-        WHERE e.numero_serie IS NOT NULL 
-        AND e.eliminado = FALSE  -- 👈 Solo archivos de equipos activos
-    """)
-    archivos = cursor.fetchall()
-    
-    cursor.close()
     conn.close()
     
-    return render_template('equipos.html', equipos=equipos, archivos=archivos)
+    return render_template('equipos.html', 
+                         equipos=pagina['equipos'],
+                         adjuntos_por_equipo=agrupar_adjuntos(pagina['equipos'], archivos),
+                         cursor_siguiente=pagina['cursor_siguiente'],
+                         total_equipos=pagina['total'],
+                         prioridades=PRIORIDADES)
+
+@app.route('/api/equipos', methods=['GET'])
+@login_required
+def api_listar_equipos():
+    """API paginada de la grilla de equipos (cursor, filtros y orden en el servidor)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Error de conexión'}), 500
+    
+    try:
+        pagina = consultar_pagina_equipos(conn, request.args)
+        archivos = consultar_archivos_equipos(
+            conn, {e['numero_serie'] for e in pagina['equipos'] if e['numero_serie']}
+        )
+        conn.close()
+    except ValueError as e:
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error al listar equipos: {e}")
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    respuesta = {
+        'success': True,
+        'equipos': [serializar_fila(e) for e in pagina['equipos']],
+        'cursor_siguiente': pagina['cursor_siguiente'],
+        'total': pagina['total'],
+        'limite': pagina['limite']
+    }
+    
+    # La grilla pide las filas ya renderizadas para no duplicar el markup en JS
+    if request.args.get('formato') == 'html':
+        desde = request.args.get('desde', 0, type=int)
+        adjuntos_por_equipo = agrupar_adjuntos(pagina['equipos'], archivos)
+        for seccion in ('fijas', 'scrollables'):
+            respuesta[f'html_{seccion}'] = render_template(
+                'equipos_filas.html', equipos=pagina['equipos'],
+                adjuntos_por_equipo=adjuntos_por_equipo,
+                seccion=seccion, desde=desde
+            )
+    
+    return jsonify(respuesta)
+
+@app.route('/api/equipos/valores', methods=['GET'])
+@login_required
+def api_valores_filtro_equipos():
+    """Opciones del desplegable de filtro de una columna de la grilla (con los demás filtros aplicados)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Error de conexión'}), 500
+    
+    try:
+        columna = request.args.get('columna', '')
+        resultado = consultar_valores_columna(conn, request.args, columna)
+        conn.close()
+    except ValueError as e:
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error al obtener valores de filtro: {e}")
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    return jsonify({'success': True, 'columna': columna, **resultado})
 
 @app.route('/archivos')
 @login_required
@@ -355,38 +396,72 @@ def auditoria():
     if not conn:
         return "Error de conexión a la base de datos", 500
     
-    cursor = conn.cursor()
-    
-    # Obtener el equipo_id si se filtra
-    equipo_id = request.args.get('equipo_id', type=int)
-    
-    if equipo_id:
-        cursor.execute("""
-            SELECT a.*, e.ost, e.cliente, e.tipo_equipo, e.eliminado
-            FROM equipos_auditoria a
-            LEFT JOIN equipos e ON a.equipo_id = e.id
-            WHERE a.equipo_id = %s
-            ORDER BY a.fecha_cambio DESC
-        """, (equipo_id,))
-    else:
-        # 👇 CLAVE: No filtramos por eliminado, mostramos TODO
-        cursor.execute("""
-            SELECT a.*, e.ost, e.cliente, e.tipo_equipo, e.eliminado
-            FROM equipos_auditoria a
-            LEFT JOIN equipos e ON a.equipo_id = e.id
-            ORDER BY a.fecha_cambio DESC
-            LIMIT 500
-        """)
-    
-    cambios = cursor.fetchall()
-    cursor.close()
+    try:
+        pagina = consultar_pagina_auditoria(conn, request.args)
+    except ValueError as e:
+        conn.close()
+        return str(e), 400
     conn.close()
     
-    return render_template('auditoria.html', cambios=cambios, equipo_id=equipo_id)
+    return render_template(
+        'auditoria.html',
+        cambios=pagina['cambios'],
+        equipo_id=pagina['filtros'].get('equipo_id'),
+        filtros=pagina['filtros'],
+        cursor_siguiente=pagina['cursor_siguiente'],
+        limite=pagina['limite'],
+        acciones=ACCIONES
+    )
 # ============================================
 # API ENDPOINTS
 # ============================================
 
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato Prometheus (todos los workers); ver metricas.py"""
+    if not autorizado(request.headers.get('Authorization', '')):
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    muestrear(estadisticas_pool, (cache_metricas, cache_usuarios), cola_auditoria)
+    contenido, content_type = exportar()
+    return Response(contenido, content_type=content_type)
+
+@app.route('/api/cache/estadisticas')
+@permission_required('view_audit')
+def api_cache_estadisticas():
+    """API con los contadores de hits/misses de la cache del dashboard (solo admin)"""
+    return jsonify({'success': True, 'caches': [cache_metricas.estadisticas(), cache_usuarios.estadisticas()]})
+
+@app.route('/api/auditoria/estadisticas')
+@permission_required('view_audit')
+def api_auditoria_estadisticas():
+    """Profundidad de la cola de auditoría y latencia de escritura (proceso actual)"""
+    return jsonify({'success': True, 'auditoria': cola_auditoria.estadisticas()})
+
+@app.route('/api/solicitud/<int:id>', methods=['GET'])
+@login_required
+def api_solicitud(id):
+    """API con el detalle completo de una solicitud (ETag: responde 304 si no cambió)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Error de conexión'}), 500
+    
+    try:
+        solicitud = obtener_solicitud(conn, id)
+        conn.close()
+    except Exception as e:
+        print(f"Error al obtener solicitud: {e}")
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    if not solicitud:
+        return jsonify({'success': False, 'error': 'Solicitud no encontrada'}), 404
+    
+    respuesta = jsonify({'success': True, 'solicitud': serializar_fila(solicitud)})
+    respuesta.set_etag(hashlib.sha1(respuesta.get_data()).hexdigest())
+    # El navegador la guarda pero revalida siempre (una edición cambia el ETag)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta.make_conditional(request)
+
 @app.route('/api/solicitud/<int:id>', methods=['PUT'])
 @permission_required('edit')
 def update_solicitud(id):
@@ -430,9 +505,15 @@ def update_solicitud(id):
         query = f"UPDATE solicitudes SET {', '.join(campos)} WHERE id = %s"
         
         cursor.execute(query, valores)
+        if 'categoria' in data:
+            refrescar_resumen(cursor, meses_solicitud(cursor, id))
+        refrescar_priorizados(cursor, osts_solicitud(cursor, id))
         conn.commit()
         cursor.close()
         conn.close()
+        
+        if 'categoria' in data:
+            invalidar_metricas_dashboard()
         return jsonify({'success': True})
     except Exception as e:
         conn.rollback()
@@ -443,7 +524,7 @@ def update_solicitud(id):
 @app.route('/api/proximo-ost', methods=['GET'])
 @login_required
 def obtener_proximo_ost():
-    """API para obtener el próximo número OST disponible"""
+    """API para consultar el próximo número OST (no lo reserva: ver /api/ost/reservas)"""
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Error de conexión'}), 500
@@ -451,11 +532,7 @@ def obtener_proximo_ost():
     cursor = conn.cursor()
     
     try:
-        # Obtener el último OST
-        cursor.execute("SELECT MAX(ost) as max_ost FROM equipos")
-        result = cursor.fetchone()
-        max_ost = result['max_ost'] if result and result['max_ost'] else 0
-        proximo_ost = max_ost + 1
+        proximo_ost = consultar_proximo_ost(cursor)
         
         cursor.close()
         conn.close()
@@ -469,6 +546,58 @@ def obtener_proximo_ost():
         conn.close()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ost/reservas', methods=['POST'])
+@permission_required('edit')
+def api_reservar_ost():
+    """API para reservar el número OST que se muestra en el alta de un equipo"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Error de conexión'}), 500
+    
+    cursor = conn.cursor()
+    
+    try:
+        ost, vence_en = reservar_ost(cursor, current_user.id)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({
+            'success': True,
+            'ost': ost,
+            'vence_en': vence_en.isoformat()
+        }), 201
+    except Exception as e:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ost/reservas/<int:ost>', methods=['DELETE'])
+@permission_required('edit')
+def api_liberar_ost(ost):
+    """API para liberar una reserva de OST (alta cancelada)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Error de conexión'}), 500
+    
+    cursor = conn.cursor()
+    
+    try:
+        liberada = liberar_reserva(cursor, ost, current_user.id)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        if not liberada:
+            return jsonify({'success': False, 'error': 'Reserva no encontrada'}), 404
+        return jsonify({'success': True})
+    except Exception as e:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/equipos', methods=['POST'])
 @app.route('/api/equipo/crear', methods=['POST'])
 @permission_required('edit')
@@ -492,15 +621,35 @@ def crear_equipo():
         def empty_to_none(value):
             return None if value == '' or value is None else value
         
+        try:
+            prioridad = validar_prioridad(empty_to_none(data.get('prioridad')))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # OST reservada al abrir el alta; sin reserva, la toma el DEFAULT de la secuencia
+        ost = empty_to_none(data.get('ost'))
+        if ost is not None:
+            try:
+                ost = int(ost)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': 'OST inválida'}), 400
+            try:
+                confirmar_reserva(cursor, ost, current_user.id)
+            except ValueError as e:
+                conn.rollback()
+                return jsonify({'success': False, 'error': str(e)}), 400
+        
         cursor.execute("""
             INSERT INTO equipos (
-                cliente, tipo_equipo, marca, modelo, numero_serie,
+                ost, cliente, tipo_equipo, marca, modelo, numero_serie,
                 fecha_ingreso, remito, accesorios, prioridad, 
                 observacion_ingreso, estado
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES (COALESCE(%s, nextval(%s)), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id, ost
         """, (
+            ost,
+            SECUENCIA_OST,
             data.get('cliente'),
             data.get('tipo_equipo'),
             empty_to_none(data.get('marca')),
@@ -509,7 +658,7 @@ def crear_equipo():
             fecha_ingreso,
             empty_to_none(data.get('remito')),
             empty_to_none(data.get('accesorios')),
-            data.get('prioridad', 'Media'),
+            prioridad,
             empty_to_none(data.get('observacion_ingreso')),
             'Pendiente'
         ))
@@ -527,9 +676,12 @@ def crear_equipo():
             'INSERT'
         )
         
+        refrescar_resumen(cursor, meses_equipos(cursor, [result['id']]))
+        refrescar_priorizados(cursor, [result['ost']])
         conn.commit()
         cursor.close()
         conn.close()
+        invalidar_metricas_dashboard()
         
         return jsonify({
             'success': True,
@@ -546,8 +698,14 @@ def crear_equipo():
 
 @app.route('/api/equipo/<int:id>', methods=['PUT'])
 @permission_required('edit')
+@presupuesto_consultas(7)
 def update_equipo(id):
-    """API para actualizar equipo (requiere permiso de edición)"""
+    """API para actualizar equipo (requiere permiso de edición)
+
+    Round trips: lectura FOR UPDATE, UPDATE + auditoría y refresco de priorizados (lock y
+    recálculo): 4. Si cambia el estado o la fecha de ingreso se suma el resumen mensual
+    (lock, borrado e inserción): 7.
+    """
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Error de conexión'}), 500
@@ -556,8 +714,9 @@ def update_equipo(id):
     cursor = conn.cursor()
     
     try:
-        # Primero obtener los valores actuales
-        cursor.execute("SELECT * FROM equipos WHERE id = %s", (id,))
+        # Primero obtener los valores actuales; FOR UPDATE: una edición simultánea del mismo
+        # equipo espera al commit y audita como valor anterior el que dejó esta
+        cursor.execute("SELECT * FROM equipos WHERE id = %s FOR UPDATE", (id,))
         equipo_actual = cursor.fetchone()
         
         if not equipo_actual:
@@ -567,53 +726,14 @@ def update_equipo(id):
         campos = []
         valores = []
         
-        # Mapeo de campos JSON a columnas DB
-        campo_map = {
-            'cliente': 'cliente',
-            'tipo_equipo': 'tipo_equipo',
-            'marca': 'marca',
-            'modelo': 'modelo',
-            'numero_serie': 'numero_serie',
-            'accesorios': 'accesorios',
-            'prioridad': 'prioridad',
-            'remito': 'remito',
-            'observacion_ingreso': 'observacion_ingreso',
-            'detalle_reparacion': 'detalles_reparacion',
-            'horas_trabajo': 'horas_trabajo',
-            'reingreso': 'reingreso',
-            'informe_tecnico': 'informe',
-            'costo_reparacion': 'costo',
-            'precio_cliente': 'precio',
-            'numero_ov': 'ov',
-            'estado_ov': 'estado_ov',
-            'fecha_ingreso': 'fecha_ingreso',
-            'fecha_envio_proveedor': 'fecha_envio',
-            'fecha_entrega': 'fecha_entrega',
-            'remito_entrega': 'remito_entrega',
-            'estado': 'estado',
-            'proveedor': 'proveedor'
-        }
+        # Los cambios de auditoría se acumulan y se escriben junto con el UPDATE
+        cambios = RegistroCambios(current_user.id, current_user.username)
         
-        for campo_json, campo_db in campo_map.items():
-            if campo_json in data:
-                valor_anterior = equipo_actual.get(campo_db)
-                valor_nuevo = data.get(campo_json)
-                
-                # Solo actualizar si el valor cambió
-                if str(valor_anterior) != str(valor_nuevo):
-                    campos.append(f'{campo_db} = %s')
-                    valores.append(valor_nuevo)
-                    
-                    # Registrar en auditoría
-                    registrar_auditoria(
-                        conn,
-                        id,
-                        current_user.id,
-                        current_user.username,
-                        campo_db,
-                        valor_anterior,
-                        valor_nuevo
-                    )
+        # Solo se actualizan los campos cuyo valor cambió
+        for campo_db, (valor_anterior, valor_nuevo) in calcular_cambios(equipo_actual, data).items():
+            campos.append(f'{campo_db} = %s')
+            valores.append(valor_nuevo)
+            cambios.registrar(id, campo_db, valor_anterior, valor_nuevo)
         
         if not campos:
             return jsonify({'success': True, 'message': 'No hay cambios para guardar'})
@@ -621,12 +741,25 @@ def update_equipo(id):
         # Agregar el ID al final
         valores.append(id)
         
-        query = f"UPDATE equipos SET {', '.join(campos)} WHERE id = %s"
+        query = f"UPDATE equipos SET {', '.join(campos)} WHERE id = %s RETURNING fecha_ingreso"
         
-        cursor.execute(query, valores)
+        # UPDATE + INSERT multi-fila de auditoría en un solo round trip
+        actualizado = cambios.guardar(cursor, query, valores)
+        
+        # El resumen mensual depende del estado y del mes de ingreso
+        if actualizado and ('estado = %s' in campos or 'fecha_ingreso = %s' in campos):
+            refrescar_resumen(cursor, meses_de_fechas(
+                equipo_actual['fecha_ingreso'], actualizado[0]['fecha_ingreso']
+            ))
+        if actualizado:
+            refrescar_priorizados(cursor, [equipo_actual['ost']])
         conn.commit()
         cursor.close()
         conn.close()
+        
+        # Solo el estado afecta a las métricas del dashboard
+        if 'estado = %s' in campos:
+            invalidar_metricas_dashboard()
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error al actualizar: {e}")
@@ -635,6 +768,110 @@ def update_equipo(id):
         conn.close()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/equipos/lote', methods=['PUT'])
+@permission_required('edit')
+def update_equipos_lote():
+    """API para actualizar varios equipos en un request: [{id, changes}, ...]"""
+    items = request.get_json(silent=True)
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Error de conexión'}), 500
+    
+    cursor = conn.cursor()
+    
+    try:
+        resultados, actualizados, columnas = actualizar_equipos_lote(
+            cursor, items, current_user.id, current_user.username
+        )
+        
+        if 'estado' in columnas or 'fecha_ingreso' in columnas:
+            refrescar_resumen(cursor, meses_de_fechas(*[
+                fecha for fila in actualizados
+                for fecha in (fila['fecha_ingreso_anterior'], fila['fecha_ingreso'])
+            ]))
+        refrescar_priorizados(cursor, [fila['ost'] for fila in actualizados])
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        if 'estado' in columnas:
+            invalidar_metricas_dashboard()
+        
+        errores = sum(1 for r in resultados if not r['success'])
+        return jsonify({
+            'success': errores == 0,
+            'resultados': resultados,
+            'actualizados': len(actualizados),
+            'errores': errores
+        })
+    except ValueError as e:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error al actualizar en lote: {e}")
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/equipos/lote', methods=['POST'])
+@permission_required('edit')
+def crear_equipos_en_lote():
+    """API para dar de alta varios equipos: JSON [{cliente, tipo_equipo, ...}] o archivo .csv/.xlsx
+
+    Con parcial=1 se crean las filas válidas aunque otras tengan errores.
+    """
+    parcial = request.values.get('parcial', '').lower() in ('1', 'true', 'si', 'sí')
+    
+    archivo = request.files.get('archivo')
+    try:
+        items = leer_filas_archivo(archivo) if archivo else request.get_json(silent=True)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Error de conexión'}), 500
+    
+    cursor = conn.cursor()
+    
+    try:
+        resultados, fechas = crear_equipos_lote(
+            cursor, items, current_user.id, current_user.username, parcial=parcial
+        )
+        
+        if fechas:
+            refrescar_resumen(cursor, meses_de_fechas(*fechas))
+            refrescar_priorizados(cursor, [r['ost'] for r in resultados if r['success']])
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        if fechas:
+            invalidar_metricas_dashboard()
+        
+        errores = sum(1 for r in resultados if not r['success'])
+        return jsonify({
+            'success': errores == 0,
+            'resultados': resultados,
+            'creados': len(fechas),
+            'errores': errores
+        }), 201 if fechas else 400
+    except ValueError as e:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error al crear equipos en lote: {e}")
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # REEMPLAZA los endpoints de DELETE y RESTAURAR en app.py con estos:
 
 @app.route('/api/equipo/<int:id>', methods=['DELETE'])
@@ -674,9 +911,12 @@ def delete_equipo(id):
             'DELETE'
         )
         
+        refrescar_resumen(cursor, meses_equipos(cursor, [id]))
+        refrescar_priorizados(cursor, [equipo['ost']])
         conn.commit()
         cursor.close()
         conn.close()
+        invalidar_metricas_dashboard()
         
         return jsonify({'success': True, 'message': 'Equipo eliminado correctamente'})
     except Exception as e:
@@ -731,9 +971,12 @@ def restaurar_equipo(id):
             'INSERT'
         )
         
+        refrescar_resumen(cursor, meses_equipos(cursor, [id]))
+        refrescar_priorizados(cursor, [equipo['ost']])
         conn.commit()
         cursor.close()
         conn.close()
+        invalidar_metricas_dashboard()
         
         return jsonify({
             'success': True,
@@ -814,29 +1057,16 @@ def equipos_priorizados():
         return redirect(url_for('index'))
     
     conn = get_db_connection()
-    cur = conn.cursor()
+    if not conn:
+        return "Error de conexión a la base de datos", 500
     
     try:
-        # Obtener equipos priorizados
-        cur.execute("SELECT * FROM equipos_priorizados")
-        
-        equipos = cur.fetchall()
-        
-        # Agrupar por nivel de prioridad
-        equipos_agrupados = {
-            'Critica': [],
-            'Alta': [],
-            'Media': [],
-            'Baja': []
-        }
-        
-        for equipo in equipos:
-            nivel = equipo['nivel_prioridad']
-            equipos_agrupados[nivel].append(equipo)
+        # Filas ya puntuadas y ordenadas (el cron diario las regenera completas)
+        equipos_agrupados = consultar_priorizados(conn)
         
         # Estadísticas
         stats = {
-            'total': len(equipos),
+            'total': sum(len(equipos) for equipos in equipos_agrupados.values()),
             'critica': len(equipos_agrupados['Critica']),
             'alta': len(equipos_agrupados['Alta']),
             'media': len(equipos_agrupados['Media']),
@@ -851,7 +1081,6 @@ def equipos_priorizados():
         flash(f'Error al cargar equipos priorizados: {str(e)}', 'error')
         return redirect(url_for('index'))
     finally:
-        cur.close()
         conn.close()
 
 @app.route('/informes-mensuales')
@@ -921,6 +1150,33 @@ def api_equipo_detalle(ost):
         conn.close()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/buscar')
+@login_required
+def api_buscar():
+    """API de búsqueda de equipos o solicitudes (q, tipo, limite, cursor)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Error de conexión'}), 500
+    
+    try:
+        busqueda = buscar(conn, request.args)
+        conn.close()
+    except ValueError as e:
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error en búsqueda: {e}")
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'tipo': busqueda['tipo'],
+        'resultados': [serializar_fila(fila) for fila in busqueda['resultados']],
+        'cursor_siguiente': busqueda['cursor_siguiente'],
+        'limite': busqueda['limite']
+    })
+
 @app.route('/api/informe-mensual')
 @login_required
 def api_informe_mensual():
@@ -932,203 +1188,58 @@ def api_informe_mensual():
     if not anio:
         return jsonify({'success': False, 'error': 'Año requerido'}), 400
     
+    # El informe se calcula sobre el resumen mensual, no sobre las filas de equipos
+    try:
+        filtro, params = construir_filtro_resumen(anio, mes, categoria)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     conn = get_db_connection()
     if not conn:
         return jsonify({'success': False, 'error': 'Error de conexión'}), 500
     
-    cursor = conn.cursor()
-    
     try:
-        # Construir filtros
-        filtro_fecha = "EXTRACT(YEAR FROM e.fecha_ingreso) = %s"
-        params = [anio]
-        
-        if mes:
-            filtro_fecha += " AND EXTRACT(MONTH FROM e.fecha_ingreso) = %s"
-            params.append(mes)
-        
-        filtro_categoria = ""
-        if categoria:
-            filtro_categoria = " AND s.categoria LIKE %s"
-            params.append(f'%{categoria}%')
-        
-        # 1. Estadísticas generales
-        cursor.execute(f"""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN e.estado = 'Finalizado' THEN 1 ELSE 0 END) as finalizados,
-                SUM(CASE WHEN e.estado = 'Pendiente' THEN 1 ELSE 0 END) as pendientes
-            FROM equipos e
-            LEFT JOIN solicitudes s ON e.solicitud_id = s.id
-            WHERE {filtro_fecha} {filtro_categoria}
-            AND e.eliminado = FALSE
-        """, params.copy())
-        
-        stats = cursor.fetchone()
-        print(f"DEBUG - Stats: {dict(stats) if stats else None}")
-        
-        # 2. Ingresos por mes
-        cursor.execute(f"""
-            SELECT 
-                EXTRACT(YEAR FROM e.fecha_ingreso)::integer as anio,
-                EXTRACT(MONTH FROM e.fecha_ingreso)::integer as mes,
-                COUNT(*) as ingresados,
-                SUM(CASE WHEN e.estado = 'Finalizado' THEN 1 ELSE 0 END) as finalizados,
-                SUM(CASE WHEN e.estado = 'En curso' THEN 1 ELSE 0 END) as en_curso,
-                SUM(CASE WHEN e.estado = 'Pendiente' THEN 1 ELSE 0 END) as pendientes,
-                SUM(CASE WHEN e.estado NOT IN ('Finalizado', 'En curso', 'Pendiente') THEN 1 ELSE 0 END) as otros
-            FROM equipos e
-            LEFT JOIN solicitudes s ON e.solicitud_id = s.id
-            WHERE {filtro_fecha} {filtro_categoria}
-            AND e.eliminado = FALSE
-            AND e.fecha_ingreso IS NOT NULL
-            GROUP BY EXTRACT(YEAR FROM e.fecha_ingreso), EXTRACT(MONTH FROM e.fecha_ingreso)
-            ORDER BY anio, mes
-        """, params.copy())
-        
-        ingresos_por_mes = cursor.fetchall()
-        print(f"DEBUG - Ingresos por mes ({len(ingresos_por_mes)} filas):")
-        for i, row in enumerate(ingresos_por_mes[:3]):  # Solo primeras 3 filas
-            print(f"  Fila {i}: {dict(row)}")
-        
-        # 3. Estados
-        cursor.execute(f"""
-            SELECT 
-                e.estado,
-                COUNT(*) as cantidad
-            FROM equipos e
-            LEFT JOIN solicitudes s ON e.solicitud_id = s.id
-            WHERE {filtro_fecha} {filtro_categoria}
-            AND e.eliminado = FALSE
-            GROUP BY e.estado
-            ORDER BY cantidad DESC
-        """, params.copy())
-        
-        estados = cursor.fetchall()
-        print(f"DEBUG - Estados ({len(estados)} filas)")
-        
-        # 4. Categorías
-        cursor.execute(f"""
-            SELECT 
-                CASE 
-                    WHEN s.categoria LIKE '%%R%%' THEN 'Reparación'
-                    WHEN s.categoria LIKE '%%G%%' THEN 'Garantía'
-                    WHEN s.categoria LIKE '%%BA%%' THEN 'Baja de Alquiler'
-                    WHEN s.categoria LIKE '%%CA%%' THEN 'Cambio de Alquiler'
-                    WHEN s.categoria LIKE '%%FC%%' THEN 'Cambio por Falla Crítica'
-                    ELSE 'Otra'
-                END as categoria,
-                COUNT(*) as cantidad
-            FROM equipos e
-            LEFT JOIN solicitudes s ON e.solicitud_id = s.id
-            WHERE {filtro_fecha} {filtro_categoria}
-            AND e.eliminado = FALSE
-            GROUP BY categoria
-            ORDER BY cantidad DESC
-        """, params.copy())
-        
-        categorias = cursor.fetchall()
-        print(f"DEBUG - Categorías ({len(categorias)} filas)")
-        
-        cursor.close()
+        informe = consultar_informe_mensual(conn, filtro, params)
         conn.close()
-        
-        # Convertir los datos a formato JSON-serializable
-        ingresos_list = []
-        for i, row in enumerate(ingresos_por_mes):
-            try:
-                # Usar .get() en lugar de [] para evitar KeyError
-                ingresos_list.append({
-                    'anio': int(row.get('anio', anio)) if row.get('anio') else anio,
-                    'mes': int(row.get('mes', 1)) if row.get('mes') else 1,
-                    'ingresados': int(row.get('ingresados', 0)) if row.get('ingresados') else 0,
-                    'finalizados': int(row.get('finalizados', 0)) if row.get('finalizados') else 0,
-                    'en_curso': int(row.get('en_curso', 0)) if row.get('en_curso') else 0,
-                    'pendientes': int(row.get('pendientes', 0)) if row.get('pendientes') else 0,
-                    'otros': int(row.get('otros', 0)) if row.get('otros') else 0
-                })
-            except Exception as e:
-                print(f"Error procesando fila {i} de ingresos_por_mes: {e}")
-                print(f"Datos de la fila: {dict(row)}")
-                raise
-        
-        estados_list = []
-        for i, row in enumerate(estados):
-            try:
-                estados_list.append({
-                    'estado': str(row.get('estado', 'Sin estado')) if row.get('estado') else 'Sin estado',
-                    'cantidad': int(row.get('cantidad', 0)) if row.get('cantidad') else 0
-                })
-            except Exception as e:
-                print(f"Error procesando fila {i} de estados: {e}")
-                print(f"Datos de la fila: {dict(row)}")
-                raise
-        
-        categorias_list = []
-        for i, row in enumerate(categorias):
-            try:
-                categorias_list.append({
-                    'categoria': str(row.get('categoria', 'Otra')) if row.get('categoria') else 'Otra',
-                    'cantidad': int(row.get('cantidad', 0)) if row.get('cantidad') else 0
-                })
-            except Exception as e:
-                print(f"Error procesando fila {i} de categorias: {e}")
-                print(f"Datos de la fila: {dict(row)}")
-                raise
-        
-        return jsonify({
-            'success': True,
-            'total': int(stats.get('total', 0)) if stats and stats.get('total') else 0,
-            'total_ingresados': int(stats.get('total', 0)) if stats and stats.get('total') else 0,
-            'total_finalizados': int(stats.get('finalizados', 0)) if stats and stats.get('finalizados') else 0,
-            'total_pendientes': int(stats.get('pendientes', 0)) if stats and stats.get('pendientes') else 0,
-            'ingresos_por_mes': ingresos_list,
-            'estados': estados_list,
-            'categorias': categorias_list
-        })
+        return jsonify({'success': True, **informe})
     
     except Exception as e:
         print(f"Error al generar informe: {e}")
         import traceback
         traceback.print_exc()
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/informe-mensual/excel')
 @login_required
 def api_informe_mensual_excel():
-    """Exportar informe mensual a Excel"""
+    """Exportar informe mensual: .xlsx (memoria acotada, se arma antes de enviarlo) o
+    formato=csv (se envía a medida que se leen las filas)"""
+    conn = None
     try:
-        import io
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from flask import send_file
-        
         anio = request.args.get('anio', type=int)
         mes = request.args.get('mes', type=int)
         categoria = request.args.get('categoria', '')
+        formato = request.args.get('formato', 'xlsx')
         
         if not anio:
             return jsonify({'error': 'Año requerido'}), 400
+        if formato not in ('xlsx', 'csv'):
+            return jsonify({'error': 'Formato inválido. Debe ser xlsx o csv'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Filtros comunes (rango semiabierto sobre fecha_ingreso)
+        try:
+            filtro, params = construir_filtro_informe(anio, mes, categoria)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Obtener datos (reutilizar lógica del endpoint anterior)
-        filtro_fecha = "EXTRACT(YEAR FROM e.fecha_ingreso) = %s"
-        params = [anio]
-        
-        if mes:
-            filtro_fecha += " AND EXTRACT(MONTH FROM e.fecha_ingreso) = %s"
-            params.append(mes)
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'error': 'Error de conexión'}), 500
         
-        filtro_categoria = ""
-        if categoria:
-            filtro_categoria = " AND s.categoria LIKE %s"
-            params.append(f'%{categoria}%')
+        # Cursor con nombre: las filas quedan en el servidor y se traen de a lotes
+        cursor = conn.cursor(name='informe_mensual_excel')
+        cursor.itersize = EXCEL_LOTE
         
         # Obtener todos los equipos del período
         cursor.execute(f"""
@@ -1144,81 +1255,140 @@ def api_informe_mensual_excel():
                 COALESCE(s.comercial_syemed, s.solicitante) as comercial
             FROM equipos e
             LEFT JOIN solicitudes s ON e.solicitud_id = s.id
-            WHERE {filtro_fecha} {filtro_categoria}
-            AND e.eliminado = FALSE
+            WHERE {filtro}
             ORDER BY e.fecha_ingreso DESC
         """, params)
         
-        equipos = cursor.fetchall()
+        filename = f"informe_mensual_{anio}"
+        if mes:
+            filename += f"_{mes:02d}"
+        
+        if formato == 'csv':
+            # La conexión queda tomada mientras se envía; stream_with_context demora el
+            # teardown (que la devolvería al pool) hasta que termina el generador
+            def filas_csv():
+                try:
+                    yield from generar_csv_streaming(iterar_en_lotes(cursor))
+                finally:
+                    cursor.close()
+                    conn.close()
+            
+            return Response(
+                stream_with_context(filas_csv()),
+                mimetype='text/csv',
+                headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+            )
+        
+        with duracion_excel.time():
+            tamano, chunks = generar_excel_en_archivo(iterar_en_lotes(cursor))
         
         cursor.close()
         conn.close()
         
-        # Crear Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Informe Mensual"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="1E4D7B", end_color="1E4D7B", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        
-        # Headers
-        headers = ['OST', 'Cliente', 'Estado', 'Fecha Ingreso', 'Tipo Equipo', 
-                  'Marca', 'Modelo', 'Categoría', 'Comercial']
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Datos
-        for row_idx, equipo in enumerate(equipos, 2):
-            ws.cell(row=row_idx, column=1, value=equipo['ost'])
-            ws.cell(row=row_idx, column=2, value=equipo['cliente'])
-            ws.cell(row=row_idx, column=3, value=equipo['estado'])
-            ws.cell(row=row_idx, column=4, value=equipo['fecha_ingreso'])
-            ws.cell(row=row_idx, column=5, value=equipo['tipo_equipo'])
-            ws.cell(row=row_idx, column=6, value=equipo['marca'])
-            ws.cell(row=row_idx, column=7, value=equipo['modelo'])
-            ws.cell(row=row_idx, column=8, value=equipo['categoria'])
-            ws.cell(row=row_idx, column=9, value=equipo['comercial'])
-        
-        # Ajustar anchos
-        ws.column_dimensions['A'].width = 10
-        ws.column_dimensions['B'].width = 30
-        ws.column_dimensions['C'].width = 20
-        ws.column_dimensions['D'].width = 15
-        ws.column_dimensions['E'].width = 25
-        ws.column_dimensions['F'].width = 20
-        ws.column_dimensions['G'].width = 20
-        ws.column_dimensions['H'].width = 15
-        ws.column_dimensions['I'].width = 25
-        
-        # Guardar en memoria
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        filename = f"informe_mensual_{anio}"
-        if mes:
-            filename += f"_{mes:02d}"
         filename += ".xlsx"
         
-        return send_file(
-            output,
+        return Response(
+            chunks,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Content-Length': str(tamano)
+            }
         )
         
     except ImportError:
         return jsonify({'error': 'openpyxl no está instalado. Ejecuta: pip install openpyxl'}), 500
     except Exception as e:
         print(f"Error al exportar Excel: {e}")
+        if conn:
+            conn.close()
         return jsonify({'error': str(e)}), 500
 
+# ============================================
+# COMANDOS DE MANTENIMIENTO (flask <comando>)
+# ============================================
+
+@app.cli.command('migrar')
+def comando_migrar():
+    """Aplica las migraciones pendientes de migrations/"""
+    with conexion() as conn:
+        nuevas = aplicar_migraciones(conn)
+    if nuevas:
+        for migracion in nuevas:
+            print(f"✅ Migración aplicada: {migracion}")
+    else:
+        print("La base de datos ya está al día")
+
+@app.cli.command('reconstruir-resumen')
+def comando_reconstruir_resumen():
+    """Regenera equipos_resumen_mensual desde cero"""
+    with conexion() as conn:
+        filas = reconstruir_resumen(conn)
+    print(f"✅ Resumen mensual reconstruido ({filas} filas)")
+
+@app.cli.command('reconstruir-priorizados')
+@click.option('--si-vencido', is_flag=True, help='Solo si hay filas calculadas otro día (cron diario)')
+def comando_reconstruir_priorizados(si_vencido):
+    """Regenera equipos_priorizados_materializada desde la vista equipos_priorizados"""
+    with conexion() as conn:
+        if si_vencido:
+            if not actualizar_si_vencido(conn):
+                print("Equipos priorizados al día (o regenerándose en otro proceso)")
+                return
+            print("✅ Equipos priorizados reconstruidos")
+            return
+        filas = reconstruir_priorizados(conn)
+    print(f"✅ Equipos priorizados reconstruidos ({filas} filas)")
+
+@app.cli.command('consultas-lentas')
+@click.option('--top', default=20, show_default=True, help='Cantidad de huellas a mostrar')
+@click.option('--archivo', default=None, help='Log a resumir (por defecto los de todos los procesos)')
+def comando_consultas_lentas(top, archivo):
+    """Resume el log de consultas lentas: huellas con más tiempo total primero"""
+    resumenes = resumir_consultas_lentas(archivo, top)
+    if not resumenes:
+        print("No hay consultas lentas registradas")
+        return
+    for posicion, resumen in enumerate(resumenes, 1):
+        print(
+            f"{posicion:>3}. [{resumen['huella']}] total {resumen['total_ms']:.0f} ms | "
+            f"{resumen['cantidad']} veces | promedio {resumen['promedio_ms']:.0f} ms | "
+            f"máx {resumen['max_ms']:.0f} ms | {resumen['filas']} filas"
+        )
+        if resumen['endpoints']:
+            print(f"     endpoints: {', '.join(resumen['endpoints'])}")
+        print(f"     {resumen['consulta'][:300]}")
+
+@app.cli.command('particiones-auditoria')
+@click.option('--meses-adelante', default=3, show_default=True, help='Meses futuros con partición creada')
+@click.option('--archivar-antes-de', default=None, help='Archiva los meses anteriores a AAAA-MM')
+@click.option('--destino', default=None,
+              help='Directorio de los .csv.gz (obligatorio al archivar; fuera del disco efímero de la instancia)')
+@click.option('--eliminar', is_flag=True,
+              help='Además de separar las particiones archivadas, las borra de la base (DROP)')
+def comando_particiones_auditoria(meses_adelante, archivar_antes_de, destino, eliminar):
+    """Crea las particiones mensuales futuras de la auditoría y archiva las viejas"""
+    antes_de = None
+    if archivar_antes_de:
+        try:
+            antes_de = datetime.strptime(archivar_antes_de, '%Y-%m').date()
+        except ValueError:
+            raise click.BadParameter('Formato esperado: AAAA-MM', param_hint='--archivar-antes-de')
+        if not destino:
+            raise click.UsageError('--archivar-antes-de requiere --destino (un directorio persistente)')
+    elif eliminar:
+        raise click.UsageError('--eliminar solo se usa junto con --archivar-antes-de')
+
+    with conexion() as conn:
+        for nombre in crear_particiones_futuras(conn, meses_adelante):
+            print(f"✅ Partición creada: {nombre}")
+        if antes_de:
+            for ruta in archivar_particiones(conn, antes_de, destino, borrar=eliminar):
+                print(f"📦 Partición archivada: {ruta}")
+            if not eliminar:
+                print("ℹ️ Las particiones archivadas siguen en la base (sin adjuntar); "
+                      "usa --eliminar después de copiar los archivos a un lugar seguro")
+
 # ============================================
 # CONTEXT PROCESSOR PARA TEMPLATES
 # ============================================
@@ -0,0 +1,79 @@
+"""
+Asignación de números de OST (ver migrations/007)
+Los números salen de una secuencia: nunca se entrega dos veces el mismo, aunque varios
+técnicos den de alta equipos a la vez. El diálogo de alta reserva su número y lo confirma
+al crear el equipo; las reservas vencidas o liberadas se reutilizan antes de pedir uno nuevo.
+"""
+
+import os
+
+SECUENCIA_OST = 'equipos_ost_asignacion_seq'
+
+OST_RESERVA_MINUTOS = int(os.getenv('OST_RESERVA_MINUTOS', '30'))
+
+
+def consultar_proximo_ost(cursor):
+    """Próximo número de la secuencia sin consumirlo (lectura O(1), solo informativa)"""
+    cursor.execute(f"""
+        SELECT CASE WHEN is_called THEN last_value + 1 ELSE last_value END as proximo_ost
+        FROM {SECUENCIA_OST}
+    """)
+    return cursor.fetchone()['proximo_ost']
+
+
+def reservar_ost(cursor, usuario_id):
+    """Reserva un número para el usuario; devuelve (ost, vence_en)
+
+    Primero toma una reserva vencida (SKIP LOCKED: dos pedidos simultáneos no se
+    bloquean ni reciben la misma) y si no hay, un número nuevo de la secuencia.
+    """
+    cursor.execute("""
+        UPDATE ost_reservas
+        SET usuario_id = %(usuario_id)s,
+            reservado_en = NOW(),
+            vence_en = NOW() + make_interval(mins => %(minutos)s)
+        WHERE ost = (
+            SELECT ost FROM ost_reservas
+            WHERE vence_en < NOW()
+            ORDER BY vence_en, ost
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING ost, vence_en
+    """, {'usuario_id': usuario_id, 'minutos': OST_RESERVA_MINUTOS})
+    reserva = cursor.fetchone()
+    if reserva:
+        return reserva['ost'], reserva['vence_en']
+
+    cursor.execute(f"""
+        INSERT INTO ost_reservas (ost, usuario_id, vence_en)
+        VALUES (nextval('{SECUENCIA_OST}'), %s, NOW() + make_interval(mins => %s))
+        RETURNING ost, vence_en
+    """, (usuario_id, OST_RESERVA_MINUTOS))
+    reserva = cursor.fetchone()
+    return reserva['ost'], reserva['vence_en']
+
+
+def confirmar_reserva(cursor, ost, usuario_id):
+    """Consume la reserva al crear el equipo; ValueError si no es del usuario
+
+    Una reserva vencida todavía se puede confirmar mientras nadie la haya retomado.
+    """
+    cursor.execute("""
+        DELETE FROM ost_reservas
+        WHERE ost = %s AND usuario_id = %s
+        RETURNING ost
+    """, (ost, usuario_id))
+    if not cursor.fetchone():
+        raise ValueError(f"La OST {ost} no está reservada por este usuario. Vuelve a abrir el alta del equipo")
+
+
+def liberar_reserva(cursor, ost, usuario_id):
+    """Devuelve el número (diálogo cancelado): queda vencido para la próxima reserva"""
+    cursor.execute("""
+        UPDATE ost_reservas
+        SET vence_en = NOW()
+        WHERE ost = %s AND usuario_id = %s
+        RETURNING ost
+    """, (ost, usuario_id))
+    return cursor.fetchone() is not None
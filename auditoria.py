@@ -0,0 +1,448 @@
+"""
+Registro de cambios para la auditoría de equipos
+Acumula las diferencias de una operación y las escribe en equipos_auditoria con un solo INSERT multi-fila.
+
+Modo de escritura (AUDITORIA_MODO):
+- sincrono (por defecto, estricto): la auditoría se inserta dentro de la transacción del cambio
+  y si falla el cambio tampoco se confirma
+- asincrono: al confirmar la transacción las entradas pasan a una cola acotada que un hilo
+  escribe en lotes; si la base no está disponible se guardan en un archivo y se reintentan después.
+  Las líneas del archivo que la base rechaza por sus datos pasan a <archivo>.rechazados
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos del archivo de pendientes
+    fcntl = None
+
+from db import conexion, conexion_prestada
+
+AUDITORIA_MODO = os.getenv('AUDITORIA_MODO', 'sincrono')
+AUDITORIA_COLA_MAX = int(os.getenv('AUDITORIA_COLA_MAX', '10000'))
+AUDITORIA_LOTE = int(os.getenv('AUDITORIA_LOTE', '500'))
+AUDITORIA_REINTENTO = float(os.getenv('AUDITORIA_REINTENTO', '30'))
+AUDITORIA_ARCHIVO = os.getenv(
+    'AUDITORIA_ARCHIVO', os.path.join(tempfile.gettempdir(), 'auditoria_pendiente.jsonl')
+)
+
+COLUMNAS_AUDITORIA = (
+    'equipo_id', 'usuario_id', 'usuario_nombre', 'campo_modificado',
+    'valor_anterior', 'valor_nuevo', 'accion'
+)
+
+PLANTILLA_FILA = '(%s, %s, %s, %s, %s, %s, %s)'
+
+# En modo asíncrono la fecha del cambio se fija al confirmar, no al insertar
+PLANTILLA_FILA_FECHA = '(%s, %s, %s, %s, %s, %s, %s, %s::timestamptz)'
+
+logger = logging.getLogger('auditoria')
+
+
+def formatear_valor(valor):
+    """Mismo formato que registrar_auditoria: texto, o '' si está vacío"""
+    return str(valor) if valor else ''
+
+
+def insertar_entradas(cursor, entradas):
+    """INSERT multi-fila de entradas con fecha (modo asíncrono)"""
+    columnas = ', '.join(COLUMNAS_AUDITORIA + ('fecha_cambio',))
+    execute_values(
+        cursor,
+        f"INSERT INTO equipos_auditoria ({columnas}) VALUES %s",
+        entradas,
+        template=PLANTILLA_FILA_FECHA,
+        page_size=max(1, len(entradas))
+    )
+
+
+def _bloquear(archivo):
+    """Bloqueo exclusivo entre procesos (se libera al cerrar el archivo)"""
+    if fcntl is not None:
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+
+
+def _mismo_archivo(archivo, ruta):
+    """True si el archivo abierto sigue siendo el que está en la ruta (no lo renombró otro proceso)"""
+    try:
+        return os.fstat(archivo.fileno()).st_ino == os.stat(ruta).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _proceso_vivo(ruta):
+    """True si el proceso que tomó el archivo <archivo>.<pid>.reproduciendo sigue corriendo"""
+    try:
+        pid = int(ruta.rsplit('.', 2)[-2])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ColaAuditoria:
+    """Cola acotada en memoria con un hilo escritor por proceso
+
+    Nada se descarta: si la cola está llena o la base falla, las entradas van al archivo
+    AUDITORIA_ARCHIVO (una por línea) y se reinsertan, en su propia transacción, antes del
+    siguiente lote. Las que la base rechaza por sus datos quedan en <archivo>.rechazados.
+    """
+
+    def __init__(self, maximo=AUDITORIA_COLA_MAX, lote=AUDITORIA_LOTE, archivo=AUDITORIA_ARCHIVO):
+        self.lote = lote
+        self.archivo = archivo
+        self.archivo_rechazados = f'{archivo}.rechazados'
+        self._cola = queue.Queue(maxsize=maximo)
+        self._lock = threading.Lock()
+        self._lock_escritura = threading.Lock()
+        self._hilo = None
+        self._pid = None
+        self.encoladas = 0
+        self.escritas = 0
+        self.derramadas = 0
+        self.reproducidas = 0
+        self.rechazadas = 0
+        # Líneas que este proceso dejó en el archivo y todavía no se reinsertaron
+        self.pendientes_archivo = 0
+        self.errores = 0
+        self.flushes = 0
+        self.flush_ms_total = 0.0
+        self.flush_ms_max = 0.0
+        self.flush_ms_ultimo = 0.0
+
+    def _asegurar_hilo(self):
+        """Arranca el hilo escritor (de nuevo en cada proceso hijo después de un fork)"""
+        pid = os.getpid()
+        if self._hilo is not None and self._pid == pid and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or self._pid != pid or not self._hilo.is_alive():
+                if self._pid != pid:
+                    self._cola = queue.Queue(maxsize=self._cola.maxsize)
+                self._pid = pid
+                self._hilo = threading.Thread(target=self._escritor, name='auditoria', daemon=True)
+                self._hilo.start()
+
+    def encolar(self, entradas):
+        self._asegurar_hilo()
+        desbordadas = []
+        for entrada in entradas:
+            try:
+                self._cola.put_nowait(entrada)
+            except queue.Full:
+                desbordadas.append(entrada)
+        with self._lock:
+            self.encoladas += len(entradas) - len(desbordadas)
+        if desbordadas:
+            self._derramar(desbordadas)
+
+    def _tomar_lote(self, bloquear=True, timeout=None):
+        try:
+            lote = [self._cola.get(block=bloquear, timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(lote) < self.lote:
+            try:
+                lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _hay_pendientes(self):
+        return os.path.exists(self.archivo) or bool(
+            glob.glob(f'{glob.escape(self.archivo)}.*.reproduciendo')
+        )
+
+    def _escritor(self):
+        while True:
+            lote = self._tomar_lote(timeout=AUDITORIA_REINTENTO)
+            if not lote:
+                # Sin cambios nuevos: reintentar periódicamente lo que quedó en el archivo
+                if self._hay_pendientes():
+                    self._escribir([])
+                continue
+            try:
+                self._escribir(lote)
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+    def _escribir(self, lote):
+        inicio = time.perf_counter()
+        try:
+            with self._lock_escritura, conexion() as conn:
+                # Los pendientes van en su propia transacción: si fallan no arrastran al lote nuevo
+                try:
+                    self._reproducir(conn)
+                except Exception as e:
+                    logger.error(f"No se pudieron reinsertar los pendientes de {self.archivo}: {e}")
+                    with self._lock:
+                        self.errores += 1
+                if lote:
+                    cursor = conn.cursor()
+                    insertar_entradas(cursor, lote)
+                    conn.commit()
+                    cursor.close()
+        except Exception as e:
+            logger.error(f"Error al escribir auditoría, se guarda en {self.archivo}: {e}")
+            with self._lock:
+                self.errores += 1
+            self._derramar(lote)
+            return
+
+        if not lote:
+            return
+        duracion = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.escritas += len(lote)
+            self.flushes += 1
+            self.flush_ms_ultimo = duracion
+            self.flush_ms_total += duracion
+            self.flush_ms_max = max(self.flush_ms_max, duracion)
+
+    def _derramar(self, entradas):
+        """Agrega las entradas al archivo de pendientes (append-only, una línea JSON por entrada)"""
+        if not entradas:
+            return
+        lineas = ''.join(json.dumps(list(entrada), default=str) + '\n' for entrada in entradas)
+        with self._lock:
+            while True:
+                with open(self.archivo, 'a', encoding='utf-8') as f:
+                    _bloquear(f)
+                    if not _mismo_archivo(f, self.archivo):
+                        # Otro proceso lo tomó para reinsertarlo: abrir el archivo nuevo
+                        continue
+                    f.write(lineas)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    break
+            self.derramadas += len(entradas)
+            self.pendientes_archivo += len(entradas)
+
+    def _reproducir(self, conn):
+        """Reinserta los pendientes del archivo (incluidos los que otro proceso dejó a medias)
+
+        Cada archivo se confirma en una transacción aparte. Un lote que la base rechaza por sus
+        datos se reintenta línea por línea y las que siguen fallando van a archivo_rechazados;
+        si se cae la conexión el archivo queda tomado y se reintenta completo la próxima vez.
+        """
+        propio = f'{self.archivo}.{os.getpid()}.reproduciendo'
+        # Primero el propio: un rename sobre él lo pisaría
+        candidatos = [propio] + [
+            ruta for ruta in glob.glob(f'{glob.escape(self.archivo)}.*.reproduciendo')
+            if ruta != propio and not _proceso_vivo(ruta)
+        ] + [self.archivo]
+
+        for candidato in candidatos:
+            try:
+                if candidato != propio:
+                    # El rename es atómico: solo un proceso se queda con cada archivo
+                    os.rename(candidato, propio)
+                f = open(propio, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+
+            with f:
+                # Espera a que terminen los procesos que estaban escribiendo en él
+                _bloquear(f)
+                entradas = []
+                rechazadas = []
+                for linea in f:
+                    if not linea.strip():
+                        continue
+                    try:
+                        entradas.append(tuple(json.loads(linea)))
+                    except ValueError as e:
+                        rechazadas.append((linea.rstrip('\n'), f"JSON inválido: {e}"))
+                lineas = len(entradas) + len(rechazadas)
+
+                cursor = conn.cursor()
+                try:
+                    for i in range(0, len(entradas), self.lote):
+                        rechazadas.extend(self._insertar_separando(cursor, entradas[i:i + self.lote]))
+                    # Antes del commit: si el commit falla, el reintento solo duplica la cuarentena
+                    self._rechazar(rechazadas)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                os.remove(propio)
+
+            with self._lock:
+                self.reproducidas += lineas - len(rechazadas)
+                self.rechazadas += len(rechazadas)
+                self.pendientes_archivo = max(0, self.pendientes_archivo - lineas)
+
+    def _insertar_separando(self, cursor, entradas):
+        """Inserta entradas bajo un savepoint; si la base las rechaza, de a una. Devuelve [(entrada, error)]"""
+        cursor.execute("SAVEPOINT reproduccion_auditoria")
+        try:
+            insertar_entradas(cursor, entradas)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            raise
+        except (psycopg2.DataError, psycopg2.IntegrityError, IndexError, TypeError, ValueError) as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT reproduccion_auditoria")
+            if len(entradas) == 1:
+                return [(list(entradas[0]), str(e).strip())]
+            rechazadas = []
+            for entrada in entradas:
+                rechazadas.extend(self._insertar_separando(cursor, [entrada]))
+            return rechazadas
+        cursor.execute("RELEASE SAVEPOINT reproduccion_auditoria")
+        return []
+
+    def _rechazar(self, rechazadas):
+        """Pasa a archivo_rechazados (una línea JSON con la entrada y el error) lo que no se pudo insertar"""
+        if not rechazadas:
+            return
+        with open(self.archivo_rechazados, 'a', encoding='utf-8') as f:
+            _bloquear(f)
+            for entrada, error in rechazadas:
+                f.write(json.dumps({'entrada': entrada, 'error': error}, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        logger.error(
+            f"{len(rechazadas)} entradas de auditoría rechazadas por la base, "
+            f"guardadas en {self.archivo_rechazados}"
+        )
+        for entrada, error in rechazadas:
+            logger.error(f"Auditoría rechazada {entrada}: {error}")
+
+    def vaciar(self):
+        """Escribe lo que quede en la cola desde el hilo actual (al terminar el proceso)"""
+        if self._pid != os.getpid():
+            return
+        while True:
+            lote = self._tomar_lote(bloquear=False)
+            if not lote:
+                break
+            self._escribir(lote)
+            for _ in lote:
+                self._cola.task_done()
+
+    def profundidad(self):
+        """Entradas esperando en la cola (sin leer el archivo de pendientes)"""
+        return self._cola.qsize()
+
+    def estadisticas(self):
+        """Métricas del proceso actual (pendientes_archivo cuenta lo que derramó este proceso, sin leer el archivo)"""
+        with self._lock:
+            return {
+                'modo': AUDITORIA_MODO,
+                'profundidad_cola': self._cola.qsize(),
+                'capacidad_cola': self._cola.maxsize,
+                'encoladas': self.encoladas,
+                'escritas': self.escritas,
+                'derramadas': self.derramadas,
+                'reproducidas': self.reproducidas,
+                'rechazadas': self.rechazadas,
+                'pendientes_archivo': self.pendientes_archivo,
+                'errores': self.errores,
+                'flushes': self.flushes,
+                'flush_ms_ultimo': round(self.flush_ms_ultimo, 2),
+                'flush_ms_promedio': round(self.flush_ms_total / self.flushes, 2) if self.flushes else 0.0,
+                'flush_ms_max': round(self.flush_ms_max, 2)
+            }
+
+
+cola_auditoria = ColaAuditoria()
+atexit.register(cola_auditoria.vaciar)
+
+
+class RegistroCambios:
+    """Change-set de auditoría de un usuario: se llena con registrar() y se escribe con guardar()"""
+
+    def __init__(self, usuario_id, usuario_nombre):
+        self.usuario_id = usuario_id
+        self.usuario_nombre = usuario_nombre
+        self.entradas = []
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def registrar(self, equipo_id, campo, valor_anterior, valor_nuevo, accion='UPDATE'):
+        self.entradas.append((
+            equipo_id, self.usuario_id, self.usuario_nombre, campo,
+            formatear_valor(valor_anterior), formatear_valor(valor_nuevo), accion
+        ))
+
+    def _encolar_al_confirmar(self, cursor):
+        """Modo asíncrono: las entradas se encolan solo si la transacción se confirma"""
+        prestada = conexion_prestada(cursor.connection)
+        if prestada is None:
+            raise RuntimeError("La auditoría asíncrona requiere una conexión del pool")
+        entradas = self.entradas
+
+        def encolar():
+            fecha = datetime.now(timezone.utc)
+            cola_auditoria.encolar([entrada + (fecha,) for entrada in entradas])
+
+        prestada.al_confirmar(encolar)
+
+    def guardar(self, cursor, sentencia=None, params=None):
+        """Inserta todas las entradas en un round trip
+
+        Si se pasa una sentencia (UPDATE/INSERT/DELETE con RETURNING), se ejecuta en el mismo
+        statement como CTE y la auditoría solo se escribe si la sentencia afectó alguna fila.
+        Devuelve las filas de RETURNING de la sentencia (o [] si no hay sentencia).
+        Los valores anteriores registrados deben venir de una lectura con FOR UPDATE de las
+        mismas filas, para que dos ediciones simultáneas no auditen el mismo valor anterior.
+        En modo asíncrono solo se ejecuta la sentencia y las entradas se encolan tras el commit.
+        """
+        columnas = ', '.join(COLUMNAS_AUDITORIA)
+
+        if AUDITORIA_MODO == 'asincrono':
+            filas = []
+            if sentencia is not None:
+                cursor.execute(sentencia, params)
+                filas = cursor.fetchall() if cursor.description else []
+            if self.entradas and (sentencia is None or filas):
+                self._encolar_al_confirmar(cursor)
+            self.entradas = []
+            return filas
+
+        if sentencia is None:
+            if self.entradas:
+                execute_values(
+                    cursor,
+                    f"INSERT INTO equipos_auditoria ({columnas}) VALUES %s",
+                    self.entradas,
+                    template=PLANTILLA_FILA,
+                    page_size=len(self.entradas)
+                )
+            self.entradas = []
+            return []
+
+        if not self.entradas:
+            cursor.execute(sentencia, params)
+            return cursor.fetchall() if cursor.description else []
+
+        valores = b', '.join(cursor.mogrify(PLANTILLA_FILA, fila) for fila in self.entradas)
+        consulta = b''.join([
+            b'WITH cambios AS (', cursor.mogrify(sentencia, params), b'), ',
+            b'auditoria AS (INSERT INTO equipos_auditoria (', columnas.encode(), b') ',
+            b'SELECT v.equipo_id::integer, v.usuario_id::integer, v.usuario_nombre, v.campo_modificado, ',
+            b'v.valor_anterior, v.valor_nuevo, v.accion FROM (VALUES ', valores, b') AS v(', columnas.encode(), b') ',
+            b'WHERE EXISTS (SELECT 1 FROM cambios)) ',
+            b'SELECT * FROM cambios'
+        ])
+        cursor.execute(consulta)
+        self.entradas = []
+        return cursor.fetchall()
@@ -7,13 +7,30 @@ from flask_login import LoginManager, UserMixin, login_user, logout_user, login_
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from flask import redirect, url_for, flash
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
+import psycopg2
+
+from cache import CacheTTL, BackendMemoria, CACHE_BACKEND
+from db import obtener_conexion
 
 # Configuración de Flask-Login
 login_manager = LoginManager()
 
+# Cache de usuarios para load_user. Con un backend compartido (archivo, redis) invalidar_usuario
+# llega a todos los workers; en memoria solo al que atendió el cambio, así que un cambio de rol
+# o una baja se ven en los demás recién al vencer el TTL: por eso el TTL local es de segundos.
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+USER_CACHE_TTL_PROCESO = int(os.getenv('USER_CACHE_TTL_PROCESO', '5'))
+USER_CACHE_MAX = int(os.getenv('USER_CACHE_MAX', '1000'))
+
+if CACHE_BACKEND == 'memoria':
+    cache_usuarios = CacheTTL(
+        'usuarios', min(USER_CACHE_TTL, USER_CACHE_TTL_PROCESO),
+        backend=BackendMemoria(max_entradas=USER_CACHE_MAX)
+    )
+else:
+    cache_usuarios = CacheTTL('usuarios', USER_CACHE_TTL)
+
 # Roles disponibles con sus permisos
 ROLES = {
     'viewer': {
@@ -52,31 +69,30 @@ class User(UserMixin):
 
 
 def get_db_connection():
-    """Obtiene conexión a la base de datos"""
-    DATABASE_URL = os.getenv('DATABASE_URL')
-    
-    # Limpiar la URL
-    db_url_clean = DATABASE_URL.replace('&channel_binding=require', '')
-    
-    # Agregar parámetros SSL para Neon
-    conn = psycopg2.connect(
-        db_url_clean,
-        cursor_factory=RealDictCursor,
-        sslmode='require',
-        connect_timeout=10
-    )
-    return conn
+    """Obtiene conexión a la base de datos (pool compartido con app.py)"""
+    return obtener_conexion()
+
+
+def invalidar_usuario(user_id):
+    """Descarta el usuario de la cache: el próximo request lo vuelve a leer de la base"""
+    cache_usuarios.invalidar(str(user_id))
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Carga un usuario desde la base de datos"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, username, email, role FROM usuarios WHERE id = %s", (user_id,))
-    user_data = cur.fetchone()
-    cur.close()
-    conn.close()
+    """Carga un usuario (desde la cache o, si no está, desde la base de datos)"""
+    user_data = cache_usuarios.get(str(user_id))
+    
+    if user_data is None:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT id, username, email, role FROM usuarios WHERE id = %s", (user_id,))
+        user_data = cur.fetchone()
+        cur.close()
+        conn.close()
+        
+        if user_data:
+            cache_usuarios.set(str(user_id), dict(user_data))
     
     if user_data:
         return User(user_data['id'], user_data['username'], user_data['email'], user_data['role'])
@@ -140,6 +156,7 @@ def update_user_password(user_id, new_password):
     conn.commit()
     cur.close()
     conn.close()
+    invalidar_usuario(user_id)
 
 
 def permission_required(permission):
@@ -194,6 +211,7 @@ def toggle_user_status(user_id):
     conn.commit()
     cur.close()
     conn.close()
+    invalidar_usuario(user_id)
 
 
 def update_user_role(user_id, new_role):
@@ -207,6 +225,7 @@ def update_user_role(user_id, new_role):
     conn.commit()
     cur.close()
     conn.close()
+    invalidar_usuario(user_id)
 
 
 def update_last_login(user_id):
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: render de la columna Fotos de la grilla de equipos
+Compara el filtrado con selectattr (O(N×M)) contra el índice por equipo (agrupar_adjuntos)
+
+Ejecutar: python benchmark_adjuntos.py [equipos] [adjuntos]
+"""
+
+import random
+import sys
+import time
+
+from jinja2 import Environment
+
+from equipos_grid import agrupar_adjuntos
+
+PLANTILLA_SELECTATTR = """
+{%- for equipo in equipos -%}
+{% set fotos = archivos|selectattr('numero_serie', 'equalto', equipo.numero_serie)|selectattr('categoria', 'equalto', 'falla')|list %}
+{% set facturas = archivos|selectattr('numero_serie', 'equalto', equipo.numero_serie)|selectattr('categoria', 'equalto', 'factura')|list %}
+{{ fotos|length }}/{{ facturas|length }}
+{%- endfor -%}
+"""
+
+PLANTILLA_INDICE = """
+{%- for equipo in equipos -%}
+{% set adjuntos = adjuntos_por_equipo.get(equipo.id, {}) %}
+{% set fotos = adjuntos.get('falla', []) %}
+{% set facturas = adjuntos.get('factura', []) %}
+{{ fotos|length }}/{{ facturas|length }}
+{%- endfor -%}
+"""
+
+
+def generar_datos(num_equipos, num_adjuntos):
+    """Equipos con número de serie y adjuntos repartidos al azar entre ellos"""
+    random.seed(42)
+    equipos = [{'id': i, 'numero_serie': f'SN-{i:06d}'} for i in range(1, num_equipos + 1)]
+    archivos = [
+        {
+            'numero_serie': random.choice(equipos)['numero_serie'],
+            'categoria': random.choice(['falla', 'factura']),
+            'url_cloudinary': f'https://example.invalid/{i}.jpg'
+        }
+        for i in range(num_adjuntos)
+    ]
+    return equipos, archivos
+
+
+def medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    num_equipos = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    num_adjuntos = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    equipos, archivos = generar_datos(num_equipos, num_adjuntos)
+    env = Environment()
+
+    t_selectattr, salida_selectattr = medir(
+        lambda: env.from_string(PLANTILLA_SELECTATTR).render(equipos=equipos, archivos=archivos)
+    )
+    t_indice, salida_indice = medir(
+        lambda: env.from_string(PLANTILLA_INDICE).render(
+            equipos=equipos, adjuntos_por_equipo=agrupar_adjuntos(equipos, archivos)
+        )
+    )
+
+    print(f"Equipos: {num_equipos}  Adjuntos: {num_adjuntos}")
+    print(f"selectattr (O(N×M)):   {t_selectattr * 1000:10.1f} ms")
+    print(f"índice por equipo:     {t_indice * 1000:10.1f} ms")
+    print(f"Mejora:                {t_selectattr / t_indice:10.1f}x")
+    print(f"Salida idéntica:       {salida_selectattr.split() == salida_indice.split()}")
+
+
+if __name__ == '__main__':
+    main()
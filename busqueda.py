@@ -0,0 +1,126 @@
+"""
+Búsqueda de equipos y solicitudes
+Combina tsvector (prefijos, ranking por pesos) con pg_trgm (parciales y errores de tipeo); ver migrations/005
+"""
+
+import html
+import re
+
+from paginacion import codificar_cursor, decodificar_cursor, condicion_keyset, parsear_limite
+
+LIMITE_POR_DEFECTO = 20
+LARGO_MINIMO = 2
+
+# Marcadores de ts_headline: se escapa el texto y recién después se convierten en <mark>
+INICIO_MARCA = '\x02'
+FIN_MARCA = '\x03'
+OPCIONES_HEADLINE = f'StartSel={INICIO_MARCA}, StopSel={FIN_MARCA}, MaxFragments=2, MaxWords=12, MinWords=4'
+
+FUENTES = {
+    'equipos': {
+        'tabla': 'equipos',
+        'columnas': """id, ost, cliente, numero_serie, marca, modelo, estado, fecha_ingreso, solicitud_id""",
+        'condicion': 'eliminado = FALSE',
+        'texto_resaltado': """COALESCE(ost::text, '') || ' · ' || COALESCE(numero_serie, '') || ' · ' ||
+            COALESCE(cliente, '') || ' · ' || COALESCE(marca, '') || ' ' || COALESCE(modelo, '')""",
+    },
+    'solicitudes': {
+        'tabla': 'solicitudes',
+        'columnas': """id, fecha_solicitud, estado, categoria, razon_social, nombre_fantasia,
+            nombre_apellido_paciente, cuit""",
+        'condicion': 'TRUE',
+        'texto_resaltado': """COALESCE(cuit, '') || ' · ' || COALESCE(razon_social, '') || ' · ' ||
+            COALESCE(nombre_fantasia, '') || ' · ' || COALESCE(nombre_apellido_paciente, '')""",
+    },
+}
+
+
+def construir_tsquery(texto):
+    """Texto libre -> tsquery de prefijos ('hosp:* & 1234:*'); None si no hay términos"""
+    terminos = re.findall(r'\w+', texto.lower())
+    if not terminos:
+        return None
+    return ' & '.join(f'{termino}:*' for termino in terminos)
+
+
+def resaltar(fragmento):
+    """Escapa el fragmento de ts_headline y marca las coincidencias con <mark>"""
+    if not fragmento:
+        return ''
+    return html.escape(fragmento).replace(INICIO_MARCA, '<mark>').replace(FIN_MARCA, '</mark>')
+
+
+def buscar(conn, args):
+    """Resultados rankeados de una fuente, con resaltado y cursor para la página siguiente"""
+    texto = (args.get('q') or '').strip()
+    if len(texto) < LARGO_MINIMO:
+        raise ValueError(f"La búsqueda debe tener al menos {LARGO_MINIMO} caracteres")
+
+    tipo = args.get('tipo', 'equipos')
+    if tipo not in FUENTES:
+        raise ValueError(f"Tipo de búsqueda inválido. Debe ser uno de: {', '.join(FUENTES.keys())}")
+    fuente = FUENTES[tipo]
+
+    limite = parsear_limite(args.get('limite'), por_defecto=LIMITE_POR_DEFECTO, maximo=100)
+    tsquery = construir_tsquery(texto)
+
+    # Sin términos alfanuméricos solo se busca por trigramas
+    coincide_fts = "busqueda @@ to_tsquery('simple', %(tsquery)s)" if tsquery else 'FALSE'
+    rank_fts = "ts_rank(busqueda, to_tsquery('simple', %(tsquery)s))" if tsquery else '0'
+
+    params = {'tsquery': tsquery, 'texto': texto, 'limite': limite + 1}
+    condicion_pagina = 'TRUE'
+    cursor_pagina = args.get('cursor')
+    if cursor_pagina:
+        valor, ultimo_id = decodificar_cursor(cursor_pagina)
+        condicion_pagina, params_cursor = condicion_keyset(
+            't.rank', 't.id', 'DESC', valor, ultimo_id, admite_nulos=False, nombre='cursor'
+        )
+        params.update(params_cursor)
+
+    # El resaltado (ts_headline es caro) se calcula solo sobre las filas de la página
+    consulta = f"""
+        SELECT p.*,
+            ts_headline('simple', p.texto_resaltado,
+                        to_tsquery('simple', COALESCE(%(tsquery)s, '')),
+                        '{OPCIONES_HEADLINE}') as resaltado
+        FROM (
+            SELECT t.*
+            FROM (
+                SELECT {fuente['columnas']},
+                    {fuente['texto_resaltado']} as texto_resaltado,
+                    GREATEST({rank_fts}, word_similarity(%(texto)s, texto_busqueda))::float8 as rank
+                FROM {fuente['tabla']}
+                WHERE {fuente['condicion']}
+                AND ({coincide_fts} OR %(texto)s <%% texto_busqueda)
+            ) t
+            WHERE {condicion_pagina}
+            ORDER BY t.rank DESC, t.id DESC
+            LIMIT %(limite)s
+        ) p
+        ORDER BY p.rank DESC, p.id DESC
+    """
+
+    cursor = conn.cursor()
+    cursor.execute(consulta, params)
+    filas = cursor.fetchall()
+    cursor.close()
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(filas[-1]['rank'], filas[-1]['id'])
+
+    resultados = []
+    for fila in filas:
+        resultado = dict(fila)
+        resultado.pop('texto_resaltado', None)
+        resultado['resaltado'] = resaltar(fila['resaltado'])
+        resultados.append(resultado)
+
+    return {
+        'tipo': tipo,
+        'resultados': resultados,
+        'cursor_siguiente': siguiente,
+        'limite': limite
+    }
@@ -0,0 +1,194 @@
+"""
+Cache con TTL para métricas del dashboard y usuarios autenticados
+Backend configurable: en memoria (por defecto), archivo compartido o Redis
+"""
+
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memoria')
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dashboard_cache'))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+
+class BackendMemoria:
+    """Cache en memoria del proceso (cada worker de gunicorn tiene la suya)
+
+    Con max_entradas se acota el tamaño: al superarlo se descarta la entrada usada hace más tiempo.
+    """
+
+    def __init__(self, max_entradas=None):
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entradas = max_entradas
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.time():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, ttl):
+        with self._lock:
+            self._datos[clave] = (time.time() + ttl, valor)
+            self._datos.move_to_end(clave)
+            if self.max_entradas is not None:
+                while len(self._datos) > self.max_entradas:
+                    self._datos.popitem(last=False)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+
+def _verificar_directorio_privado(directorio):
+    """PermissionError si el directorio no es un directorio propio sin escritura para otros
+
+    Los archivos se leen con pickle: si otro usuario pudiera crear o escribir el directorio
+    (por ejemplo en /tmp) podría ejecutar código en el worker.
+    """
+    estado = os.lstat(directorio)
+    if not stat.S_ISDIR(estado.st_mode):
+        raise PermissionError(f"El directorio de cache {directorio} no es un directorio (¿enlace simbólico?)")
+    if hasattr(os, 'geteuid') and estado.st_uid != os.geteuid():
+        raise PermissionError(f"El directorio de cache {directorio} pertenece a otro usuario")
+    if estado.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"El directorio de cache {directorio} tiene escritura para el grupo u otros")
+
+
+class BackendArchivo:
+    """Cache en un directorio local compartido por todos los workers (privado: 0700 y propio)"""
+
+    def __init__(self, directorio=CACHE_DIR):
+        self.directorio = directorio
+        os.makedirs(directorio, mode=0o700, exist_ok=True)
+        _verificar_directorio_privado(directorio)
+
+    def _ruta(self, clave):
+        nombre = hashlib.sha1(clave.encode('utf-8')).hexdigest()
+        return os.path.join(self.directorio, f'{nombre}.cache')
+
+    def get(self, clave):
+        try:
+            with open(self._ruta(clave), 'rb') as f:
+                expira, valor = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expira < time.time():
+            self.delete(clave)
+            return None
+        return valor
+
+    def set(self, clave, valor, ttl):
+        # Escritura atómica: otro worker nunca lee un archivo a medio escribir
+        fd, temporal = tempfile.mkstemp(dir=self.directorio)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + ttl, valor), f)
+        os.replace(temporal, self._ruta(clave))
+
+    def delete(self, clave):
+        try:
+            os.remove(self._ruta(clave))
+        except FileNotFoundError:
+            pass
+
+
+class BackendRedis:
+    """Cache en Redis (o cualquier servidor compatible); requiere el paquete redis"""
+
+    def __init__(self, url=CACHE_REDIS_URL):
+        import redis
+        self._cliente = redis.Redis.from_url(url)
+
+    def get(self, clave):
+        datos = self._cliente.get(clave)
+        return pickle.loads(datos) if datos is not None else None
+
+    def set(self, clave, valor, ttl):
+        self._cliente.set(clave, pickle.dumps(valor), ex=max(1, int(ttl)))
+
+    def delete(self, clave):
+        self._cliente.delete(clave)
+
+
+BACKENDS = {
+    'memoria': BackendMemoria,
+    'archivo': BackendArchivo,
+    'redis': BackendRedis,
+}
+
+
+def crear_backend(nombre=CACHE_BACKEND):
+    """Instancia el backend configurado"""
+    if nombre not in BACKENDS:
+        raise ValueError(f"Backend de cache inválido. Debe ser uno de: {', '.join(BACKENDS.keys())}")
+    return BACKENDS[nombre]()
+
+
+class CacheTTL:
+    """Cache con TTL sobre un backend intercambiable, con contadores de hits/misses"""
+
+    def __init__(self, nombre, ttl, backend=None):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.backend = backend if backend is not None else crear_backend()
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+        self._lock = threading.Lock()
+
+    def _clave(self, clave):
+        return f'{self.nombre}:{clave}'
+
+    def get(self, clave):
+        """Devuelve el valor cacheado o None si no existe o expiró"""
+        try:
+            valor = self.backend.get(self._clave(clave))
+        except Exception as e:
+            print(f"Error al leer cache {self.nombre}: {e}")
+            valor = None
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return valor
+
+    def set(self, clave, valor):
+        try:
+            self.backend.set(self._clave(clave), valor, self.ttl)
+        except Exception as e:
+            print(f"Error al escribir cache {self.nombre}: {e}")
+
+    def invalidar(self, clave):
+        try:
+            self.backend.delete(self._clave(clave))
+        except Exception as e:
+            print(f"Error al invalidar cache {self.nombre}: {e}")
+        with self._lock:
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        """Contadores del proceso actual"""
+        total = self.hits + self.misses
+        return {
+            'cache': self.nombre,
+            'backend': type(self.backend).__name__,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidaciones': self.invalidaciones,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,192 @@
+"""
+Log de consultas lentas
+Cada statement que supera SLOW_QUERY_MS se guarda como una línea JSON en un archivo rotativo:
+huella normalizada, parámetros redactados, ruta, usuario, duración y filas.
+Cada proceso (worker de gunicorn) escribe y rota su propio archivo, <nombre>.<pid>.jsonl:
+un RotatingFileHandler compartido entre procesos deja a los demás escribiendo en el archivo rotado.
+`flask consultas-lentas` resume los archivos por huella (las que más tiempo total suman primero).
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from logging.handlers import RotatingFileHandler
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_ARCHIVO = os.getenv(
+    'SLOW_QUERY_ARCHIVO', os.path.join(tempfile.gettempdir(), 'consultas_lentas.jsonl')
+)
+SLOW_QUERY_MAX_BYTES = int(os.getenv('SLOW_QUERY_MAX_BYTES', str(5 * 1024 * 1024)))
+SLOW_QUERY_RESPALDOS = int(os.getenv('SLOW_QUERY_RESPALDOS', '3'))
+
+LARGO_MAXIMO_TEXTO = 40
+REDACTADO = '[redactado]'
+
+# Parámetros nombrados que nunca se guardan
+CLAVES_SENSIBLES = re.compile(r'password|contrasena|hash|token|secret|email', re.IGNORECASE)
+# Valores que se reconocen como sensibles aunque lleguen como parámetros posicionales
+VALORES_SENSIBLES = re.compile(r'^(pbkdf2:|scrypt:|\$2[aby]\$)|@.+\.')
+
+_PATRONES_HUELLA = [
+    (re.compile(r'--[^\n]*'), ' '),                          # comentarios
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                    # literales de texto
+    (re.compile(r'%\(\w+\)s|%s'), '?'),                      # parámetros
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),                 # números
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),      # listas: IN (?, ?, ?)
+    (re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+'), '(?+)'),    # VALUES (..), (..), ...
+]
+
+_logger = None
+_logger_pid = None
+
+
+def huella(sql):
+    """Texto normalizado del statement (sin valores) y su identificador corto"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', errors='replace')
+    texto = str(sql)
+    for patron, reemplazo in _PATRONES_HUELLA:
+        texto = patron.sub(reemplazo, texto)
+    texto = texto.strip().lower()
+    return texto, hashlib.sha1(texto.encode('utf-8')).hexdigest()[:12]
+
+
+def _redactar_valor(valor, clave=None):
+    if clave is not None and CLAVES_SENSIBLES.search(str(clave)):
+        return REDACTADO
+    if valor is None or isinstance(valor, (bool, int, float)):
+        return valor
+    if isinstance(valor, (date, datetime, Decimal)):
+        return str(valor)
+    if isinstance(valor, (list, tuple)):
+        return [_redactar_valor(v) for v in valor[:10]] + (['...'] if len(valor) > 10 else [])
+    texto = str(valor)
+    if VALORES_SENSIBLES.search(texto):
+        return REDACTADO
+    return texto if len(texto) <= LARGO_MAXIMO_TEXTO else texto[:LARGO_MAXIMO_TEXTO] + '...'
+
+
+def redactar_parametros(params):
+    """Parámetros aptos para el log: sin contraseñas, hashes ni emails, y textos recortados"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {clave: _redactar_valor(valor, clave) for clave, valor in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_redactar_valor(valor) for valor in params]
+    return REDACTADO
+
+
+def archivo_proceso(pid=None):
+    """Archivo de log del proceso: consultas_lentas.jsonl -> consultas_lentas.<pid>.jsonl"""
+    raiz, extension = os.path.splitext(SLOW_QUERY_ARCHIVO)
+    return f'{raiz}.{pid or os.getpid()}{extension}'
+
+
+def _obtener_logger():
+    global _logger, _logger_pid
+    # Tras un fork (gunicorn --preload) el hijo abre su propio archivo
+    if _logger is None or _logger_pid != os.getpid():
+        logger = logging.getLogger('consultas_lentas')
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        ruta = archivo_proceso()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        handler = RotatingFileHandler(
+            ruta, maxBytes=SLOW_QUERY_MAX_BYTES,
+            backupCount=SLOW_QUERY_RESPALDOS, encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        _logger, _logger_pid = logger, os.getpid()
+    return _logger
+
+
+def _contexto_request():
+    """(endpoint, usuario_id) del request en curso, sin consultar la base"""
+    try:
+        from flask import has_request_context, request, session
+    except ImportError:
+        return None, None
+    if not has_request_context():
+        return None, None
+    # flask-login guarda el id en la sesión: leerlo no dispara load_user (que haría otra consulta)
+    return request.endpoint, session.get('_user_id')
+
+
+def registrar_si_lenta(sql, params, duracion, filas):
+    """Guarda el statement si duró SLOW_QUERY_MS o más (duracion en segundos)"""
+    duracion_ms = duracion * 1000
+    if duracion_ms < SLOW_QUERY_MS:
+        return
+    try:
+        texto, id_huella = huella(sql)
+        endpoint, usuario_id = _contexto_request()
+        _obtener_logger().info(json.dumps({
+            'fecha': datetime.now(timezone.utc).isoformat(),
+            'huella': id_huella,
+            'consulta': texto,
+            'parametros': redactar_parametros(params),
+            'endpoint': endpoint,
+            'usuario_id': usuario_id,
+            'duracion_ms': round(duracion_ms, 2),
+            'filas': filas,
+            'pid': os.getpid(),
+        }, ensure_ascii=False, default=str))
+    except Exception as e:
+        # El log nunca debe romper la consulta que lo originó
+        print(f"Error al registrar consulta lenta: {e}")
+
+
+def archivos_log(ruta=None):
+    """Archivos a resumir: el indicado y sus respaldos rotados, o por defecto los de todos los procesos"""
+    if ruta:
+        candidatos = [ruta] + sorted(glob.glob(f'{ruta}.*'))
+    else:
+        raiz, extension = os.path.splitext(SLOW_QUERY_ARCHIVO)
+        candidatos = sorted(glob.glob(f'{raiz}.*{extension}') + glob.glob(f'{raiz}.*{extension}.*'))
+    return [archivo for archivo in candidatos if os.path.isfile(archivo)]
+
+
+def resumir_consultas_lentas(ruta=None, limite=20):
+    """Huellas ordenadas por tiempo total: [{huella, consulta, cantidad, total_ms, ...}]"""
+    por_huella = {}
+    for archivo in archivos_log(ruta):
+        with open(archivo, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    continue
+                resumen = por_huella.setdefault(entrada['huella'], {
+                    'huella': entrada['huella'],
+                    'consulta': entrada['consulta'],
+                    'cantidad': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'filas': 0,
+                    'endpoints': set(),
+                })
+                resumen['cantidad'] += 1
+                resumen['total_ms'] += entrada['duracion_ms']
+                resumen['max_ms'] = max(resumen['max_ms'], entrada['duracion_ms'])
+                resumen['filas'] += max(entrada.get('filas') or 0, 0)
+                if entrada.get('endpoint'):
+                    resumen['endpoints'].add(entrada['endpoint'])
+
+    resumenes = sorted(por_huella.values(), key=lambda r: r['total_ms'], reverse=True)[:limite]
+    for resumen in resumenes:
+        resumen['promedio_ms'] = resumen['total_ms'] / resumen['cantidad']
+        resumen['endpoints'] = sorted(resumen['endpoints'])
+    return resumenes
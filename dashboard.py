@@ -0,0 +1,104 @@
+"""
+Métricas del dashboard principal
+Calcula todas las tarjetas y los dos desgloses en una sola pasada sobre equipos
+"""
+
+import os
+from dataclasses import dataclass, field
+
+from cache import CacheTTL
+
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '60'))
+CLAVE_METRICAS = 'metricas'
+
+cache_metricas = CacheTTL('dashboard', DASHBOARD_CACHE_TTL)
+
+# Orden de presentación de los estados en el dashboard
+ORDEN_ESTADOS = [
+    'Pendiente',
+    'Aprobación pendiente',
+    'A presupuestar',
+    'Baja técnica',
+    'En curso',
+    'Finalizado',
+    'Listo para entregar',
+    'Repuestos',
+    'Tercerizado',
+]
+
+METRICAS_SQL = """
+    WITH base AS (
+        SELECT
+            e.estado,
+            -- categoria_grupo: columna generada de solicitudes (migrations/009)
+            COALESCE(s.categoria_grupo, 'Otra') as categoria_nombre
+        FROM equipos e
+        LEFT JOIN solicitudes s ON e.solicitud_id = s.id
+        WHERE e.eliminado = FALSE
+    )
+    SELECT
+        estado,
+        categoria_nombre,
+        GROUPING(estado) as sin_estado,
+        GROUPING(categoria_nombre) as sin_categoria,
+        COUNT(*) as cantidad,
+        (SELECT COUNT(*) FROM solicitudes) as total_solicitudes
+    FROM base
+    GROUP BY GROUPING SETS ((estado), (categoria_nombre), ())
+"""
+
+
+@dataclass
+class MetricasDashboard:
+    """Resultado tipado para dashboard.html"""
+    total_solicitudes: int = 0
+    total_equipos: int = 0
+    pendientes: int = 0
+    finalizados: int = 0
+    en_curso: int = 0
+    a_presupuestar: int = 0
+    estados: list = field(default_factory=list)
+    categorias: list = field(default_factory=list)
+
+
+def _orden_estado(fila):
+    """Posición de un estado según ORDEN_ESTADOS (los desconocidos al final)"""
+    estado = fila['estado']
+    return ORDEN_ESTADOS.index(estado) if estado in ORDEN_ESTADOS else len(ORDEN_ESTADOS)
+
+
+def obtener_metricas_dashboard(conn):
+    """Calcula las métricas del dashboard en un único round trip"""
+    cursor = conn.cursor()
+    cursor.execute(METRICAS_SQL)
+    filas = cursor.fetchall()
+    cursor.close()
+
+    metricas = MetricasDashboard()
+    for fila in filas:
+        metricas.total_solicitudes = fila['total_solicitudes']
+        if fila['sin_estado'] and fila['sin_categoria']:
+            metricas.total_equipos = fila['cantidad']
+        elif not fila['sin_estado']:
+            metricas.estados.append({'estado': fila['estado'], 'cantidad': fila['cantidad']})
+        else:
+            metricas.categorias.append({
+                'categoria_nombre': fila['categoria_nombre'],
+                'cantidad': fila['cantidad']
+            })
+
+    metricas.estados.sort(key=_orden_estado)
+    metricas.categorias.sort(key=lambda c: c['cantidad'], reverse=True)
+
+    por_estado = {e['estado']: e['cantidad'] for e in metricas.estados}
+    metricas.pendientes = por_estado.get('Pendiente', 0)
+    metricas.finalizados = por_estado.get('Finalizado', 0)
+    metricas.en_curso = por_estado.get('En curso', 0)
+    metricas.a_presupuestar = por_estado.get('A presupuestar', 0)
+
+    return metricas
+
+
+def invalidar_metricas_dashboard():
+    """Descarta las métricas cacheadas (llamar tras escribir en equipos o solicitudes)"""
+    cache_metricas.invalidar(CLAVE_METRICAS)
@@ -0,0 +1,225 @@
+"""
+Pool de conexiones a PostgreSQL compartido por app.py y auth.py
+Thread-safe y fork-safe (gunicorn), con health check al entregar conexiones que estuvieron ociosas
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from dotenv import load_dotenv
+
+from instrumentacion import CursorInstrumentado, registrar_conexion
+
+load_dotenv()
+
+# Configuración del pool (variables de entorno)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '5'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_HEALTH_CHECK = os.getenv('DB_HEALTH_CHECK', 'true').lower() in ('1', 'true', 'yes')
+# Solo se hace SELECT 1 a conexiones ociosas por más de estos segundos (cada uno es un round trip)
+DB_HEALTH_CHECK_OCIOSA = float(os.getenv('DB_HEALTH_CHECK_OCIOSA', '30'))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = None
+_en_uso = threading.local()
+
+# Momento en que cada conexión volvió al pool: id(conexión psycopg2) -> time.monotonic()
+_devuelta_en = {}
+
+# Conexiones prestadas por el pool de este proceso (métrica de utilización)
+_prestadas = 0
+_prestadas_lock = threading.Lock()
+
+# Pools heredados de un proceso padre: se conservan sin cerrarlos para no
+# enviar el cierre por un socket que el padre sigue usando
+_pools_heredados = []
+
+
+def _database_url():
+    """URL de conexión limpia para psycopg2"""
+    return os.getenv('DATABASE_URL', '').replace('&channel_binding=require', '')
+
+
+def _get_pool():
+    """Devuelve el pool del proceso actual, creándolo si hace falta"""
+    global _pool, _pool_pid, _slots, _prestadas
+
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            if _pool is not None:
+                _pools_heredados.append(_pool)
+            _pool = pg_pool.ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                _database_url(),
+                cursor_factory=CursorInstrumentado,
+                sslmode='require',
+                connect_timeout=10
+            )
+            _slots = threading.BoundedSemaphore(DB_POOL_MAX)
+            _devuelta_en.clear()
+            _prestadas = 0
+            _pool_pid = pid
+    return _pool
+
+
+def _contar_prestada(cantidad):
+    global _prestadas
+    with _prestadas_lock:
+        _prestadas += cantidad
+
+
+def estadisticas_pool():
+    """Conexiones prestadas y tamaño máximo del pool del proceso actual"""
+    return {'en_uso': _prestadas, 'maximo': DB_POOL_MAX}
+
+
+def _conexion_sana(conn):
+    """Health check al entregar una conexión del pool
+
+    Sin round trip si la conexión está abierta, sin transacción pendiente y se usó hace menos
+    de DB_HEALTH_CHECK_OCIOSA segundos; solo las ociosas (el servidor pudo cortarlas) se prueban.
+    """
+    if conn.closed:
+        return False
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        if not DB_HEALTH_CHECK:
+            return True
+        devuelta = _devuelta_en.get(id(conn))
+        if devuelta is not None and time.monotonic() - devuelta < DB_HEALTH_CHECK_OCIOSA:
+            return True
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+class ConexionPool:
+    """Conexión prestada por el pool: close() la devuelve en lugar de cerrarla"""
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+        self._devuelta = False
+        self._al_confirmar = []
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def raw(self):
+        """Conexión psycopg2 subyacente"""
+        return self._conn
+
+    def al_confirmar(self, funcion):
+        """Ejecuta funcion después del próximo commit exitoso (se descarta con rollback o close)"""
+        self._al_confirmar.append(funcion)
+
+    def commit(self):
+        self._conn.commit()
+        funciones, self._al_confirmar = self._al_confirmar, []
+        for funcion in funciones:
+            try:
+                funcion()
+            except Exception as e:
+                print(f"Error en acción posterior al commit: {e}")
+
+    def rollback(self):
+        self._al_confirmar = []
+        self._conn.rollback()
+
+    def close(self):
+        """Devuelve la conexión al pool (idempotente)"""
+        if self._devuelta:
+            return
+        self._devuelta = True
+        self._al_confirmar = []
+        pendientes = getattr(_en_uso, 'conexiones', None)
+        if pendientes and self in pendientes:
+            pendientes.remove(self)
+        try:
+            # Si el pool cambió (fork) la conexión no le pertenece a este proceso
+            if self._pool is _pool:
+                if self._conn.closed:
+                    _devuelta_en.pop(id(self._conn), None)
+                else:
+                    _devuelta_en[id(self._conn)] = time.monotonic()
+                self._pool.putconn(self._conn, close=self._conn.closed != 0)
+        finally:
+            if self._pool is _pool:
+                _slots.release()
+                _contar_prestada(-1)
+
+
+def obtener_conexion():
+    """Toma una conexión sana del pool (bloquea hasta DB_POOL_TIMEOUT si está lleno)"""
+    pool = _get_pool()
+    if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise pg_pool.PoolError("Pool de conexiones agotado")
+
+    try:
+        for _ in range(DB_POOL_MAX + 1):
+            conn = pool.getconn()
+            if _conexion_sana(conn):
+                break
+            _devuelta_en.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        else:
+            raise psycopg2.OperationalError("No se pudo obtener una conexión sana")
+    except Exception:
+        _slots.release()
+        raise
+
+    registrar_conexion()
+    _contar_prestada(1)
+    prestada = ConexionPool(conn, pool)
+    if not hasattr(_en_uso, 'conexiones'):
+        _en_uso.conexiones = []
+    _en_uso.conexiones.append(prestada)
+    return prestada
+
+
+@contextmanager
+def conexion():
+    """Context manager que siempre devuelve la conexión al pool"""
+    conn = obtener_conexion()
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def conexion_prestada(conn):
+    """ConexionPool del hilo actual que corresponde a conn (prestada o psycopg2 subyacente), o None"""
+    if isinstance(conn, ConexionPool):
+        return conn
+    for prestada in getattr(_en_uso, 'conexiones', []):
+        if prestada.raw is conn:
+            return prestada
+    return None
+
+
+def liberar_conexiones_pendientes():
+    """Devuelve al pool las conexiones que el hilo actual no cerró (teardown de Flask)"""
+    for conn in list(getattr(_en_uso, 'conexiones', [])):
+        conn.close()
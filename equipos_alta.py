@@ -0,0 +1,199 @@
+"""
+Alta de equipos en lote
+Filas desde JSON o desde un archivo .csv / .xlsx, validadas antes de insertar; un solo
+INSERT multi-fila (RETURNING id, ost) y la auditoría de todas en otro
+"""
+
+import csv
+import io
+import logging
+from datetime import date, datetime
+
+from psycopg2.extras import execute_values
+
+from auditoria import RegistroCambios
+
+# Columnas que se cargan en el alta (mismas que crear_equipo); la OST sale de la secuencia
+CAMPOS_ALTA = (
+    'cliente', 'tipo_equipo', 'marca', 'modelo', 'numero_serie',
+    'fecha_ingreso', 'remito', 'accesorios', 'prioridad', 'observacion_ingreso'
+)
+
+CAMPOS_OBLIGATORIOS = ('cliente', 'tipo_equipo')
+
+# Prioridades que acepta el alta (individual y en lote) y que ofrece el selector de la grilla
+PRIORIDADES = ('Baja', 'Normal', 'En la semana', 'Importante', 'Urgente')
+PRIORIDAD_DEFAULT = 'Normal'
+
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y')
+
+MAX_FILAS_ALTA = 500
+
+logger = logging.getLogger('equipos_alta')
+
+
+def _normalizar_encabezado(valor):
+    """'Número Serie ' -> 'numero_serie' (encabezados escritos a mano en la planilla)"""
+    texto = str(valor or '').strip().lower().replace(' ', '_')
+    for acentuada, simple in zip('áéíóú', 'aeiou'):
+        texto = texto.replace(acentuada, simple)
+    return texto
+
+
+def _texto(valor):
+    """Celda -> texto o None (los números enteros de Excel llegan como float)"""
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    texto = str(valor).strip()
+    return texto or None
+
+
+def leer_filas_archivo(archivo):
+    """Filas (dicts por encabezado) de un archivo subido .csv o .xlsx; ValueError si no se puede leer"""
+    nombre = (archivo.filename or '').lower()
+
+    if nombre.endswith('.csv'):
+        contenido = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline='')
+        muestra = contenido.read(4096)
+        contenido.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.reader(contenido, dialecto)
+        filas = list(lector)
+    elif nombre.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        try:
+            wb = load_workbook(archivo.stream, read_only=True, data_only=True)
+        except Exception:
+            raise ValueError("No se pudo leer el archivo Excel")
+        filas = [list(fila) for fila in wb.active.iter_rows(values_only=True)]
+        wb.close()
+    else:
+        raise ValueError("Formato de archivo no soportado (se acepta .csv o .xlsx)")
+
+    if not filas:
+        raise ValueError("El archivo está vacío")
+
+    encabezados = [_normalizar_encabezado(valor) for valor in filas[0]]
+    return [
+        dict(zip(encabezados, fila))
+        for fila in filas[1:]
+        if any(_texto(valor) for valor in fila)
+    ]
+
+
+def _parsear_fecha(valor):
+    if valor is None or isinstance(valor, date):
+        return valor.date() if isinstance(valor, datetime) else valor
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Fecha de ingreso inválida: '{valor}' (AAAA-MM-DD o DD/MM/AAAA)")
+
+
+def validar_prioridad(valor):
+    """Prioridad del alta: PRIORIDAD_DEFAULT si viene vacía; ValueError si no es una de PRIORIDADES"""
+    if not valor:
+        return PRIORIDAD_DEFAULT
+    if valor not in PRIORIDADES:
+        raise ValueError(f"Prioridad inválida: '{valor}' (opciones: {', '.join(PRIORIDADES)})")
+    return valor
+
+
+def validar_fila(datos):
+    """Fila de entrada -> dict listo para insertar; ValueError con el motivo si no es válida"""
+    if not isinstance(datos, dict):
+        raise ValueError("Fila inválida: se esperaba un objeto")
+
+    fila = {}
+    for campo in CAMPOS_ALTA:
+        valor = datos.get(campo)
+        fila[campo] = valor if isinstance(valor, (date, datetime)) else _texto(valor)
+
+    faltantes = [campo for campo in CAMPOS_OBLIGATORIOS if not fila[campo]]
+    if faltantes:
+        raise ValueError(f"Campos obligatorios faltantes: {', '.join(faltantes)}")
+
+    fila['fecha_ingreso'] = _parsear_fecha(fila['fecha_ingreso']) or date.today()
+    fila['prioridad'] = validar_prioridad(fila['prioridad'])
+    return fila
+
+
+def _insertar(cursor, filas, usuario_id, usuario_nombre):
+    """INSERT multi-fila + auditoría; devuelve [{id, ost}] en el orden de las filas"""
+    columnas = ', '.join(CAMPOS_ALTA + ('estado',))
+    creados = execute_values(
+        cursor,
+        f"INSERT INTO equipos ({columnas}) VALUES %s RETURNING id, ost",
+        [tuple(fila[campo] for campo in CAMPOS_ALTA) + ('Pendiente',) for fila in filas],
+        page_size=len(filas),
+        fetch=True
+    )
+
+    registro = RegistroCambios(usuario_id, usuario_nombre)
+    for fila, creado in zip(filas, creados):
+        registro.registrar(
+            creado['id'], 'CREACIÓN', '',
+            f"OST: {creado['ost']}, Cliente: {fila['cliente']}",
+            'INSERT'
+        )
+    registro.guardar(cursor)
+    return creados
+
+
+def crear_equipos_lote(cursor, items, usuario_id, usuario_nombre, parcial=False):
+    """Da de alta varios equipos dentro de la transacción en curso (sin commit)
+
+    Devuelve (resultados por fila, fechas de ingreso de los creados). Con parcial=False
+    basta una fila inválida para no insertar ninguna; con parcial=True se insertan las
+    válidas y, si el INSERT conjunto falla, se reintenta fila por fila con savepoints.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("Se esperaba una lista de equipos")
+    if len(items) > MAX_FILAS_ALTA:
+        raise ValueError(f"Máximo {MAX_FILAS_ALTA} equipos por lote")
+
+    # Las filas se numeran desde 1 en el orden recibido (en archivos: sin encabezado ni filas vacías)
+    validas = []
+    resultados = []
+    for numero, datos in enumerate(items, 1):
+        try:
+            validas.append((numero, validar_fila(datos)))
+        except ValueError as e:
+            resultados.append({'fila': numero, 'success': False, 'error': str(e)})
+
+    if not validas or (resultados and not parcial):
+        return resultados, []
+
+    filas = [fila for _, fila in validas]
+    if not parcial:
+        creados = list(zip(validas, _insertar(cursor, filas, usuario_id, usuario_nombre)))
+    else:
+        cursor.execute("SAVEPOINT alta_lote")
+        try:
+            creados = list(zip(validas, _insertar(cursor, filas, usuario_id, usuario_nombre)))
+        except Exception as e:
+            logger.warning(f"Alta en lote: el INSERT conjunto falló, se reintenta por fila: {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT alta_lote")
+            creados = []
+            for numero, fila in validas:
+                cursor.execute("SAVEPOINT alta_fila")
+                try:
+                    creados.extend(zip([(numero, fila)], _insertar(cursor, [fila], usuario_id, usuario_nombre)))
+                    cursor.execute("RELEASE SAVEPOINT alta_fila")
+                except Exception as error_fila:
+                    cursor.execute("ROLLBACK TO SAVEPOINT alta_fila")
+                    resultados.append({'fila': numero, 'success': False, 'error': str(error_fila)})
+        cursor.execute("RELEASE SAVEPOINT alta_lote")
+
+    for (numero, _), creado in creados:
+        resultados.append({'fila': numero, 'success': True, 'id': creado['id'], 'ost': creado['ost']})
+    resultados.sort(key=lambda resultado: resultado['fila'])
+
+    return resultados, [fila['fecha_ingreso'] for (_, fila), _ in creados]
@@ -0,0 +1,177 @@
+"""
+Edición de equipos desde la grilla
+Campos editables compartidos por la edición individual y la edición en lote
+"""
+
+from psycopg2.extras import Json
+
+from auditoria import RegistroCambios
+
+# Mapeo de campos JSON a columnas DB
+CAMPOS_EDITABLES = {
+    'cliente': 'cliente',
+    'tipo_equipo': 'tipo_equipo',
+    'marca': 'marca',
+    'modelo': 'modelo',
+    'numero_serie': 'numero_serie',
+    'accesorios': 'accesorios',
+    'prioridad': 'prioridad',
+    'remito': 'remito',
+    'observacion_ingreso': 'observacion_ingreso',
+    'detalle_reparacion': 'detalles_reparacion',
+    'horas_trabajo': 'horas_trabajo',
+    'reingreso': 'reingreso',
+    'informe_tecnico': 'informe',
+    'costo_reparacion': 'costo',
+    'precio_cliente': 'precio',
+    'numero_ov': 'ov',
+    'estado_ov': 'estado_ov',
+    'fecha_ingreso': 'fecha_ingreso',
+    'fecha_envio_proveedor': 'fecha_envio',
+    'fecha_entrega': 'fecha_entrega',
+    'remito_entrega': 'remito_entrega',
+    'estado': 'estado',
+    'proveedor': 'proveedor'
+}
+
+MAX_ITEMS_LOTE = 500
+
+
+def calcular_cambios(equipo_actual, datos):
+    """Campos que realmente cambian: {columna: (valor_anterior, valor_nuevo)}"""
+    cambios = {}
+    for campo_json, campo_db in CAMPOS_EDITABLES.items():
+        if campo_json in datos:
+            valor_anterior = equipo_actual.get(campo_db)
+            valor_nuevo = datos.get(campo_json)
+            if str(valor_anterior) != str(valor_nuevo):
+                cambios[campo_db] = (valor_anterior, valor_nuevo)
+    return cambios
+
+
+def validar_lote(items):
+    """Separa los items bien formados ({id, changes}) de los inválidos; devuelve (validos, resultados_error)"""
+    if not isinstance(items, list) or not items:
+        raise ValueError("Se esperaba una lista de {id, changes}")
+    if len(items) > MAX_ITEMS_LOTE:
+        raise ValueError(f"Máximo {MAX_ITEMS_LOTE} equipos por lote")
+
+    validos = {}
+    errores = []
+    for item in items:
+        equipo_id = item.get('id') if isinstance(item, dict) else None
+        cambios = item.get('changes') if isinstance(item, dict) else None
+        if not isinstance(equipo_id, int) or isinstance(equipo_id, bool) or not isinstance(cambios, dict):
+            errores.append({'id': equipo_id, 'success': False, 'error': 'Item inválido: se esperaba {id, changes}'})
+        elif equipo_id in validos:
+            # El mismo equipo repetido: se combinan sus cambios (gana el último)
+            validos[equipo_id].update(cambios)
+        else:
+            validos[equipo_id] = dict(cambios)
+    return validos, errores
+
+
+def _sentencia_lote(cambios_por_equipo):
+    """UPDATE único para varios equipos con columnas distintas cada uno
+
+    Cada fila de VALUES lleva (id, cambios jsonb); jsonb_populate_record convierte cada valor
+    al tipo de su columna y las columnas que el equipo no cambia conservan su valor.
+    """
+    columnas = sorted({columna for cambios in cambios_por_equipo.values() for columna in cambios})
+    asignaciones = ',\n            '.join(
+        f"{columna} = CASE WHEN v.cambios ? '{columna}' "
+        f"THEN (jsonb_populate_record(NULL::equipos, v.cambios)).{columna} ELSE e.{columna} END"
+        for columna in columnas
+    )
+    filas = ', '.join(['(%s, %s::jsonb)'] * len(cambios_por_equipo))
+    params = []
+    for equipo_id, cambios in cambios_por_equipo.items():
+        params.extend([equipo_id, Json({columna: nuevo for columna, (_, nuevo) in cambios.items()})])
+
+    sentencia = f"""
+        UPDATE equipos e SET
+            {asignaciones}
+        FROM (VALUES {filas}) AS v(id, cambios)
+        WHERE e.id = v.id
+        RETURNING e.id, e.fecha_ingreso
+    """
+    return sentencia, params
+
+
+def _guardar(cursor, cambios_por_equipo, usuario_id, usuario_nombre):
+    """UPDATE + auditoría de los equipos indicados en un solo statement"""
+    registro = RegistroCambios(usuario_id, usuario_nombre)
+    for equipo_id, cambios in cambios_por_equipo.items():
+        for columna, (anterior, nuevo) in cambios.items():
+            registro.registrar(equipo_id, columna, anterior, nuevo)
+    sentencia, params = _sentencia_lote(cambios_por_equipo)
+    return registro.guardar(cursor, sentencia, params)
+
+
+def actualizar_equipos_lote(cursor, items, usuario_id, usuario_nombre):
+    """Aplica los cambios de varios equipos dentro de la transacción en curso (sin commit)
+
+    Devuelve (resultados por item, filas actualizadas con su fecha_ingreso anterior y nueva,
+    columnas modificadas). Si el UPDATE conjunto falla, se reintenta equipo por equipo con
+    savepoints para informar qué items fallaron sin perder los demás.
+    """
+    validos, resultados = validar_lote(items)
+    if not validos:
+        return resultados, [], set()
+
+    # Un solo SELECT bloquea y trae todos los equipos (en orden de id para evitar deadlocks)
+    cursor.execute(
+        "SELECT * FROM equipos WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+        (list(validos.keys()),)
+    )
+    actuales = {fila['id']: fila for fila in cursor.fetchall()}
+
+    cambios_por_equipo = {}
+    for equipo_id, datos in validos.items():
+        if equipo_id not in actuales:
+            resultados.append({'id': equipo_id, 'success': False, 'error': 'Equipo no encontrado'})
+            continue
+        cambios = calcular_cambios(actuales[equipo_id], datos)
+        if cambios:
+            cambios_por_equipo[equipo_id] = cambios
+        else:
+            resultados.append({'id': equipo_id, 'success': True, 'message': 'No hay cambios para guardar'})
+
+    if not cambios_por_equipo:
+        return resultados, [], set()
+
+    cursor.execute("SAVEPOINT edicion_lote")
+    try:
+        actualizados = _guardar(cursor, cambios_por_equipo, usuario_id, usuario_nombre)
+        fallidos = {}
+    except Exception as e:
+        print(f"Error en edición en lote, reintentando por equipo: {e}")
+        cursor.execute("ROLLBACK TO SAVEPOINT edicion_lote")
+        actualizados = []
+        fallidos = {}
+        for equipo_id, cambios in cambios_por_equipo.items():
+            cursor.execute("SAVEPOINT edicion_equipo")
+            try:
+                actualizados.extend(_guardar(cursor, {equipo_id: cambios}, usuario_id, usuario_nombre))
+                cursor.execute("RELEASE SAVEPOINT edicion_equipo")
+            except Exception as error_equipo:
+                cursor.execute("ROLLBACK TO SAVEPOINT edicion_equipo")
+                fallidos[equipo_id] = str(error_equipo)
+    cursor.execute("RELEASE SAVEPOINT edicion_lote")
+
+    filas = []
+    columnas = set()
+    for fila in actualizados:
+        equipo_id = fila['id']
+        resultados.append({'id': equipo_id, 'success': True})
+        filas.append({
+            'id': equipo_id,
+            'ost': actuales[equipo_id]['ost'],
+            'fecha_ingreso_anterior': actuales[equipo_id]['fecha_ingreso'],
+            'fecha_ingreso': fila['fecha_ingreso']
+        })
+        columnas.update(cambios_por_equipo[equipo_id])
+    for equipo_id, error in fallidos.items():
+        resultados.append({'id': equipo_id, 'success': False, 'error': error})
+
+    return resultados, filas, columnas
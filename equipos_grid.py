@@ -0,0 +1,230 @@
+"""
+Consulta paginada de la grilla de equipos
+Paginación keyset sobre (fecha_ingreso DESC, id), filtros por columna y orden en el servidor
+"""
+
+from paginacion import (
+    codificar_cursor, decodificar_cursor, normalizar_direccion,
+    orden_keyset, condicion_keyset, parsear_limite
+)
+
+COLUMNAS_GRID = """
+    e.id, e.cliente, e.ost, e.estado, e.fecha_ingreso, e.remito,
+    e.tipo_equipo, e.marca, e.modelo, e.numero_serie, e.accesorios,
+    s.categoria, s.categoria_grupo,
+    COALESCE(s.comercial_syemed, s.solicitante) as comercial_cargo,
+    e.observacion_ingreso, e.prioridad, e.fecha_envio, e.proveedor,
+    e.detalles_reparacion, e.horas_trabajo, e.reingreso,
+    e.informe AS informe_tecnico,
+    e.costo AS costo_reparacion,
+    e.precio AS precio_cliente,
+    e.ov AS numero_ov,
+    e.estado_ov, e.fecha_entrega, e.remito_entrega,
+    e.solicitud_id,
+    s.nivel_urgencia
+"""
+
+# Columnas por las que se puede ordenar (nombre en la API -> expresión SQL)
+COLUMNAS_ORDEN = {
+    'fecha_ingreso': 'e.fecha_ingreso',
+    'ost': 'e.ost',
+    'id': 'e.id',
+    'cliente': 'e.cliente',
+    'estado': 'e.estado',
+    'prioridad': 'e.prioridad',
+    'tipo_equipo': 'e.tipo_equipo',
+    'marca': 'e.marca',
+    'modelo': 'e.modelo',
+    'numero_serie': 'e.numero_serie',
+    'fecha_entrega': 'e.fecha_entrega',
+}
+
+# Columnas filtrables desde la grilla (filtro_<columna>=valor incluye, excluir_<columna>=valor
+# excluye; ambos repetibles)
+COLUMNAS_FILTRO = {
+    'cliente': 'e.cliente',
+    'solicitud_id': 'e.solicitud_id',
+    'ost': 'e.ost',
+    'estado': 'e.estado',
+    'comercial_cargo': 'COALESCE(s.comercial_syemed, s.solicitante)',
+    'categoria_grupo': 's.categoria_grupo',
+    'tipo_equipo': 'e.tipo_equipo',
+    'marca': 'e.marca',
+    'modelo': 'e.modelo',
+    'numero_serie': 'e.numero_serie',
+    'prioridad': 'e.prioridad',
+    'estado_ov': 'e.estado_ov',
+    'proveedor': 'e.proveedor',
+}
+
+# Textos que la grilla muestra cuando la columna está vacía
+VALORES_VACIOS = ('-', 'Seleccionar', 'N/A')
+
+LIMITE_POR_DEFECTO = 100
+
+# Opciones distintas que se devuelven para el desplegable de filtro de una columna
+MAX_VALORES_FILTRO = 1000
+
+
+def construir_filtros(args, excluir_columna=None):
+    """Traduce los parámetros de la grilla a condiciones WHERE y sus parámetros
+
+    excluir_columna omite el filtro de esa columna (las opciones de su desplegable
+    dependen de los demás filtros, no del propio).
+    """
+    condiciones = ["e.eliminado = FALSE"]
+    params = []
+
+    for columna, expresion in COLUMNAS_FILTRO.items():
+        if columna == excluir_columna:
+            continue
+
+        valores = args.getlist(f'filtro_{columna}')
+        if valores:
+            textos = [v for v in valores if v not in VALORES_VACIOS]
+            partes = []
+            if textos:
+                partes.append(f"{expresion}::text = ANY(%s)")
+                params.append(textos)
+            if len(textos) < len(valores):
+                partes.append(f"{expresion} IS NULL")
+            condiciones.append(f"({' OR '.join(partes)})")
+
+        # Exclusión: los valores que la grilla todavía no cargó siguen visibles
+        excluidos = args.getlist(f'excluir_{columna}')
+        if excluidos:
+            textos = [v for v in excluidos if v not in VALORES_VACIOS]
+            if textos:
+                condiciones.append(f"({expresion} IS NULL OR {expresion}::text <> ALL(%s))")
+                params.append(textos)
+            if len(textos) < len(excluidos):
+                condiciones.append(f"{expresion} IS NOT NULL")
+
+    # Búsquedas parciales de la grilla
+    for parametro, expresion in (('buscar_ost', 'e.ost'), ('buscar_id', 'e.solicitud_id')):
+        valor = (args.get(parametro) or '').strip()
+        if valor:
+            condiciones.append(f"{expresion}::text LIKE %s")
+            params.append(f'%{valor}%')
+
+    return condiciones, params
+
+
+def consultar_pagina_equipos(conn, args):
+    """Devuelve una página de la grilla con el cursor siguiente y el total (solo en la primera página)"""
+    orden = args.get('orden', 'fecha_ingreso')
+    if orden not in COLUMNAS_ORDEN:
+        raise ValueError(f"Columna de orden inválida. Debe ser una de: {', '.join(COLUMNAS_ORDEN.keys())}")
+    columna = COLUMNAS_ORDEN[orden]
+    direccion = normalizar_direccion(args.get('direccion'))
+    limite = parsear_limite(args.get('limite'), por_defecto=LIMITE_POR_DEFECTO)
+
+    condiciones, params = construir_filtros(args)
+    cursor_pagina = args.get('cursor')
+
+    cursor = conn.cursor()
+
+    total = None
+    if not cursor_pagina:
+        cursor.execute(f"""
+            SELECT COUNT(*) as total
+            FROM equipos e
+            LEFT JOIN solicitudes s ON e.solicitud_id = s.id
+            WHERE {' AND '.join(condiciones)}
+        """, params)
+        total = cursor.fetchone()['total']
+
+    condiciones_pagina = list(condiciones)
+    params_pagina = list(params)
+    if cursor_pagina:
+        valor, ultimo_id = decodificar_cursor(cursor_pagina)
+        condicion, params_cursor = condicion_keyset(columna, 'e.id', direccion, valor, ultimo_id)
+        condiciones_pagina.append(condicion)
+        params_pagina.extend(params_cursor)
+
+    cursor.execute(f"""
+        SELECT {COLUMNAS_GRID}
+        FROM equipos e
+        LEFT JOIN solicitudes s ON e.solicitud_id = s.id
+        WHERE {' AND '.join(condiciones_pagina)}
+        ORDER BY {orden_keyset(columna, 'e.id', direccion)}
+        LIMIT %s
+    """, params_pagina + [limite + 1])
+    equipos = cursor.fetchall()
+    cursor.close()
+
+    siguiente = None
+    if len(equipos) > limite:
+        equipos = equipos[:limite]
+        ultimo = equipos[-1]
+        siguiente = codificar_cursor(ultimo[orden], ultimo['id'])
+
+    return {
+        'equipos': equipos,
+        'cursor_siguiente': siguiente,
+        'total': total,
+        'limite': limite
+    }
+
+
+def consultar_valores_columna(conn, args, columna):
+    """Valores distintos de una columna filtrable con los filtros de las demás columnas aplicados
+
+    Devuelve {valores, completo}: NULL se informa como '-' y completo=False si se
+    cortó en MAX_VALORES_FILTRO.
+    """
+    if columna not in COLUMNAS_FILTRO:
+        raise ValueError(f"Columna de filtro inválida. Debe ser una de: {', '.join(COLUMNAS_FILTRO.keys())}")
+    expresion = COLUMNAS_FILTRO[columna]
+    condiciones, params = construir_filtros(args, excluir_columna=columna)
+
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT DISTINCT {expresion}::text as valor
+        FROM equipos e
+        LEFT JOIN solicitudes s ON e.solicitud_id = s.id
+        WHERE {' AND '.join(condiciones)}
+        ORDER BY valor NULLS FIRST
+        LIMIT %s
+    """, params + [MAX_VALORES_FILTRO + 1])
+    valores = [fila['valor'] if fila['valor'] is not None else '-' for fila in cursor.fetchall()]
+    cursor.close()
+
+    return {
+        'valores': valores[:MAX_VALORES_FILTRO],
+        'completo': len(valores) <= MAX_VALORES_FILTRO
+    }
+
+
+def consultar_archivos_equipos(conn, numeros_serie):
+    """Adjuntos (de equipos activos) que corresponden a los números de serie de una página"""
+    if not numeros_serie:
+        return []
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT e.numero_serie, a.categoria, a.url_cloudinary
+        FROM archivos_adjuntos a
+        INNER JOIN equipos e ON a.equipo_id = e.id
+        WHERE e.numero_serie = ANY(%s)
+        AND e.eliminado = FALSE
+    """, (list(numeros_serie),))
+    archivos = cursor.fetchall()
+    cursor.close()
+    return archivos
+
+
+def agrupar_adjuntos(equipos, archivos):
+    """Indexa los adjuntos por equipo y categoría en una sola pasada: {equipo_id: {categoria: [archivos]}}
+
+    Los adjuntos se comparten entre equipos con el mismo número de serie (reingresos).
+    """
+    por_serie = {}
+    for archivo in archivos:
+        categorias = por_serie.setdefault(archivo['numero_serie'], {})
+        categorias.setdefault(archivo['categoria'], []).append(archivo)
+
+    return {
+        equipo['id']: por_serie.get(equipo['numero_serie'], {})
+        for equipo in equipos
+        if equipo['numero_serie']
+    }
@@ -0,0 +1,23 @@
+"""
+Configuración de gunicorn (la toma automáticamente `gunicorn app:app`)
+Prepara el directorio compartido de métricas de Prometheus entre workers (ver metricas.py)
+"""
+
+import glob
+import os
+
+
+def on_starting(server):
+    """Al arrancar el master: directorio de métricas vacío (los archivos de una corrida anterior no valen)"""
+    directorio = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        for archivo in glob.glob(os.path.join(directorio, '*.db')):
+            os.remove(archivo)
+
+
+def child_exit(server, worker):
+    """Un worker terminó: sus gauges 'live' dejan de sumarse"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,105 @@
+"""
+Consulta paginada del historial de auditoría
+Paginación keyset sobre (fecha_cambio DESC, id DESC) con filtros por equipo, usuario, campo, acción y fechas
+"""
+
+from datetime import datetime, timedelta
+
+from paginacion import codificar_cursor, decodificar_cursor, condicion_keyset, parsear_limite
+
+ACCIONES = ('UPDATE', 'INSERT', 'DELETE')
+
+LIMITE_POR_DEFECTO = 100
+
+
+def _parsear_fecha(valor, nombre):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Fecha '{nombre}' inválida (formato AAAA-MM-DD)")
+
+
+def construir_filtros_auditoria(args):
+    """Filtros del historial: devuelve (condiciones, params, filtros aplicados)"""
+    condiciones = []
+    params = []
+    filtros = {}
+
+    equipo_id = args.get('equipo_id', type=int)
+    if equipo_id:
+        condiciones.append("a.equipo_id = %s")
+        params.append(equipo_id)
+        filtros['equipo_id'] = equipo_id
+
+    for parametro, columna in (('usuario', 'a.usuario_nombre'), ('campo', 'a.campo_modificado')):
+        valor = (args.get(parametro) or '').strip()
+        if valor:
+            condiciones.append(f"{columna} = %s")
+            params.append(valor)
+            filtros[parametro] = valor
+
+    accion = (args.get('accion') or '').strip().upper()
+    if accion:
+        if accion not in ACCIONES:
+            raise ValueError(f"Acción inválida. Debe ser una de: {', '.join(ACCIONES)}")
+        condiciones.append("a.accion = %s")
+        params.append(accion)
+        filtros['accion'] = accion
+
+    # Rango de fechas inclusivo en la UI, semiabierto en SQL
+    desde = (args.get('desde') or '').strip()
+    if desde:
+        condiciones.append("a.fecha_cambio >= %s")
+        params.append(_parsear_fecha(desde, 'desde'))
+        filtros['desde'] = desde
+
+    hasta = (args.get('hasta') or '').strip()
+    if hasta:
+        condiciones.append("a.fecha_cambio < %s")
+        params.append(_parsear_fecha(hasta, 'hasta') + timedelta(days=1))
+        filtros['hasta'] = hasta
+
+    return condiciones, params, filtros
+
+
+def consultar_pagina_auditoria(conn, args):
+    """Una página del historial (más recientes primero) con el cursor de la siguiente"""
+    limite = parsear_limite(args.get('limite'), por_defecto=LIMITE_POR_DEFECTO)
+    condiciones, params, filtros = construir_filtros_auditoria(args)
+
+    cursor_pagina = args.get('cursor')
+    if cursor_pagina:
+        valor, ultimo_id = decodificar_cursor(cursor_pagina)
+        # fecha_cambio es NOT NULL desde que es clave de partición (migración 004)
+        condicion, params_cursor = condicion_keyset(
+            'a.fecha_cambio', 'a.id', 'DESC', valor, ultimo_id, admite_nulos=False
+        )
+        condiciones.append(condicion)
+        params.extend(params_cursor)
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT a.*, e.ost, e.cliente, e.tipo_equipo, e.eliminado
+        FROM equipos_auditoria a
+        LEFT JOIN equipos e ON a.equipo_id = e.id
+        {where}
+        ORDER BY a.fecha_cambio DESC NULLS LAST, a.id DESC
+        LIMIT %s
+    """, params + [limite + 1])
+    cambios = cursor.fetchall()
+    cursor.close()
+
+    siguiente = None
+    if len(cambios) > limite:
+        cambios = cambios[:limite]
+        ultimo = cambios[-1]
+        siguiente = codificar_cursor(ultimo['fecha_cambio'], ultimo['id'])
+
+    return {
+        'cambios': cambios,
+        'cursor_siguiente': siguiente,
+        'filtros': filtros,
+        'limite': limite
+    }
@@ -0,0 +1,261 @@
+"""
+Motor de informes mensuales
+Agregados sobre el resumen mensual, filtros de fecha sargables y exportación del detalle:
+.xlsx armado en un archivo temporal (memoria acotada) o .csv que se envía a medida que se leen las filas
+"""
+
+import csv
+import io
+import os
+import tempfile
+from datetime import date
+
+EXCEL_LOTE = int(os.getenv('EXCEL_LOTE', '2000'))
+EXCEL_CHUNK = 64 * 1024
+
+EXCEL_COLUMNAS = [
+    # (encabezado, clave en la fila, ancho)
+    ('OST', 'ost', 10),
+    ('Cliente', 'cliente', 30),
+    ('Estado', 'estado', 20),
+    ('Fecha Ingreso', 'fecha_ingreso', 15),
+    ('Tipo Equipo', 'tipo_equipo', 25),
+    ('Marca', 'marca', 20),
+    ('Modelo', 'modelo', 20),
+    ('Categoría', 'categoria', 15),
+    ('Comercial', 'comercial', 25),
+]
+
+
+def rango_periodo(anio, mes=None):
+    """Rango semiabierto [inicio, fin) para un año o un mes"""
+    if mes:
+        if not 1 <= mes <= 12:
+            raise ValueError("Mes inválido")
+        inicio = date(anio, mes, 1)
+        fin = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+    else:
+        inicio = date(anio, 1, 1)
+        fin = date(anio + 1, 1, 1)
+    return inicio, fin
+
+
+# Filtro de categoría de la pantalla de informes: código -> solicitudes.categoria_grupo,
+# que es también la categoría del resumen mensual (ver migrations/009)
+CATEGORIAS_INFORME = {
+    'R': 'Reparación',
+    'G': 'Garantía',
+    'BA': 'Baja de Alquiler',
+    'CA': 'Cambio de Alquiler',
+    'FC': 'Cambio por Falla Crítica',
+}
+
+
+def construir_filtro_informe(anio, mes=None, categoria=''):
+    """WHERE común a los informes: usa los índices de fecha_ingreso (sin EXTRACT sobre la columna)"""
+    inicio, fin = rango_periodo(anio, mes)
+    condiciones = [
+        "e.eliminado = FALSE",
+        "e.fecha_ingreso >= %s",
+        "e.fecha_ingreso < %s",
+    ]
+    params = [inicio, fin]
+
+    if categoria:
+        condiciones.append("s.categoria_grupo = %s")
+        params.append(nombre_categoria(categoria))
+
+    return ' AND '.join(condiciones), params
+
+# Los cuatro agregados del informe en un solo statement sobre equipos_resumen_mensual
+# (ver resumen_mensual.py). estado = '' representa a los equipos sin estado.
+INFORME_SQL = """
+    SELECT
+        anio, mes, estado, categoria,
+        GROUPING(anio, mes) as sin_mes,
+        GROUPING(estado) as sin_estado,
+        GROUPING(categoria) as sin_categoria,
+        COALESCE(SUM(cantidad), 0) as cantidad,
+        COALESCE(SUM(cantidad) FILTER (WHERE estado = 'Finalizado'), 0) as finalizados,
+        COALESCE(SUM(cantidad) FILTER (WHERE estado = 'En curso'), 0) as en_curso,
+        COALESCE(SUM(cantidad) FILTER (WHERE estado = 'Pendiente'), 0) as pendientes,
+        COALESCE(SUM(cantidad) FILTER (WHERE estado NOT IN ('Finalizado', 'En curso', 'Pendiente', '')), 0) as otros
+    FROM equipos_resumen_mensual
+    WHERE {filtro}
+    GROUP BY GROUPING SETS ((anio, mes), (estado), (categoria), ())
+"""
+
+
+def nombre_categoria(codigo):
+    """Código del filtro ('R', 'G', ...) -> valor de solicitudes.categoria_grupo"""
+    if codigo not in CATEGORIAS_INFORME:
+        raise ValueError("Categoría inválida")
+    return CATEGORIAS_INFORME[codigo]
+
+
+def construir_filtro_resumen(anio, mes=None, categoria=''):
+    """WHERE del informe sobre el resumen mensual"""
+    rango_periodo(anio, mes)  # valida el mes
+    condiciones = ["anio = %s"]
+    params = [anio]
+
+    if mes:
+        condiciones.append("mes = %s")
+        params.append(mes)
+
+    if categoria:
+        condiciones.append("categoria = %s")
+        params.append(nombre_categoria(categoria))
+
+    return ' AND '.join(condiciones), params
+
+
+def consultar_informe_mensual(conn, filtro, params):
+    """Totales, ingresos por mes, estados y categorías del informe en un único statement
+
+    filtro y params vienen de construir_filtro_resumen
+    """
+    cursor = conn.cursor()
+    cursor.execute(INFORME_SQL.format(filtro=filtro), params)
+    filas = cursor.fetchall()
+    cursor.close()
+
+    totales = {'cantidad': 0, 'finalizados': 0, 'pendientes': 0}
+    ingresos_por_mes = []
+    estados = []
+    categorias = []
+
+    for fila in filas:
+        if not fila['sin_mes']:
+            ingresos_por_mes.append({
+                'anio': fila['anio'],
+                'mes': fila['mes'],
+                'ingresados': fila['cantidad'],
+                'finalizados': fila['finalizados'],
+                'en_curso': fila['en_curso'],
+                'pendientes': fila['pendientes'],
+                'otros': fila['otros']
+            })
+        elif not fila['sin_estado']:
+            estados.append({
+                'estado': fila['estado'] or 'Sin estado',
+                'cantidad': fila['cantidad']
+            })
+        elif not fila['sin_categoria']:
+            categorias.append({
+                'categoria': fila['categoria'],
+                'cantidad': fila['cantidad']
+            })
+        else:
+            totales = fila
+
+    ingresos_por_mes.sort(key=lambda fila: (fila['anio'], fila['mes']))
+    estados.sort(key=lambda fila: fila['cantidad'], reverse=True)
+    categorias.sort(key=lambda fila: fila['cantidad'], reverse=True)
+
+    return {
+        'total': totales['cantidad'],
+        'total_ingresados': totales['cantidad'],
+        'total_finalizados': totales['finalizados'],
+        'total_pendientes': totales['pendientes'],
+        'ingresos_por_mes': ingresos_por_mes,
+        'estados': estados,
+        'categorias': categorias
+    }
+
+
+def iterar_en_lotes(cursor, lote=EXCEL_LOTE):
+    """Recorre un cursor (idealmente con nombre, del lado del servidor) de a lotes"""
+    while True:
+        filas = cursor.fetchmany(lote)
+        if not filas:
+            break
+        for fila in filas:
+            yield fila
+
+
+def escribir_excel_informe(filas, destino):
+    """Escribe el informe en un workbook write-only: la memoria no depende de la cantidad de filas"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Informe Mensual")
+
+    # Anchos (en modo write-only deben definirse antes de escribir filas)
+    for col, (_, _, ancho) in enumerate(EXCEL_COLUMNAS, 1):
+        ws.column_dimensions[get_column_letter(col)].width = ancho
+
+    # Estilos: solo el encabezado, una vez
+    header_fill = PatternFill(start_color="1E4D7B", end_color="1E4D7B", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    header_alignment = Alignment(horizontal='center', vertical='center')
+
+    encabezado = []
+    for titulo, _, _ in EXCEL_COLUMNAS:
+        cell = WriteOnlyCell(ws, value=titulo)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+        encabezado.append(cell)
+    ws.append(encabezado)
+
+    claves = [clave for _, clave, _ in EXCEL_COLUMNAS]
+    for fila in filas:
+        ws.append([fila[clave] for clave in claves])
+
+    wb.save(destino)
+
+
+def generar_excel_en_archivo(filas):
+    """Genera el .xlsx en un archivo temporal y devuelve (tamaño, generador de chunks)
+
+    La memoria no depende de la cantidad de filas, pero el primer byte sale recién con el
+    workbook completo: el .xlsx es un zip y openpyxl escribe la hoja al guardarlo.
+    Para exportaciones grandes, generar_csv_streaming.
+    """
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir_excel_informe(filas, archivo)
+        tamano = archivo.tell()
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+
+    def chunks():
+        try:
+            while True:
+                bloque = archivo.read(EXCEL_CHUNK)
+                if not bloque:
+                    break
+                yield bloque
+        finally:
+            archivo.close()
+
+    return tamano, chunks()
+
+
+def generar_csv_streaming(filas):
+    """Generador de chunks .csv (UTF-8 con BOM y ';', como lo abre Excel en español)
+
+    Cada chunk sale en cuanto se juntan EXCEL_CHUNK bytes de filas: el primer byte no espera
+    a la última fila.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    escritor.writerow([titulo for titulo, _, _ in EXCEL_COLUMNAS])
+
+    claves = [clave for _, clave, _ in EXCEL_COLUMNAS]
+    for fila in filas:
+        escritor.writerow([fila[clave] for clave in claves])
+        if buffer.tell() >= EXCEL_CHUNK:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
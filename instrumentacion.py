@@ -0,0 +1,156 @@
+"""
+Instrumentación de SQL por request
+Un cursor que mide cada statement (cantidad, tiempo, filas) y las conexiones tomadas del pool;
+app.py lo resume en el header Server-Timing y en un log JSON por request. Los statements
+lentos además van al log de consultas_lentas.py.
+En modo estricto (tests) un request que supera su presupuesto de consultas falla.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from psycopg2.extras import RealDictCursor
+
+from consultas_lentas import registrar_si_lenta
+
+INSTRUMENTACION_LOG = os.getenv('INSTRUMENTACION_LOG', 'true').lower() in ('1', 'true', 'yes')
+INSTRUMENTACION_ESTRICTA = os.getenv('INSTRUMENTACION_ESTRICTA', 'false').lower() in ('1', 'true', 'yes')
+PRESUPUESTO_CONSULTAS = int(os.getenv('PRESUPUESTO_CONSULTAS', '20'))
+
+logger = logging.getLogger('instrumentacion')
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_actual = threading.local()
+
+
+class PresupuestoConsultasExcedido(AssertionError):
+    """Un request ejecutó más consultas que su presupuesto (solo en modo estricto)"""
+
+
+@dataclass
+class MedicionRequest:
+    """Contadores de base de datos de un request"""
+    consultas: int = 0
+    tiempo_db: float = 0.0
+    filas: int = 0
+    conexiones: int = 0
+    inicio: float = 0.0
+    endpoint: str = None
+
+    def resumen(self):
+        return {
+            'consultas': self.consultas,
+            'tiempo_db_ms': round(self.tiempo_db * 1000, 2),
+            'filas': self.filas,
+            'conexiones': self.conexiones,
+        }
+
+
+def iniciar_medicion(endpoint=None):
+    """Empieza a medir en el hilo actual (before_request)"""
+    _actual.medicion = MedicionRequest(inicio=time.perf_counter(), endpoint=endpoint)
+    return _actual.medicion
+
+
+def medicion_actual():
+    """Medición en curso del hilo actual, o None (CLI, hilos de fondo)"""
+    return getattr(_actual, 'medicion', None)
+
+
+def terminar_medicion():
+    """Deja de medir y devuelve la medición (teardown)"""
+    medicion = medicion_actual()
+    _actual.medicion = None
+    return medicion
+
+
+def registrar_conexion():
+    """Cuenta una conexión tomada del pool (la llama db.obtener_conexion)"""
+    medicion = medicion_actual()
+    if medicion is not None:
+        medicion.conexiones += 1
+
+
+class CursorInstrumentado(RealDictCursor):
+    """RealDictCursor que suma cada statement a la medición del request en curso"""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._registrar(query, vars, time.perf_counter() - inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._registrar(query, None, time.perf_counter() - inicio)
+
+    def _registrar(self, query, vars, duracion):
+        # Filas devueltas o afectadas (-1 en cursores con nombre, que traen de a lotes)
+        filas = self.rowcount
+        registrar_si_lenta(query, vars, duracion, filas)
+
+        medicion = medicion_actual()
+        if medicion is None:
+            return
+        medicion.consultas += 1
+        medicion.tiempo_db += duracion
+        if filas > 0:
+            medicion.filas += filas
+
+
+def presupuesto_consultas(maximo):
+    """Decorador de vistas: máximo de consultas por request (se verifica en modo estricto)"""
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+def server_timing(medicion):
+    """Valor del header Server-Timing (métricas db y app, en ms)"""
+    total = (time.perf_counter() - medicion.inicio) * 1000
+    return (
+        f'db;dur={medicion.tiempo_db * 1000:.2f};'
+        f'desc="{medicion.consultas} consultas, {medicion.filas} filas, {medicion.conexiones} conexiones", '
+        f'app;dur={total:.2f}'
+    )
+
+
+def registrar_request(medicion, endpoint, metodo, ruta, estado, usuario_id):
+    """Log JSON de una línea con los contadores del request"""
+    if not INSTRUMENTACION_LOG:
+        return
+    logger.info(json.dumps({
+        'evento': 'request',
+        'endpoint': endpoint,
+        'metodo': metodo,
+        'ruta': ruta,
+        'estado': estado,
+        'usuario_id': usuario_id,
+        'duracion_ms': round((time.perf_counter() - medicion.inicio) * 1000, 2),
+        **medicion.resumen(),
+    }, ensure_ascii=False))
+
+
+def verificar_presupuesto(medicion, vista, endpoint, estricto=False):
+    """PresupuestoConsultasExcedido si el request pasó su presupuesto (solo en modo estricto)"""
+    if not (estricto or INSTRUMENTACION_ESTRICTA):
+        return
+    maximo = getattr(vista, 'presupuesto_consultas', PRESUPUESTO_CONSULTAS)
+    if medicion.consultas > maximo:
+        raise PresupuestoConsultasExcedido(
+            f"{endpoint} ejecutó {medicion.consultas} consultas (presupuesto: {maximo})"
+        )
@@ -0,0 +1,94 @@
+"""
+Métricas de la aplicación en formato Prometheus (/metrics)
+Latencia por endpoint, requests en curso, uso del pool, caches, cola de auditoría y
+duración de las exportaciones a Excel.
+
+Con gunicorn (varios workers) PROMETHEUS_MULTIPROC_DIR debe apuntar a un directorio compartido
+y vacío al arrancar: cada worker escribe ahí sus valores y /metrics los suma
+(ver gunicorn.conf.py). Sin esa variable las métricas son las del proceso actual.
+/metrics exige METRICS_TOKEN: sin token configurado responde 401.
+"""
+
+import hmac
+import os
+import threading
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+)
+from prometheus_client import multiprocess
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Cada métrica abre su archivo en el directorio al construirse: tiene que existir también fuera
+# de gunicorn (flask migrar, el cron, una shell), donde on_starting no corre
+if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.getenv('PROMETHEUS_MULTIPROC_DIR'), exist_ok=True)
+
+# Pensados para la instancia chica de Render: la mayoría de los requests están entre 10 ms y 2 s
+BUCKETS_LATENCIA = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+BUCKETS_EXCEL = (0.5, 1, 2, 5, 10, 30, 60, 120)
+
+duracion_requests = Histogram(
+    'http_request_duration_seconds', 'Duración de los requests por endpoint',
+    ('endpoint', 'method', 'status'), buckets=BUCKETS_LATENCIA
+)
+requests_en_curso = Gauge(
+    'http_requests_in_progress', 'Requests en curso', ('endpoint',),
+    multiprocess_mode='livesum'
+)
+conexiones_en_uso = Gauge(
+    'db_pool_connections_in_use', 'Conexiones del pool prestadas', multiprocess_mode='livesum'
+)
+conexiones_maximas = Gauge(
+    'db_pool_connections_max', 'Tamaño máximo del pool', multiprocess_mode='livesum'
+)
+cache_hits = Counter('cache_hits_total', 'Lecturas de cache con valor', ('cache',))
+cache_misses = Counter('cache_misses_total', 'Lecturas de cache sin valor', ('cache',))
+profundidad_auditoria = Gauge(
+    'audit_queue_depth', 'Entradas de auditoría esperando en la cola', multiprocess_mode='livesum'
+)
+duracion_excel = Histogram(
+    'excel_export_duration_seconds', 'Duración de la generación del informe Excel',
+    buckets=BUCKETS_EXCEL
+)
+
+# Últimos contadores de cada cache ya sumados a las métricas (las caches cuentan por proceso)
+_exportado = {}
+_lock = threading.Lock()
+
+
+def _sumar_diferencia(contador, nombre, actual, clave):
+    anterior = _exportado.get(clave, 0)
+    if actual > anterior:
+        contador.labels(nombre).inc(actual - anterior)
+    _exportado[clave] = actual
+
+
+def muestrear(estadisticas_pool, caches, cola_auditoria):
+    """Actualiza las métricas que se leen del estado del proceso (al terminar cada request)"""
+    pool = estadisticas_pool()
+    conexiones_en_uso.set(pool['en_uso'])
+    conexiones_maximas.set(pool['maximo'])
+    profundidad_auditoria.set(cola_auditoria.profundidad())
+    with _lock:
+        for cache in caches:
+            _sumar_diferencia(cache_hits, cache.nombre, cache.hits, (cache.nombre, 'hits'))
+            _sumar_diferencia(cache_misses, cache.nombre, cache.misses, (cache.nombre, 'misses'))
+
+
+def autorizado(encabezado):
+    """/metrics exige 'Authorization: Bearer <METRICS_TOKEN>'; sin token configurado no se expone"""
+    if not METRICS_TOKEN:
+        return False
+    return hmac.compare_digest((encabezado or '').encode(), f'Bearer {METRICS_TOKEN}'.encode())
+
+
+def exportar():
+    """(contenido, content type) de /metrics, sumando todos los workers si hay directorio compartido"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
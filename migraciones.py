@@ -0,0 +1,66 @@
+"""
+Migraciones versionadas de la base de datos
+Aplica en orden los scripts migrations/NNN_descripcion.sql que todavía no se ejecutaron
+"""
+
+import os
+import re
+
+DIRECTORIO_MIGRACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+PATRON_MIGRACION = re.compile(r'^(\d{3})_([\w-]+)\.sql$')
+
+
+def listar_migraciones(directorio=DIRECTORIO_MIGRACIONES):
+    """Devuelve [(version, nombre, ruta)] ordenadas por versión"""
+    migraciones = []
+    for archivo in sorted(os.listdir(directorio)):
+        coincidencia = PATRON_MIGRACION.match(archivo)
+        if coincidencia:
+            migraciones.append((coincidencia.group(1), coincidencia.group(2), os.path.join(directorio, archivo)))
+    return migraciones
+
+
+def versiones_aplicadas(conn):
+    """Crea la tabla de control si no existe y devuelve las versiones ya aplicadas"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version VARCHAR(3) PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migraciones")
+    aplicadas = {fila['version'] for fila in cursor.fetchall()}
+    conn.commit()
+    cursor.close()
+    return aplicadas
+
+
+def aplicar_migraciones(conn, directorio=DIRECTORIO_MIGRACIONES):
+    """Aplica las migraciones pendientes, cada una en su propia transacción"""
+    aplicadas = versiones_aplicadas(conn)
+    nuevas = []
+
+    for version, nombre, ruta in listar_migraciones(directorio):
+        if version in aplicadas:
+            continue
+        with open(ruta, 'r', encoding='utf-8') as f:
+            sql = f.read()
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s)",
+                (version, nombre)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        nuevas.append(f'{version}_{nombre}')
+
+    return nuevas
@@ -0,0 +1,16 @@
+-- ============================================
+-- 001: Índices para informes mensuales y grilla de equipos
+-- Los informes filtran con rangos semiabiertos sobre fecha_ingreso
+-- (fecha_ingreso >= inicio AND fecha_ingreso < fin) en lugar de EXTRACT
+-- ============================================
+
+-- Informes: rango de fechas + desglose por estado, solo equipos activos
+CREATE INDEX IF NOT EXISTS idx_equipos_fecha_ingreso_estado_activos
+    ON equipos (fecha_ingreso, estado)
+    WHERE eliminado = FALSE;
+
+-- Grilla de equipos: paginación keyset (recreado con NULLS LAST en la migración 010)
+CREATE INDEX IF NOT EXISTS idx_equipos_fecha_ingreso_id_activos
+    ON equipos (fecha_ingreso DESC, id DESC)
+    WHERE eliminado = FALSE;
+
@@ -0,0 +1,36 @@
+-- ============================================
+-- 002: Resumen mensual de equipos (rollup de los informes)
+-- Cantidad de equipos activos por (año, mes de ingreso, estado, categoría)
+-- Lo mantiene la aplicación al escribir equipos; se reconstruye con: flask reconstruir-resumen
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS equipos_resumen_mensual (
+    anio INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    estado TEXT NOT NULL DEFAULT '',  -- '' = equipo sin estado
+    categoria TEXT NOT NULL,
+    cantidad INTEGER NOT NULL,
+    PRIMARY KEY (anio, mes, estado, categoria)
+);
+
+-- Carga inicial
+INSERT INTO equipos_resumen_mensual (anio, mes, estado, categoria, cantidad)
+SELECT
+    EXTRACT(YEAR FROM e.fecha_ingreso)::integer,
+    EXTRACT(MONTH FROM e.fecha_ingreso)::integer,
+    COALESCE(e.estado, ''),
+    CASE
+        WHEN s.categoria LIKE '%R%' THEN 'Reparación'
+        WHEN s.categoria LIKE '%G%' THEN 'Garantía'
+        WHEN s.categoria LIKE '%BA%' THEN 'Baja de Alquiler'
+        WHEN s.categoria LIKE '%CA%' THEN 'Cambio de Alquiler'
+        WHEN s.categoria LIKE '%FC%' THEN 'Cambio por Falla Crítica'
+        ELSE 'Otra'
+    END,
+    COUNT(*)
+FROM equipos e
+LEFT JOIN solicitudes s ON e.solicitud_id = s.id
+WHERE e.eliminado = FALSE
+AND e.fecha_ingreso IS NOT NULL
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (anio, mes, estado, categoria) DO NOTHING;
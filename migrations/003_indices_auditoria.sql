@@ -0,0 +1,25 @@
+-- ============================================
+-- 003: Índices del historial de auditoría
+-- El historial pagina por (fecha_cambio DESC NULLS LAST, id DESC); cada filtro tiene
+-- un índice compuesto que termina en esas columnas para evitar el sort
+-- ============================================
+
+-- Sin filtros y por rango de fechas
+CREATE INDEX IF NOT EXISTS idx_auditoria_fecha_id
+    ON equipos_auditoria (fecha_cambio DESC NULLS LAST, id DESC);
+
+-- Historial de un equipo
+CREATE INDEX IF NOT EXISTS idx_auditoria_equipo_fecha_id
+    ON equipos_auditoria (equipo_id, fecha_cambio DESC NULLS LAST, id DESC);
+
+-- Cambios de un usuario
+CREATE INDEX IF NOT EXISTS idx_auditoria_usuario_fecha_id
+    ON equipos_auditoria (usuario_nombre, fecha_cambio DESC NULLS LAST, id DESC);
+
+-- Cambios de un campo
+CREATE INDEX IF NOT EXISTS idx_auditoria_campo_fecha_id
+    ON equipos_auditoria (campo_modificado, fecha_cambio DESC NULLS LAST, id DESC);
+
+-- Por tipo de acción
+CREATE INDEX IF NOT EXISTS idx_auditoria_accion_fecha_id
+    ON equipos_auditoria (accion, fecha_cambio DESC NULLS LAST, id DESC);
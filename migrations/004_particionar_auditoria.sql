@@ -0,0 +1,85 @@
+-- ============================================
+-- 004: equipos_auditoria particionada por mes (RANGE sobre fecha_cambio)
+-- Convierte la tabla existente en una tabla particionada con una partición
+-- por mes, copia los datos y recrea los índices de la migración 003.
+-- Las particiones futuras y el archivado de las viejas los maneja:
+--   flask particiones-auditoria
+-- ============================================
+
+ALTER TABLE equipos_auditoria RENAME TO equipos_auditoria_sin_particionar;
+ALTER INDEX IF EXISTS equipos_auditoria_pkey RENAME TO equipos_auditoria_sin_particionar_pkey;
+
+-- La columna de partición no admite NULL en la clave primaria
+-- (estas filas quedan en la partición default)
+UPDATE equipos_auditoria_sin_particionar
+SET fecha_cambio = TIMESTAMP '1970-01-01'
+WHERE fecha_cambio IS NULL;
+
+CREATE TABLE equipos_auditoria (
+    LIKE equipos_auditoria_sin_particionar INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (fecha_cambio);
+
+-- La clave primaria de una tabla particionada debe incluir la columna de partición
+ALTER TABLE equipos_auditoria ADD PRIMARY KEY (id, fecha_cambio);
+
+-- Filas fuera de los meses creados: nunca se rechaza una auditoría
+CREATE TABLE equipos_auditoria_default PARTITION OF equipos_auditoria DEFAULT;
+
+DO $$
+DECLARE
+    secuencia TEXT := pg_get_serial_sequence('equipos_auditoria_sin_particionar', 'id');
+    restriccion RECORD;
+    mes DATE;
+    ultimo DATE := (date_trunc('month', CURRENT_DATE) + INTERVAL '3 months')::date;
+BEGIN
+    -- La secuencia del id pasa a pertenecer a la tabla nueva (si no, se borraría con la vieja)
+    IF secuencia IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY equipos_auditoria.id', secuencia);
+    END IF;
+
+    -- Claves foráneas de la tabla original
+    FOR restriccion IN
+        SELECT conname, pg_get_constraintdef(oid) AS definicion
+        FROM pg_constraint
+        WHERE conrelid = 'equipos_auditoria_sin_particionar'::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE equipos_auditoria ADD CONSTRAINT %I %s',
+                       restriccion.conname || '_p', restriccion.definicion);
+    END LOOP;
+
+    -- Una partición por mes desde el cambio más antiguo hasta tres meses adelante
+    mes := COALESCE(
+        (SELECT date_trunc('month', MIN(fecha_cambio))::date FROM equipos_auditoria_sin_particionar
+         WHERE fecha_cambio > TIMESTAMP '1970-01-01'),
+        date_trunc('month', CURRENT_DATE)::date
+    );
+    WHILE mes <= ultimo LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF equipos_auditoria FOR VALUES FROM (%L) TO (%L)',
+            'equipos_auditoria_' || to_char(mes, 'YYYY_MM'),
+            mes,
+            (mes + INTERVAL '1 month')::date
+        );
+        mes := (mes + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO equipos_auditoria SELECT * FROM equipos_auditoria_sin_particionar;
+
+DROP TABLE equipos_auditoria_sin_particionar;
+
+-- Índices de la migración 003 (se crean en cada partición; NULLS LAST como el ORDER BY del historial)
+CREATE INDEX IF NOT EXISTS idx_auditoria_fecha_id
+    ON equipos_auditoria (fecha_cambio DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_auditoria_equipo_fecha_id
+    ON equipos_auditoria (equipo_id, fecha_cambio DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_auditoria_usuario_fecha_id
+    ON equipos_auditoria (usuario_nombre, fecha_cambio DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_auditoria_campo_fecha_id
+    ON equipos_auditoria (campo_modificado, fecha_cambio DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_auditoria_accion_fecha_id
+    ON equipos_auditoria (accion, fecha_cambio DESC NULLS LAST, id DESC);
@@ -0,0 +1,46 @@
+-- ============================================
+-- 005: Búsqueda de equipos y solicitudes (/api/buscar)
+-- tsvector (palabras completas y prefijos, con pesos para el ranking)
+-- + pg_trgm (coincidencias parciales y con errores de tipeo)
+-- Configuración 'simple': nombres, series y CUITs no se lematizan
+-- ============================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Equipos: OST y número de serie pesan más que cliente, y éste más que marca/modelo
+ALTER TABLE equipos ADD COLUMN IF NOT EXISTS busqueda tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', COALESCE(ost::text, '')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(numero_serie, '')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(cliente, '')), 'B') ||
+    setweight(to_tsvector('simple', COALESCE(marca, '') || ' ' || COALESCE(modelo, '')), 'C')
+) STORED;
+
+ALTER TABLE equipos ADD COLUMN IF NOT EXISTS texto_busqueda TEXT GENERATED ALWAYS AS (
+    COALESCE(ost::text, '') || ' ' || COALESCE(numero_serie, '') || ' ' ||
+    COALESCE(cliente, '') || ' ' || COALESCE(marca, '') || ' ' || COALESCE(modelo, '')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_equipos_busqueda
+    ON equipos USING GIN (busqueda);
+
+CREATE INDEX IF NOT EXISTS idx_equipos_texto_busqueda_trgm
+    ON equipos USING GIN (texto_busqueda gin_trgm_ops);
+
+-- Solicitudes: CUIT (con y sin guiones) y razón social pesan más que el paciente
+ALTER TABLE solicitudes ADD COLUMN IF NOT EXISTS busqueda tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', COALESCE(cuit, '') || ' ' || regexp_replace(COALESCE(cuit, ''), '\D', '', 'g')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(razon_social, '') || ' ' || COALESCE(nombre_fantasia, '')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(nombre_apellido_paciente, '')), 'B')
+) STORED;
+
+ALTER TABLE solicitudes ADD COLUMN IF NOT EXISTS texto_busqueda TEXT GENERATED ALWAYS AS (
+    regexp_replace(COALESCE(cuit, ''), '\D', '', 'g') || ' ' ||
+    COALESCE(razon_social, '') || ' ' || COALESCE(nombre_fantasia, '') || ' ' ||
+    COALESCE(nombre_apellido_paciente, '')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_solicitudes_busqueda
+    ON solicitudes USING GIN (busqueda);
+
+CREATE INDEX IF NOT EXISTS idx_solicitudes_texto_busqueda_trgm
+    ON solicitudes USING GIN (texto_busqueda gin_trgm_ops);
@@ -0,0 +1,13 @@
+-- ============================================
+-- 006: Índices del listado de solicitudes (/solicitudes)
+-- Página keyset por fecha (mismo orden que orden_keyset: NULLS LAST) y OSTs
+-- vinculadas agregadas solo para las solicitudes de esa página
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_solicitudes_fecha_id
+    ON solicitudes (fecha_solicitud DESC NULLS LAST, id DESC);
+
+-- INCLUDE (ost): el STRING_AGG de la página se resuelve solo con el índice
+CREATE INDEX IF NOT EXISTS idx_equipos_solicitud_activos
+    ON equipos (solicitud_id) INCLUDE (ost)
+    WHERE eliminado = FALSE;
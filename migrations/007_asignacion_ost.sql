@@ -0,0 +1,26 @@
+-- ============================================
+-- 007: Asignación de OST con secuencia y reservas
+-- La secuencia reemplaza a MAX(ost) + 1 (sin duplicados con ingresos simultáneos)
+-- y ost_reservas guarda los números entregados al diálogo de alta
+-- Ver asignacion_ost.py
+-- ============================================
+
+CREATE SEQUENCE IF NOT EXISTS equipos_ost_asignacion_seq AS INTEGER;
+
+-- Continúa desde la OST más alta ya cargada
+SELECT setval('equipos_ost_asignacion_seq', COALESCE(MAX(ost), 1), MAX(ost) IS NOT NULL)
+FROM equipos;
+
+-- Los INSERT sin OST explícita toman el número de la misma secuencia
+ALTER TABLE equipos ALTER COLUMN ost SET DEFAULT nextval('equipos_ost_asignacion_seq');
+
+CREATE TABLE IF NOT EXISTS ost_reservas (
+    ost INTEGER PRIMARY KEY,
+    usuario_id INTEGER NOT NULL,
+    reservado_en TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    vence_en TIMESTAMPTZ NOT NULL
+);
+
+-- Reservas vencidas que se vuelven a entregar
+CREATE INDEX IF NOT EXISTS idx_ost_reservas_vence_en
+    ON ost_reservas (vence_en, ost);
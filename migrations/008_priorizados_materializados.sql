@@ -0,0 +1,31 @@
+-- ============================================
+-- 008: equipos_priorizados materializada
+-- Guarda las filas de la vista equipos_priorizados (que sigue definiendo el puntaje)
+-- para que /equipos-priorizados no recalcule todo el backlog en cada request.
+-- Se refresca por OST en cada escritura y completa una vez por día (ver priorizados.py)
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS equipos_priorizados_materializada AS
+    SELECT v.*, CURRENT_DATE AS calculado_el
+    FROM equipos_priorizados v;
+
+-- Orden de los niveles para leer la página con un solo recorrido del índice
+ALTER TABLE equipos_priorizados_materializada
+    ADD COLUMN IF NOT EXISTS orden_nivel SMALLINT GENERATED ALWAYS AS (
+        CASE nivel_prioridad
+            WHEN 'Critica' THEN 1
+            WHEN 'Alta' THEN 2
+            WHEN 'Media' THEN 3
+            WHEN 'Baja' THEN 4
+            ELSE 5
+        END
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_priorizados_orden
+    ON equipos_priorizados_materializada (orden_nivel, prioridad_final DESC, ost);
+
+CREATE INDEX IF NOT EXISTS idx_priorizados_ost
+    ON equipos_priorizados_materializada (ost);
+
+CREATE INDEX IF NOT EXISTS idx_priorizados_calculado_el
+    ON equipos_priorizados_materializada (calculado_el);
@@ -0,0 +1,20 @@
+-- ============================================
+-- 009: Grupo de categoría de las solicitudes
+-- Única definición de la clasificación de solicitudes.categoria (antes repetida
+-- como CASE ... LIKE en el dashboard, los informes y el resumen mensual).
+-- Columna generada: se mantiene sola en cada INSERT/UPDATE de la solicitud.
+-- ============================================
+
+ALTER TABLE solicitudes ADD COLUMN IF NOT EXISTS categoria_grupo TEXT GENERATED ALWAYS AS (
+    CASE
+        WHEN categoria LIKE '%R%' THEN 'Reparación'
+        WHEN categoria LIKE '%G%' THEN 'Garantía'
+        WHEN categoria LIKE '%BA%' THEN 'Baja de Alquiler'
+        WHEN categoria LIKE '%CA%' THEN 'Cambio de Alquiler'
+        WHEN categoria LIKE '%FC%' THEN 'Cambio por Falla Crítica'
+        ELSE 'Otra'
+    END
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_solicitudes_categoria_grupo
+    ON solicitudes (categoria_grupo, id);
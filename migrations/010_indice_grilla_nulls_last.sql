@@ -0,0 +1,13 @@
+-- ============================================
+-- 010: Índice de la grilla de equipos con NULLS LAST
+-- El índice de la migración 001 era (fecha_ingreso DESC, id DESC), que en un
+-- DESC implica NULLS FIRST; la grilla ordena con orden_keyset
+-- (fecha_ingreso DESC NULLS LAST, id DESC) y el planner no podía usarlo
+-- para ese ORDER BY. Se recrea con el mismo orden que la consulta.
+-- ============================================
+
+DROP INDEX IF EXISTS idx_equipos_fecha_ingreso_id_activos;
+
+CREATE INDEX idx_equipos_fecha_ingreso_id_activos
+    ON equipos (fecha_ingreso DESC NULLS LAST, id DESC)
+    WHERE eliminado = FALSE;
@@ -0,0 +1,28 @@
+-- ============================================
+-- 011: Índices del historial de auditoría con NULLS LAST
+-- Las migraciones 003 y 004 los creaban como (..., fecha_cambio DESC, id DESC),
+-- que en un DESC implica NULLS FIRST; el historial ordena por
+-- fecha_cambio DESC NULLS LAST, id DESC y el planner no podía tomar el orden
+-- del índice (ordenaba todas las filas del filtro en cada página).
+-- Sobre la tabla particionada, cada índice se recrea en todas las particiones.
+-- ============================================
+
+DROP INDEX IF EXISTS idx_auditoria_fecha_id;
+CREATE INDEX idx_auditoria_fecha_id
+    ON equipos_auditoria (fecha_cambio DESC NULLS LAST, id DESC);
+
+DROP INDEX IF EXISTS idx_auditoria_equipo_fecha_id;
+CREATE INDEX idx_auditoria_equipo_fecha_id
+    ON equipos_auditoria (equipo_id, fecha_cambio DESC NULLS LAST, id DESC);
+
+DROP INDEX IF EXISTS idx_auditoria_usuario_fecha_id;
+CREATE INDEX idx_auditoria_usuario_fecha_id
+    ON equipos_auditoria (usuario_nombre, fecha_cambio DESC NULLS LAST, id DESC);
+
+DROP INDEX IF EXISTS idx_auditoria_campo_fecha_id;
+CREATE INDEX idx_auditoria_campo_fecha_id
+    ON equipos_auditoria (campo_modificado, fecha_cambio DESC NULLS LAST, id DESC);
+
+DROP INDEX IF EXISTS idx_auditoria_accion_fecha_id;
+CREATE INDEX idx_auditoria_accion_fecha_id
+    ON equipos_auditoria (accion, fecha_cambio DESC NULLS LAST, id DESC);
@@ -0,0 +1,79 @@
+"""
+Utilidades de paginación por cursor (keyset / seek)
+El cursor codifica el valor de la columna de orden y el id de la última fila
+"""
+
+import base64
+import json
+
+
+def codificar_cursor(valor, ultimo_id):
+    """Genera un cursor opaco para la siguiente página"""
+    datos = json.dumps({'v': valor, 'id': ultimo_id}, default=str)
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (valor, id) a partir de un cursor; ValueError si es inválido"""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datos['v'], int(datos['id'])
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+
+def normalizar_direccion(direccion, por_defecto='DESC'):
+    """Valida la dirección de orden (ASC / DESC)"""
+    direccion = (direccion or por_defecto).upper()
+    if direccion not in ('ASC', 'DESC'):
+        raise ValueError("Dirección de orden inválida. Debe ser ASC o DESC")
+    return direccion
+
+
+def orden_keyset(columna, columna_id, direccion):
+    """ORDER BY estable para keyset: NULLs al final y el id como desempate"""
+    if columna == columna_id:
+        return f"{columna_id} {direccion}"
+    return f"{columna} {direccion} NULLS LAST, {columna_id} {direccion}"
+
+
+def condicion_keyset(columna, columna_id, direccion, valor, ultimo_id, admite_nulos=True, nombre=None):
+    """Condición WHERE para buscar las filas posteriores al cursor (coherente con orden_keyset)
+
+    La parte no nula es una comparación de filas, (col, id) < (v, x), que el planner usa como
+    límite del rango del índice (col DESC NULLS LAST, id DESC) en vez de recorrerlo desde el
+    principio. Las filas con NULL van al final: son otra rama del OR, que se omite si la
+    columna no admite nulos (admite_nulos=False).
+
+    Devuelve (condición, [params]) con %s posicionales; con nombre='cursor' usa
+    %(cursor_valor)s / %(cursor_id)s y devuelve los params como dict.
+    """
+    op = '<' if direccion == 'DESC' else '>'
+    if nombre:
+        marca_valor, marca_id = f'%({nombre}_valor)s', f'%({nombre}_id)s'
+    else:
+        marca_valor = marca_id = '%s'
+
+    def parametros(*valores):
+        if not nombre:
+            return list(valores)
+        claves = (f'{nombre}_id',) if len(valores) == 1 else (f'{nombre}_valor', f'{nombre}_id')
+        return dict(zip(claves, valores))
+
+    if columna == columna_id:
+        return f"{columna_id} {op} {marca_id}", parametros(ultimo_id)
+    if valor is None:
+        return f"({columna} IS NULL AND {columna_id} {op} {marca_id})", parametros(ultimo_id)
+    condicion = f"({columna}, {columna_id}) {op} ({marca_valor}, {marca_id})"
+    if admite_nulos:
+        condicion = f"({condicion} OR {columna} IS NULL)"
+    return condicion, parametros(valor, ultimo_id)
+
+
+def parsear_limite(valor, por_defecto=100, maximo=500):
+    """Tamaño de página acotado"""
+    try:
+        limite = int(valor) if valor is not None else por_defecto
+    except (TypeError, ValueError):
+        raise ValueError("Límite de página inválido")
+    return max(1, min(limite, maximo))
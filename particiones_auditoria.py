@@ -0,0 +1,134 @@
+"""
+Mantenimiento de las particiones mensuales de equipos_auditoria (ver migrations/004)
+Crea las particiones de los próximos meses (cron diario, ver render.yaml) y exporta las viejas
+a archivos .csv.gz. El disco de la instancia es efímero: el destino tiene que ser un volumen
+persistente o un directorio que se copie afuera antes de borrar las particiones.
+"""
+
+import gzip
+import os
+import re
+import shutil
+from datetime import date
+
+TABLA = 'equipos_auditoria'
+PARTICION_DEFAULT = f'{TABLA}_default'
+PATRON_PARTICION = re.compile(rf'^{TABLA}_(\d{{4}})_(\d{{2}})$')
+
+
+def nombre_particion(anio, mes):
+    return f'{TABLA}_{anio:04d}_{mes:02d}'
+
+
+def sumar_meses(anio, mes, cantidad):
+    """(anio, mes) desplazado cantidad meses"""
+    total = anio * 12 + (mes - 1) + cantidad
+    return total // 12, total % 12 + 1
+
+
+def listar_particiones(conn):
+    """Particiones mensuales adjuntas: [(anio, mes, nombre)] ordenadas"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.relname as nombre
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (TABLA,))
+    particiones = []
+    for fila in cursor.fetchall():
+        coincidencia = PATRON_PARTICION.match(fila['nombre'])
+        if coincidencia:
+            particiones.append((int(coincidencia.group(1)), int(coincidencia.group(2)), fila['nombre']))
+    cursor.close()
+    return sorted(particiones)
+
+
+def crear_particiones_futuras(conn, meses_adelante=3, hoy=None):
+    """Crea las particiones desde el mes actual hasta meses_adelante; devuelve las creadas
+
+    Si la partición default ya tiene filas de ese mes, se mueven a la partición nueva antes
+    de adjuntarla (si no, ATTACH fallaría).
+    """
+    hoy = hoy or date.today()
+    existentes = {(anio, mes) for anio, mes, _ in listar_particiones(conn)}
+    creadas = []
+
+    for desplazamiento in range(meses_adelante + 1):
+        anio, mes = sumar_meses(hoy.year, hoy.month, desplazamiento)
+        if (anio, mes) in existentes:
+            continue
+
+        nombre = nombre_particion(anio, mes)
+        inicio = date(anio, mes, 1)
+        fin = date(*sumar_meses(anio, mes, 1), 1)
+
+        cursor = conn.cursor()
+        try:
+            # Sin INCLUDING INDEXES: ATTACH crea en la partición los índices de la tabla padre,
+            # con la misma definición (fecha_cambio DESC NULLS LAST, id DESC)
+            cursor.execute(
+                f"CREATE TABLE {nombre} (LIKE {TABLA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+            cursor.execute(f"""
+                WITH movidas AS (
+                    DELETE FROM {PARTICION_DEFAULT}
+                    WHERE fecha_cambio >= %s AND fecha_cambio < %s
+                    RETURNING *
+                )
+                INSERT INTO {nombre} SELECT * FROM movidas
+            """, (inicio, fin))
+            cursor.execute(
+                f"ALTER TABLE {TABLA} ATTACH PARTITION {nombre} FOR VALUES FROM (%s) TO (%s)",
+                (inicio, fin)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        creadas.append(nombre)
+
+    return creadas
+
+
+def archivar_particiones(conn, antes_de, destino, borrar=False):
+    """Exporta a destino/<particion>.csv.gz las particiones de meses anteriores a antes_de (date)
+    y las separa de la tabla (DETACH); solo con borrar=True además las elimina (DROP), así que
+    sin él los datos siguen en la base como tablas sueltas. Devuelve los archivos.
+    """
+    os.makedirs(destino, exist_ok=True)
+    archivos = []
+
+    for anio, mes, nombre in listar_particiones(conn):
+        if date(anio, mes, 1) >= date(antes_de.year, antes_de.month, 1):
+            continue
+
+        ruta = os.path.join(destino, f'{nombre}.csv.gz')
+        temporal = f'{ruta}.tmp'
+        cursor = conn.cursor()
+        try:
+            # Nadie escribe en la partición entre el export y el DETACH
+            cursor.execute(f"LOCK TABLE {nombre} IN SHARE MODE")
+            # Primero el export: si falla, la partición sigue intacta en la tabla
+            with gzip.open(temporal, 'wb') as f:
+                cursor.copy_expert(f"COPY {nombre} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            with open(temporal, 'rb') as f:
+                os.fsync(f.fileno())
+            shutil.move(temporal, ruta)
+
+            cursor.execute(f"ALTER TABLE {TABLA} DETACH PARTITION {nombre}")
+            if borrar:
+                cursor.execute(f"DROP TABLE {nombre}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        finally:
+            cursor.close()
+        archivos.append(ruta)
+
+    return archivos
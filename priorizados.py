@@ -0,0 +1,140 @@
+"""
+Equipos priorizados materializados (ver migrations/008)
+La vista equipos_priorizados sigue siendo la definición del puntaje; sus filas se guardan en
+equipos_priorizados_materializada y cada escritura recalcula solo los equipos que toca.
+Como el puntaje depende de la fecha (días sin cambios), un cron diario la regenera completa
+(`flask reconstruir-priorizados --si-vencido`, ver render.yaml).
+Los equipos sin OST (cargados antes de la secuencia de migrations/007) no tienen clave propia
+en la tabla: se recalculan juntos, como un grupo, cuando se escribe alguno de ellos.
+"""
+
+TABLA = 'equipos_priorizados_materializada'
+
+# Columnas de la vista que se materializan (las que muestra /equipos-priorizados), por nombre:
+# un cambio en el orden de la vista no corre los datos y una columna que falte da error
+COLUMNAS = (
+    'ost', 'solicitud_id', 'cliente', 'tipo_equipo', 'marca', 'modelo', 'numero_serie',
+    'fecha_ingreso', 'remito', 'accesorios', 'observacion_ingreso', 'estado', 'prioridad',
+    'reingreso', 'detalles_reparacion', 'horas_trabajo', 'costo_reparacion', 'precio_cliente',
+    'proveedor', 'numero_ov', 'estado_ov', 'comercial_cargo', 'fecha_envio', 'fecha_entrega',
+    'remito_entrega', 'categoria', 'nivel_urgencia', 'dias_sin_cambios', 'prioridad_final',
+    'nivel_prioridad'
+)
+
+_INSERTAR_DESDE_VISTA = f"""
+    INSERT INTO {TABLA} ({', '.join(COLUMNAS)}, calculado_el)
+    SELECT {', '.join('v.' + columna for columna in COLUMNAS)}, CURRENT_DATE
+    FROM equipos_priorizados v
+"""
+
+NIVELES = ('Critica', 'Alta', 'Media', 'Baja')
+
+# Clave (int4) de los advisory locks: pg_advisory_xact_lock(CLAVE_BLOQUEO, ost);
+# la regeneración diaria usa (CLAVE_BLOQUEO, BLOQUEO_REGENERACION) y el grupo de equipos
+# sin OST (CLAVE_BLOQUEO, BLOQUEO_SIN_OST)
+CLAVE_BLOQUEO = 20902
+BLOQUEO_REGENERACION = -1
+BLOQUEO_SIN_OST = -2
+
+
+def osts_solicitud(cursor, solicitud_id):
+    """OSTs de los equipos de una solicitud (categoría y urgencia vienen de la solicitud)"""
+    cursor.execute(
+        "SELECT ost FROM equipos WHERE solicitud_id = %s",
+        (solicitud_id,)
+    )
+    return {fila['ost'] for fila in cursor.fetchall()}
+
+
+def refrescar_priorizados(cursor, osts):
+    """Recalcula las filas de las OSTs indicadas dentro de la transacción en curso
+
+    Llamar después de la escritura y antes del commit; un equipo que ya no está en la vista
+    (finalizado o eliminado) sale de la tabla. Un None en osts recalcula el grupo de equipos
+    sin OST.
+    """
+    osts = set(osts)
+    sin_ost = None in osts
+    osts = sorted(osts - {None})
+    if not osts and not sin_ost:
+        return
+
+    # Todos los locks en un statement y en orden de clave: dos escrituras con OSTs en común
+    # no se cruzan (sin deadlock) y no hay un round trip por OST
+    claves = sorted(osts + ([BLOQUEO_SIN_OST] if sin_ost else []))
+    cursor.execute("""
+        SELECT pg_advisory_xact_lock(%s, clave)
+        FROM (SELECT clave FROM unnest(%s::int[]) AS clave ORDER BY clave) ordenadas
+    """, (CLAVE_BLOQUEO, claves))
+
+    # Borrado y recálculo en un solo statement; el filtro por OST se empuja dentro de la
+    # vista: no se puntúa todo el backlog
+    if osts:
+        cursor.execute(f"""
+            WITH borradas AS (DELETE FROM {TABLA} WHERE ost = ANY(%s))
+            {_INSERTAR_DESDE_VISTA} WHERE v.ost = ANY(%s)
+        """, (osts, osts))
+    if sin_ost:
+        cursor.execute(f"""
+            WITH borradas AS (DELETE FROM {TABLA} WHERE ost IS NULL)
+            {_INSERTAR_DESDE_VISTA} WHERE v.ost IS NULL
+        """)
+
+
+def reconstruir_priorizados(conn):
+    """Regenera la tabla completa desde la vista; devuelve la cantidad de filas"""
+    cursor = conn.cursor()
+    try:
+        # Bloquea los refrescos incrementales (no las lecturas) mientras se reconstruye
+        cursor.execute(f"LOCK TABLE {TABLA} IN EXCLUSIVE MODE")
+        cursor.execute(f"DELETE FROM {TABLA}")
+        cursor.execute(_INSERTAR_DESDE_VISTA)
+        filas = cursor.rowcount
+        conn.commit()
+        return filas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def actualizar_si_vencido(conn):
+    """Regenera la tabla si tiene filas calculadas otro día; True si la regeneró
+
+    La usa el cron diario (no las páginas: la reconstrucción bloquea la tabla). Si otro
+    proceso ya la está regenerando no se espera.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT 1 FROM {TABLA} WHERE calculado_el < CURRENT_DATE LIMIT 1")
+    vencida = cursor.fetchone() is not None
+    if vencida:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s) as tomado", (CLAVE_BLOQUEO, BLOQUEO_REGENERACION))
+        vencida = cursor.fetchone()['tomado']
+    conn.commit()
+    cursor.close()
+    if not vencida:
+        return False
+
+    try:
+        reconstruir_priorizados(conn)
+    finally:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_unlock(%s, %s)", (CLAVE_BLOQUEO, BLOQUEO_REGENERACION))
+        conn.commit()
+        cursor.close()
+    return True
+
+
+def consultar_priorizados(conn):
+    """Filas agrupadas por nivel, más urgentes primero (un solo recorrido del índice de orden)"""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT * FROM {TABLA}
+        ORDER BY orden_nivel, prioridad_final DESC, ost
+    """)
+    equipos_agrupados = {nivel: [] for nivel in NIVELES}
+    for equipo in cursor.fetchall():
+        equipos_agrupados.setdefault(equipo['nivel_prioridad'], []).append(equipo)
+    cursor.close()
+    return equipos_agrupados
@@ -0,0 +1,114 @@
+"""
+Resumen mensual de equipos (rollup de los informes)
+Cantidad de equipos activos por (año, mes de ingreso, estado, categoría) en equipos_resumen_mensual.
+Cada escritura recalcula solo los meses que toca; reconstruir_resumen() lo regenera completo.
+"""
+
+from informes import rango_periodo
+
+# Clave (int4) de los advisory locks del resumen: pg_advisory_xact_lock(CLAVE_BLOQUEO, anio * 100 + mes)
+CLAVE_BLOQUEO = 20901
+
+AGREGADO_SQL = """
+    SELECT
+        {anio}, {mes},
+        COALESCE(e.estado, ''),
+        COALESCE(s.categoria_grupo, 'Otra'),
+        COUNT(*)
+    FROM {origen}
+    LEFT JOIN solicitudes s ON e.solicitud_id = s.id
+    WHERE e.eliminado = FALSE
+    {condicion}
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+def meses_equipos(cursor, equipo_ids):
+    """Meses de ingreso (anio, mes) de los equipos indicados"""
+    if not equipo_ids:
+        return set()
+    cursor.execute("""
+        SELECT DISTINCT
+            EXTRACT(YEAR FROM fecha_ingreso)::integer as anio,
+            EXTRACT(MONTH FROM fecha_ingreso)::integer as mes
+        FROM equipos
+        WHERE id = ANY(%s)
+        AND fecha_ingreso IS NOT NULL
+    """, (list(equipo_ids),))
+    return {(fila['anio'], fila['mes']) for fila in cursor.fetchall()}
+
+
+def meses_de_fechas(*fechas):
+    """Meses (anio, mes) de las fechas dadas, ignorando las vacías"""
+    return {(fecha.year, fecha.month) for fecha in fechas if fecha}
+
+
+def meses_solicitud(cursor, solicitud_id):
+    """Meses de ingreso de los equipos de una solicitud"""
+    cursor.execute("SELECT id FROM equipos WHERE solicitud_id = %s", (solicitud_id,))
+    return meses_equipos(cursor, [fila['id'] for fila in cursor.fetchall()])
+
+
+def refrescar_resumen(cursor, meses):
+    """Recalcula el resumen de los meses indicados dentro de la transacción en curso
+
+    Llamar después de la escritura y antes del commit. El advisory lock por mes serializa
+    los refrescos concurrentes: quien espera recalcula viendo el commit del otro.
+    """
+    meses = sorted(set(meses))
+    if not meses:
+        return
+
+    # Todos los locks en un statement y en orden de mes (sin deadlocks entre escrituras)
+    cursor.execute("""
+        SELECT pg_advisory_xact_lock(%s, clave)
+        FROM (SELECT clave FROM unnest(%s::int[]) AS clave ORDER BY clave) ordenadas
+    """, (CLAVE_BLOQUEO, [anio * 100 + mes for anio, mes in meses]))
+
+    anios = [anio for anio, _ in meses]
+    numeros_mes = [mes for _, mes in meses]
+    rangos = [rango_periodo(anio, mes) for anio, mes in meses]
+
+    cursor.execute("""
+        DELETE FROM equipos_resumen_mensual r
+        USING unnest(%s::integer[], %s::integer[]) AS p(anio, mes)
+        WHERE r.anio = p.anio AND r.mes = p.mes
+    """, (anios, numeros_mes))
+
+    cursor.execute(
+        "INSERT INTO equipos_resumen_mensual (anio, mes, estado, categoria, cantidad)" +
+        AGREGADO_SQL.format(
+            anio='p.anio',
+            mes='p.mes',
+            origen="""unnest(%s::integer[], %s::integer[], %s::date[], %s::date[]) AS p(anio, mes, inicio, fin)
+    JOIN equipos e ON e.fecha_ingreso >= p.inicio AND e.fecha_ingreso < p.fin""",
+            condicion=''
+        ),
+        (anios, numeros_mes, [inicio for inicio, _ in rangos], [fin for _, fin in rangos])
+    )
+
+
+def reconstruir_resumen(conn):
+    """Regenera el resumen completo a partir de equipos; devuelve la cantidad de filas"""
+    cursor = conn.cursor()
+    try:
+        # Bloquea los refrescos incrementales (no las lecturas) mientras se reconstruye
+        cursor.execute("LOCK TABLE equipos_resumen_mensual IN EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM equipos_resumen_mensual")
+        cursor.execute(
+            "INSERT INTO equipos_resumen_mensual (anio, mes, estado, categoria, cantidad)" +
+            AGREGADO_SQL.format(
+                anio='EXTRACT(YEAR FROM e.fecha_ingreso)::integer',
+                mes='EXTRACT(MONTH FROM e.fecha_ingreso)::integer',
+                origen='equipos e',
+                condicion='AND e.fecha_ingreso IS NOT NULL'
+            )
+        )
+        filas = cursor.rowcount
+        conn.commit()
+        return filas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,146 @@
+"""
+Consulta paginada del listado de solicitudes
+Paginación keyset sobre (fecha_solicitud DESC, id DESC); las OSTs vinculadas se agregan
+solo para las solicitudes de la página (ver migrations/006). El listado trae los textos
+libres recortados; el detalle completo sale de obtener_solicitud
+"""
+
+from paginacion import codificar_cursor, decodificar_cursor, condicion_keyset, orden_keyset, parsear_limite
+
+# Largo de los textos libres en el listado: la tabla muestra 40 caracteres + '...'
+# y el texto completo se pide a /api/solicitud/<id> al abrirlo
+LARGO_RESUMEN = 40
+
+COLUMNAS_LISTADO = f"""
+    s.id,
+    s.fecha_solicitud,
+    s.estado,
+    s.categoria,
+    s.pdf_url,
+    s.email_solicitante,
+    s.quien_completa,
+    s.nivel_urgencia,
+    LEFT(s.motivo_solicitud, {LARGO_RESUMEN + 1}) as motivo_solicitud,
+    s.comercial_syemed,
+    CASE WHEN s.categoria LIKE '%%G%%' THEN 'Sí' ELSE 'No' END as garantia,
+    -- Colaborador Syemed
+    s.area_solicitante,
+    s.solicitante,
+    LEFT(s.logistica_cargo, {LARGO_RESUMEN + 1}) as logistica_cargo,
+    LEFT(s.comentarios_caso, {LARGO_RESUMEN + 1}) as comentarios_caso,
+    s.equipo_corresponde_a,
+    -- Distribuidor / Institución
+    s.nombre_fantasia,
+    s.razon_social,
+    s.cuit,
+    s.contacto_nombre,
+    s.contacto_telefono,
+    s.contacto_tecnico,
+    s.equipo_propiedad,
+    -- Paciente Particular
+    s.nombre_apellido_paciente,
+    s.telefono_paciente,
+    s.equipo_origen
+"""
+
+COLUMNAS_DETALLE = """
+    s.id,
+    s.fecha_solicitud,
+    s.estado,
+    s.categoria,
+    s.pdf_url,
+    s.email_solicitante,
+    s.quien_completa,
+    s.nivel_urgencia,
+    s.motivo_solicitud,
+    s.comercial_syemed,
+    CASE WHEN s.categoria LIKE '%%G%%' THEN 'Sí' ELSE 'No' END as garantia,
+    s.area_solicitante,
+    s.solicitante,
+    s.logistica_cargo,
+    s.comentarios_caso,
+    s.equipo_corresponde_a,
+    s.nombre_fantasia,
+    s.razon_social,
+    s.cuit,
+    s.contacto_nombre,
+    s.contacto_telefono,
+    s.contacto_tecnico,
+    s.equipo_propiedad,
+    s.nombre_apellido_paciente,
+    s.telefono_paciente,
+    s.equipo_origen
+"""
+
+LIMITE_POR_DEFECTO = 100
+
+
+def consultar_pagina_solicitudes(conn, args):
+    """Una página de solicitudes (más recientes primero) con el cursor de la siguiente"""
+    limite = parsear_limite(args.get('limite'), por_defecto=LIMITE_POR_DEFECTO)
+    condiciones = []
+    params = []
+
+    cursor_pagina = args.get('cursor')
+    if cursor_pagina:
+        valor, ultimo_id = decodificar_cursor(cursor_pagina)
+        condicion, params_cursor = condicion_keyset('s.fecha_solicitud', 's.id', 'DESC', valor, ultimo_id)
+        condiciones.append(condicion)
+        params.extend(params_cursor)
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+    orden = orden_keyset('fecha_solicitud', 'id', 'DESC')
+
+    # Primero la página, después un único GROUP BY de sus equipos (sin subconsulta por fila)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        WITH pagina AS (
+            SELECT {COLUMNAS_LISTADO}
+            FROM solicitudes s
+            {where}
+            ORDER BY {orden_keyset('s.fecha_solicitud', 's.id', 'DESC')}
+            LIMIT %s
+        ),
+        osts AS (
+            SELECT e.solicitud_id,
+                   STRING_AGG(DISTINCT e.ost::TEXT, ', ' ORDER BY e.ost::TEXT) as osts_vinculadas
+            FROM equipos e
+            WHERE e.eliminado = FALSE
+            AND e.solicitud_id IN (SELECT id FROM pagina)
+            GROUP BY e.solicitud_id
+        )
+        SELECT p.*, o.osts_vinculadas
+        FROM pagina p
+        LEFT JOIN osts o ON o.solicitud_id = p.id
+        ORDER BY {orden}
+    """, params + [limite + 1])
+    solicitudes = cursor.fetchall()
+    cursor.close()
+
+    siguiente = None
+    if len(solicitudes) > limite:
+        solicitudes = solicitudes[:limite]
+        ultima = solicitudes[-1]
+        siguiente = codificar_cursor(ultima['fecha_solicitud'], ultima['id'])
+
+    return {
+        'solicitudes': solicitudes,
+        'cursor_siguiente': siguiente,
+        'limite': limite
+    }
+
+
+def obtener_solicitud(conn, solicitud_id):
+    """Detalle completo de una solicitud con sus OSTs vinculadas; None si no existe"""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT {COLUMNAS_DETALLE},
+            (SELECT STRING_AGG(DISTINCT e.ost::TEXT, ', ' ORDER BY e.ost::TEXT)
+             FROM equipos e
+             WHERE e.solicitud_id = s.id AND e.eliminado = FALSE) as osts_vinculadas
+        FROM solicitudes s
+        WHERE s.id = %s
+    """, (solicitud_id,))
+    solicitud = cursor.fetchone()
+    cursor.close()
+    return solicitud
@@ -174,6 +174,424 @@ def test_sql():
         print_check(f"Error al leer SQL: {e}", False)
         return False
 
+def test_plan_informes():
+    """Verifica con EXPLAIN que los informes mensuales usen los índices de fecha_ingreso"""
+    print_header("6. PLAN DE CONSULTA DE INFORMES")
+
+    if not os.getenv('DATABASE_URL'):
+        print_check("DATABASE_URL no configurada, se omite el EXPLAIN", True)
+        return True
+
+    try:
+        import json
+        from db import conexion
+        from informes import construir_filtro_informe
+
+        filtro, params = construir_filtro_informe(2024, 6)
+        with conexion() as conn:
+            cursor = conn.cursor()
+            # Con pocas filas el planner prefiere el seq scan: se desalienta solo para esta verificación
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"""
+                EXPLAIN (FORMAT JSON)
+                SELECT COUNT(*) FROM equipos e
+                LEFT JOIN solicitudes s ON e.solicitud_id = s.id
+                WHERE {filtro}
+            """, params)
+            plan = cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+
+        usa_indice = 'idx_equipos_fecha_ingreso' in json.dumps(plan['QUERY PLAN'])
+        print_check("El informe mensual usa un índice de fecha_ingreso", usa_indice)
+        return usa_indice
+    except Exception as e:
+        print_check(f"Error al verificar el plan: {e}", False)
+        return False
+
+def test_paginacion():
+    """Verifica los cursores y la condición keyset de paginacion.py"""
+    print_header("7. PAGINACIÓN POR CURSOR")
+
+    from paginacion import codificar_cursor, decodificar_cursor, condicion_keyset
+
+    cursor = codificar_cursor('2024-06-01 10:00:00', 42)
+    ida_y_vuelta = decodificar_cursor(cursor) == ('2024-06-01 10:00:00', 42)
+    print_check("codificar_cursor / decodificar_cursor conservan valor e id", ida_y_vuelta)
+
+    sin_valor = decodificar_cursor(codificar_cursor(None, 7)) == (None, 7)
+    print_check("Un cursor con valor NULL se decodifica", sin_valor)
+
+    invalidos_ok = True
+    for invalido in ('no-es-base64!', codificar_cursor('x', 1)[:-4], 'e30='):
+        try:
+            decodificar_cursor(invalido)
+            invalidos_ok = False
+        except ValueError:
+            pass
+    print_check("Cursores inválidos levantan ValueError", invalidos_ok)
+
+    condicion, params = condicion_keyset('a.fecha', 'a.id', 'DESC', '2024-06-01', 42)
+    fila_ok = (condicion == "((a.fecha, a.id) < (%s, %s) OR a.fecha IS NULL)"
+               and params == ['2024-06-01', 42])
+    print_check("DESC: comparación de filas y rama de NULLs", fila_ok)
+
+    condicion, params = condicion_keyset('a.fecha', 'a.id', 'ASC', 5, 42, admite_nulos=False)
+    asc_ok = condicion == "(a.fecha, a.id) > (%s, %s)" and params == [5, 42]
+    print_check("ASC sin nulos: solo la comparación de filas", asc_ok)
+
+    condicion, params = condicion_keyset('a.fecha', 'a.id', 'DESC', None, 42)
+    nulos_ok = condicion == "(a.fecha IS NULL AND a.id < %s)" and params == [42]
+    print_check("Cursor en la cola de NULLs: solo avanza por id", nulos_ok)
+
+    condicion, params = condicion_keyset('a.id', 'a.id', 'DESC', 42, 42)
+    id_ok = condicion == "a.id < %s" and params == [42]
+    print_check("Orden por id: una sola comparación", id_ok)
+
+    condicion, params = condicion_keyset('t.rank', 't.id', 'DESC', 0.5, 42, admite_nulos=False, nombre='cursor')
+    nombrados_ok = (condicion == "(t.rank, t.id) < (%(cursor_valor)s, %(cursor_id)s)"
+                    and params == {'cursor_valor': 0.5, 'cursor_id': 42})
+    print_check("Con nombre: parámetros nombrados en un dict", nombrados_ok)
+
+    ok = (ida_y_vuelta and sin_valor and invalidos_ok and fila_ok and asc_ok and nulos_ok and id_ok
+          and nombrados_ok)
+    assert ok, "La paginación por cursor no se comporta como se espera"
+    return ok
+
+def _nodos_plan(nodo):
+    """Nodo del plan de EXPLAIN (FORMAT JSON) y todos sus hijos"""
+    yield nodo
+    for hijo in nodo.get('Plans', []):
+        yield from _nodos_plan(hijo)
+
+def _explicar(consulta, params=None):
+    """Nodo raíz del plan de EXPLAIN (FORMAT JSON) de la consulta"""
+    from db import conexion
+
+    with conexion() as conn:
+        cursor = conn.cursor()
+        # Con pocas filas el planner prefiere el seq scan + sort: se desalienta solo para esta verificación
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {consulta}", params)
+        plan = cursor.fetchone()['QUERY PLAN'][0]['Plan']
+        cursor.close()
+        conn.rollback()
+    return plan
+
+def _plan_sin_sort(consulta, params=None):
+    """Plan JSON de la consulta y si sale ordenado de los índices (sin nodo Sort)
+
+    Un Merge Append (particiones) tiene 'Sort Key' pero no ordena: mezcla índices ya ordenados.
+    """
+    import json
+
+    plan = _explicar(consulta, params)
+    sin_sort = all(nodo['Node Type'] not in ('Sort', 'Incremental Sort') for nodo in _nodos_plan(plan))
+    return json.dumps(plan), sin_sort
+
+def test_plan_grilla():
+    """Verifica con EXPLAIN que la primera página de la grilla salga del índice keyset, sin Sort"""
+    print_header("8. PLAN DE LA GRILLA DE EQUIPOS")
+
+    if not os.getenv('DATABASE_URL'):
+        print_check("DATABASE_URL no configurada, se omite el EXPLAIN", True)
+        return True
+
+    try:
+        from paginacion import orden_keyset
+
+        plan, sin_sort = _plan_sin_sort(f"""
+            SELECT e.id FROM equipos e
+            WHERE e.eliminado = FALSE
+            ORDER BY {orden_keyset('e.fecha_ingreso', 'e.id', 'DESC')}
+            LIMIT 101
+        """)
+        usa_indice = 'idx_equipos_fecha_ingreso_id_activos' in plan
+        print_check("La grilla usa idx_equipos_fecha_ingreso_id_activos", usa_indice)
+        print_check("La página sale ordenada del índice (sin Sort)", sin_sort)
+        return usa_indice and sin_sort
+    except Exception as e:
+        print_check(f"Error al verificar el plan: {e}", False)
+        return False
+
+def test_plan_historial():
+    """Verifica con EXPLAIN que las páginas del historial de auditoría no ordenen filas"""
+    print_header("9. PLAN DEL HISTORIAL DE AUDITORÍA")
+
+    if not os.getenv('DATABASE_URL'):
+        print_check("DATABASE_URL no configurada, se omite el EXPLAIN", True)
+        return True
+
+    try:
+        from paginacion import condicion_keyset
+
+        condicion, params = condicion_keyset(
+            'a.fecha_cambio', 'a.id', 'DESC', '2024-06-01 00:00:00', 1000, admite_nulos=False
+        )
+        consultas = {
+            'Primera página': ('TRUE', []),
+            'Página siguiente': (condicion, params),
+            'Página siguiente de un equipo': (f'a.equipo_id = %s AND {condicion}', [1] + params),
+        }
+        todos_ok = True
+        for descripcion, (where, params_where) in consultas.items():
+            _, sin_sort = _plan_sin_sort(f"""
+                SELECT a.id FROM equipos_auditoria a
+                WHERE {where}
+                ORDER BY a.fecha_cambio DESC NULLS LAST, a.id DESC
+                LIMIT 51
+            """, params_where)
+            print_check(f"{descripcion}: sale ordenada de los índices (sin Sort)", sin_sort)
+            todos_ok = todos_ok and sin_sort
+        return todos_ok
+    except Exception as e:
+        print_check(f"Error al verificar el plan: {e}", False)
+        return False
+
+def test_priorizados():
+    """Verifica las columnas materializadas y que el refresco por OST filtre dentro de la vista"""
+    print_header("10. EQUIPOS PRIORIZADOS MATERIALIZADOS")
+
+    if not os.getenv('DATABASE_URL'):
+        print_check("DATABASE_URL no configurada, se omite la verificación", True)
+        return True
+
+    try:
+        import re
+        from db import conexion
+        from priorizados import COLUMNAS
+
+        with conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'equipos_priorizados'
+            """)
+            columnas_vista = {fila['column_name'] for fila in cursor.fetchall()}
+            cursor.close()
+        faltantes = [columna for columna in COLUMNAS if columna not in columnas_vista]
+        columnas_ok = not faltantes
+        print_check(f"La vista tiene todas las columnas materializadas {faltantes or ''}", columnas_ok)
+
+        # El filtro por OST tiene que llegar al scan de equipos, no quedar arriba de la vista entera
+        plan = _explicar("SELECT v.ost FROM equipos_priorizados v WHERE v.ost = ANY(%s)", ([1, 2, 3],))
+        empujado = any(
+            nodo.get('Relation Name') == 'equipos'
+            and any(re.search(r'\bost = ANY', nodo.get(clave, '')) for clave in ('Index Cond', 'Recheck Cond', 'Filter'))
+            for nodo in _nodos_plan(plan)
+        )
+        print_check("ost = ANY(...) se aplica en el scan de equipos (dentro de la vista)", empujado)
+        return columnas_ok and empujado
+    except Exception as e:
+        print_check(f"Error al verificar equipos priorizados: {e}", False)
+        return False
+
+def test_presupuesto_consultas():
+    """Verifica que en modo test una vista que supera su presupuesto de consultas falle"""
+    print_header("11. PRESUPUESTO DE CONSULTAS Y SERVER-TIMING")
+
+    import re
+    from unittest import mock
+    from app import app
+    from instrumentacion import CursorInstrumentado, PresupuestoConsultasExcedido
+
+    def pagina_con_consultas(cantidad):
+        # Cada statement pasa por el mismo registro que usa el cursor instrumentado
+        def consultar(conn, args):
+            for _ in range(cantidad):
+                CursorInstrumentado._registrar(mock.Mock(rowcount=1), 'SELECT 1', None, 0.001)
+            return {'solicitudes': [], 'cursor_siguiente': None, 'limite': 100}
+        return consultar
+
+    vista = app.view_functions['solicitudes']
+    configuracion = {'TESTING': True, 'LOGIN_DISABLED': True}
+    with mock.patch.dict(app.config, configuracion), \
+            mock.patch.object(vista, 'presupuesto_consultas', 2), \
+            mock.patch('app.get_db_connection'), \
+            mock.patch('instrumentacion.INSTRUMENTACION_LOG', False):
+        cliente = app.test_client()
+
+        with mock.patch('app.consultar_pagina_solicitudes', pagina_con_consultas(2)):
+            respuesta = cliente.get('/solicitudes')
+        dentro_ok = respuesta.status_code == 200
+        print_check("Una vista dentro del presupuesto responde normalmente", dentro_ok)
+
+        formato = re.compile(
+            r'^db;dur=\d+\.\d{2};desc="2 consultas, 2 filas, 0 conexiones", app;dur=\d+\.\d{2}$'
+        )
+        timing_ok = bool(formato.match(respuesta.headers.get('Server-Timing', '')))
+        print_check("Server-Timing con las métricas db y app", timing_ok)
+
+        excedido_ok = False
+        with mock.patch('app.consultar_pagina_solicitudes', pagina_con_consultas(3)):
+            try:
+                cliente.get('/solicitudes')
+            except PresupuestoConsultasExcedido as e:
+                excedido_ok = '3 consultas (presupuesto: 2)' in str(e)
+        print_check("Superar el presupuesto levanta PresupuestoConsultasExcedido", excedido_ok)
+
+    ok = dentro_ok and timing_ok and excedido_ok
+    assert ok, "El presupuesto de consultas no se verifica en modo test"
+    return ok
+
+def test_presupuesto_edicion_equipo():
+    """Verifica las consultas de PUT /api/equipo/<id> en el peor caso (cambian estado y fecha de ingreso)"""
+    print_header("12. PRESUPUESTO DE LA EDICIÓN DE UN EQUIPO")
+
+    import re
+    from datetime import date
+    from unittest import mock
+    from app import app
+    from instrumentacion import CursorInstrumentado
+
+    equipo = {'id': 1, 'ost': 1234, 'estado': 'Ingresado', 'fecha_ingreso': date(2024, 1, 15)}
+    sentencias = []
+
+    class CursorFalso:
+        description = True
+
+        def execute(self, query, vars=None):
+            query = query.decode() if isinstance(query, bytes) else query
+            sentencias.append(query)
+            CursorInstrumentado._registrar(mock.Mock(rowcount=1), query, vars, 0.001)
+
+        def mogrify(self, query, vars=None):
+            return (query % tuple(repr(v) for v in vars)).encode()
+
+        def fetchone(self):
+            return equipo
+
+        def fetchall(self):
+            return [{'fecha_ingreso': date(2024, 2, 1)}]
+
+        def close(self):
+            pass
+
+    conn = mock.Mock()
+    conn.cursor.return_value = CursorFalso()
+    usuario = mock.Mock(id=1, username='test', is_authenticated=True)
+    usuario.get_id.return_value = '1'
+    usuario.has_permission.return_value = True
+
+    vista = app.view_functions['update_equipo']
+    presupuesto = getattr(vista, 'presupuesto_consultas', None)
+    configuracion = {'TESTING': True, 'LOGIN_DISABLED': True}
+    with mock.patch.dict(app.config, configuracion), \
+            mock.patch('app.get_db_connection', return_value=conn), \
+            mock.patch('app.current_user', usuario), \
+            mock.patch('auth.current_user', usuario), \
+            mock.patch('app.invalidar_metricas_dashboard'), \
+            mock.patch('auditoria.AUDITORIA_MODO', 'sincrono'), \
+            mock.patch('instrumentacion.INSTRUMENTACION_LOG', False):
+        respuesta = app.test_client().put(
+            '/api/equipo/1', json={'estado': 'Finalizado', 'fecha_ingreso': '2024-02-01'}
+        )
+
+    respuesta_ok = respuesta.status_code == 200
+    print_check("La edición responde dentro de su presupuesto (modo estricto)", respuesta_ok)
+
+    medidas = re.search(r'desc="(\d+) consultas', respuesta.headers.get('Server-Timing', ''))
+    consultas = int(medidas.group(1)) if medidas else None
+    presupuesto_ok = presupuesto == 7 and consultas == presupuesto
+    print_check(f"Consultas en el peor caso: {consultas} (presupuesto: {presupuesto})", presupuesto_ok)
+
+    sin_lookup_ok = not any(re.search(r'SELECT ost FROM equipos', q) for q in sentencias)
+    print_check("La OST sale de la fila leída con FOR UPDATE (sin otra consulta)", sin_lookup_ok)
+
+    locks = [q for q in sentencias if 'pg_advisory_xact_lock' in q]
+    locks_ok = len(locks) == 2 and all('unnest' in q for q in locks)
+    print_check("Un solo statement de advisory locks por refresco (resumen y priorizados)", locks_ok)
+
+    ok = respuesta_ok and presupuesto_ok and sin_lookup_ok and locks_ok
+    assert ok, "update_equipo no respeta su presupuesto de consultas"
+    return ok
+
+def test_consultas_lentas():
+    """Verifica huellas, redacción de parámetros y el archivo por proceso del log de consultas lentas"""
+    print_header("13. LOG DE CONSULTAS LENTAS")
+
+    import logging
+    import tempfile
+    from unittest import mock
+    import consultas_lentas
+    from consultas_lentas import huella, redactar_parametros, registrar_si_lenta, resumir_consultas_lentas
+
+    listas_ok = (huella("SELECT * FROM equipos WHERE id IN (1, 2, 3)")
+                 == huella("SELECT * FROM equipos WHERE id IN (%s, %s)")
+                 == huella("select *  from equipos\n where id in (%s)"))
+    print_check("IN (...) con cualquier cantidad de valores da la misma huella", listas_ok)
+
+    values_ok = (huella("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)")
+                 == huella("INSERT INTO t (a, b) VALUES (%s, %s)"))
+    print_check("VALUES multi-fila colapsa a una sola fila", values_ok)
+
+    texto, id_huella = huella("SELECT * FROM u WHERE nombre = %(nombre)s AND id = 5 -- comentario")
+    marcadores_ok = (texto == "select * from u where nombre = ? and id = ?"
+                     and (texto, id_huella) == huella(b"SELECT * FROM u WHERE nombre = 'o''hara' AND id = %s")
+                     and len(id_huella) == 12)
+    print_check("Parámetros nombrados, posicionales y literales se normalizan", marcadores_ok)
+
+    por_clave = redactar_parametros({'password_hash': 'x', 'email': 'a@b.c', 'token': 't', 'nombre': 'Ana', 'n': 3})
+    claves_ok = por_clave == {
+        'password_hash': '[redactado]', 'email': '[redactado]', 'token': '[redactado]', 'nombre': 'Ana', 'n': 3
+    }
+    print_check("Claves sensibles de un dict se redactan", claves_ok)
+
+    posicionales = redactar_parametros([
+        'pbkdf2:sha256:600000$sal$hash', 'scrypt:32768:8:1$sal$hash', '$2b$12$abcdefghijk',
+        'ana@hospital.org', 'Ana', 5, None, 'x' * 60, [('fila', 'otro@correo.com')]
+    ])
+    valores_ok = (posicionales[:4] == ['[redactado]'] * 4
+                  and posicionales[4:7] == ['Ana', 5, None]
+                  and posicionales[7] == 'x' * 40 + '...'
+                  and posicionales[8] == [['fila', '[redactado]']])
+    print_check("Hashes de contraseña y emails posicionales se redactan", valores_ok)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        base = os.path.join(directorio, 'lentas.jsonl')
+        with mock.patch.object(consultas_lentas, 'SLOW_QUERY_ARCHIVO', base), \
+                mock.patch.object(consultas_lentas, 'SLOW_QUERY_MS', 0), \
+                mock.patch.object(consultas_lentas, '_logger', None):
+            registrar_si_lenta("SELECT * FROM usuarios WHERE email = %s", ['ana@hospital.org'], 0.5, 1)
+            propio = os.path.join(directorio, f'lentas.{os.getpid()}.jsonl')
+            with open(propio, encoding='utf-8') as f:
+                contenido = f.read()
+            resumen = resumir_consultas_lentas()
+            logging.getLogger('consultas_lentas').handlers[0].close()
+        archivo_ok = 'ana@hospital.org' not in contenido and len(resumen) == 1 and resumen[0]['cantidad'] == 1
+        print_check("Cada proceso escribe su archivo y el resumen los lee", archivo_ok)
+
+    ok = listas_ok and values_ok and marcadores_ok and claves_ok and valores_ok and archivo_ok
+    assert ok, "El log de consultas lentas no normaliza o no redacta como se espera"
+    return ok
+
+def test_metricas():
+    """Verifica que /metrics solo responda con el token configurado"""
+    print_header("14. ENDPOINT /metrics")
+
+    from unittest import mock
+    import metricas
+    from app import app
+
+    cliente = app.test_client()
+    with mock.patch('instrumentacion.INSTRUMENTACION_LOG', False):
+        with mock.patch.object(metricas, 'METRICS_TOKEN', ''):
+            sin_token = cliente.get('/metrics', headers={'Authorization': 'Bearer '})
+        with mock.patch.object(metricas, 'METRICS_TOKEN', 'secreto'):
+            incorrecto = cliente.get('/metrics', headers={'Authorization': 'Bearer otro'})
+            correcto = cliente.get('/metrics', headers={'Authorization': 'Bearer secreto'})
+
+    cerrado_ok = sin_token.status_code == 401
+    print_check("Sin METRICS_TOKEN configurado /metrics responde 401", cerrado_ok)
+    incorrecto_ok = incorrecto.status_code == 401
+    print_check("Con un token incorrecto responde 401", incorrecto_ok)
+    correcto_ok = correcto.status_code == 200 and b'http_request_duration_seconds' in correcto.data
+    print_check("Con el token correcto devuelve las métricas", correcto_ok)
+
+    ok = cerrado_ok and incorrecto_ok and correcto_ok
+    assert ok, "/metrics no controla el acceso como se espera"
+    return ok
+
 def generar_reporte(resultados):
     """Genera un reporte final de la verificación"""
     print_header("RESUMEN DE VERIFICACIÓN")
@@ -216,7 +634,16 @@ def main():
         'auth.py': test_auth_py(),
         'app.py': test_app_py(),
         'Templates': test_templates(),
-        'SQL': test_sql()
+        'SQL': test_sql(),
+        'Plan de informes': test_plan_informes(),
+        'Paginación': test_paginacion(),
+        'Plan de la grilla': test_plan_grilla(),
+        'Plan del historial': test_plan_historial(),
+        'Priorizados': test_priorizados(),
+        'Presupuesto de consultas': test_presupuesto_consultas(),
+        'Presupuesto de la edición': test_presupuesto_edicion_equipo(),
+        'Consultas lentas': test_consultas_lentas(),
+        'Métricas': test_metricas()
     }
     
     generar_reporte(resultados)